@@ -0,0 +1,256 @@
+"""
+Process many workbooks with the reading, the calculations and the writing of different workbooks at the same time.
+
+run_batch processes a workbook from the start to the end in one worker, so the CPU waits while a workbook is read
+(disk and unzipping) and the disk waits during the calculations. Here every step has its own workers and the
+workbooks go from step to step through bounded queues:
+
+    paths -> readers (threads) -> queue -> calculators (processes) -> queue -> writer (one thread) -> checkpoint
+
+A full queue blocks the step before it, so at most about queue_size workbooks wait between two steps and the memory
+stays bounded when the readers are faster than the calculations.
+
+Example:
+    python async_pipeline.py "data/*.xlsx" --output-directory results --readers 2 --workers 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List
+
+from batch_run import BatchCheckpoint, find_workbooks, get_file_signature
+from calculation_cache import CalculationCache
+from progress_events import emit_progress
+from workbook_pipeline import LoadedWorkbook, WorkbookLayout, calculate_workbook, read_workbook, write_workbook
+
+
+def calculate_workbook_in_worker(loaded_workbook: LoadedWorkbook, layout: WorkbookLayout,
+                                 cache_directory: str = None) -> LoadedWorkbook:
+    cache = CalculationCache(cache_directory) if cache_directory is not None else None
+    return calculate_workbook(loaded_workbook=loaded_workbook, layout=layout, cache=cache)
+
+
+class AsyncWorkbookPipeline:
+    """
+    The readers, the calculators and the writer of run_async_batch, see the module docstring.
+
+    The results are saved in a BatchCheckpoint, so an interrupted batch continues with the workbooks which are not
+    done yet, like run_batch.
+    """
+
+    def __init__(self,
+                 output_directory: str,
+                 checkpoint_path: str = None,
+                 number_of_readers: int = 2,
+                 number_of_workers: int = None,
+                 queue_size: int = 2,
+                 max_tasks_per_child: int = 20,
+                 layout: WorkbookLayout = None,
+                 cache_directory: str = None,
+                 show_process: bool = False):
+        """
+        :param output_directory: the directory of the calculated workbooks.
+        :param checkpoint_path: the JSON file with the results, by default checkpoint.json in the output directory.
+        :param number_of_readers: the number of threads which read and validate workbooks.
+        :param number_of_workers: the number of processes which calculate workbooks, by default the number of CPUs.
+        With 0 the calculations run in a thread of this process.
+        :param queue_size: the maximum number of workbooks waiting between two steps.
+        :param max_tasks_per_child: a calculation process is replaced after this number of workbooks.
+        :param layout: the layout of the workbooks, the layout of the template when None.
+        :param cache_directory: the directory of the CalculationCache, without cache when None.
+        :param show_process: print every finished workbook. The sinks of progress_events get a write event for every
+        finished workbook also without show_process.
+        """
+        if number_of_readers < 1 or queue_size < 1:
+            raise ValueError("At least one reader and a queue size of at least one are needed.")
+        self.output_directory = output_directory
+        self.checkpoint = BatchCheckpoint(checkpoint_path if checkpoint_path is not None
+                                          else os.path.join(output_directory, "checkpoint.json"))
+        self.number_of_readers = number_of_readers
+        self.number_of_workers = number_of_workers if number_of_workers is not None else (os.cpu_count() or 1)
+        self.queue_size = queue_size
+        self.max_tasks_per_child = max_tasks_per_child
+        self.layout = layout if layout is not None else WorkbookLayout()
+        self.cache_directory = cache_directory
+        self.show_process = show_process
+
+        # the busy seconds of every step, to see which step limits the batch
+        self.dict_busy_seconds = {"read": 0.0, "calculate": 0.0, "write": 0.0}
+        self.calculate_executor: Executor = None
+
+    def _create_calculate_executor(self) -> Executor:
+        if self.number_of_workers == 0:
+            return ThreadPoolExecutor(max_workers=1, thread_name_prefix="calculate")
+        # spawn gives workers without the state of the parent and max_tasks_per_child is not allowed with fork
+        return ProcessPoolExecutor(max_workers=self.number_of_workers,
+                                   mp_context=multiprocessing.get_context("spawn"),
+                                   max_tasks_per_child=self.max_tasks_per_child)
+
+    def _add_result(self, path: str, result: dict, start: float) -> None:
+        result["signature"] = get_file_signature(path) if os.path.exists(path) else None
+        result["seconds"] = time.perf_counter() - start
+        self.checkpoint.add_result(path, result)
+        emit_progress(kind="write", step="async_pipeline", duration=result["seconds"],
+                      message=f"{result['status']}: {path} ({result['seconds']:.1f}s)", show_process=self.show_process,
+                      file_path=path, status=result["status"])
+
+    def _add_failed_result(self, path: str, error: str, start: float) -> None:
+        self._add_result(path, {"path": path, "status": "failed", "error": error}, start)
+
+    async def _read(self, path_queue: asyncio.Queue, calculate_queue: asyncio.Queue,
+                    read_executor: Executor) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            path = await path_queue.get()
+            if path is None:
+                return
+            start = time.perf_counter()
+            try:
+                loaded_workbook = await loop.run_in_executor(read_executor, read_workbook, path,
+                                                             self.output_directory, self.layout)
+            except Exception as error:
+                self._add_failed_result(path, repr(error), start)
+                continue
+            self.dict_busy_seconds["read"] += time.perf_counter() - start
+            # waits while the calculators are behind
+            await calculate_queue.put((loaded_workbook, start))
+
+    async def _calculate(self, calculate_queue: asyncio.Queue, write_queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await calculate_queue.get()
+            if item is None:
+                return
+            loaded_workbook, start = item
+            start_calculation = time.perf_counter()
+            executor = self.calculate_executor
+            try:
+                loaded_workbook = await loop.run_in_executor(executor, calculate_workbook_in_worker, loaded_workbook,
+                                                             self.layout, self.cache_directory)
+            except BrokenProcessPool:
+                # a worker died (for example out of memory): this workbook is failed, the others go on with a new pool
+                if self.calculate_executor is executor:
+                    executor.shutdown(wait=False)
+                    self.calculate_executor = self._create_calculate_executor()
+                self._add_failed_result(loaded_workbook.path, "the worker process died", start)
+                continue
+            except Exception as error:
+                self._add_failed_result(loaded_workbook.path, repr(error), start)
+                continue
+            self.dict_busy_seconds["calculate"] += time.perf_counter() - start_calculation
+            await write_queue.put((loaded_workbook, start))
+
+    async def _write(self, write_queue: asyncio.Queue, write_executor: Executor) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await write_queue.get()
+            if item is None:
+                return
+            loaded_workbook, start = item
+            start_write = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(write_executor, write_workbook, loaded_workbook, self.layout)
+            except Exception as error:
+                self._add_failed_result(loaded_workbook.path, repr(error), start)
+                continue
+            self.dict_busy_seconds["write"] += time.perf_counter() - start_write
+            self._add_result(loaded_workbook.path, result, start)
+
+    async def run(self, paths: List[str], retry_failed: bool = False) -> Dict[str, dict]:
+        """
+        Process the workbooks which are not done yet.
+
+        :param paths: the paths of the workbooks.
+        :param retry_failed: process the workbooks again which failed in a previous run.
+        :return: {path: result} of all the workbooks, also of the workbooks which were done before.
+        """
+        os.makedirs(self.output_directory, exist_ok=True)
+        paths_to_do = [path for path in paths if not self.checkpoint.is_done(path, retry_failed=retry_failed)]
+        emit_progress(kind="write", step="async_pipeline",
+                      message=f"{len(paths) - len(paths_to_do)} of {len(paths)} workbooks are done before",
+                      show_process=self.show_process, workbooks=len(paths),
+                      workbooks_done_before=len(paths) - len(paths_to_do))
+
+        path_queue = asyncio.Queue()
+        for path in paths_to_do:
+            path_queue.put_nowait(path)
+        for _ in range(self.number_of_readers):
+            path_queue.put_nowait(None)
+        calculate_queue = asyncio.Queue(maxsize=self.queue_size)
+        write_queue = asyncio.Queue(maxsize=self.queue_size)
+        number_of_calculators = max(self.number_of_workers, 1)
+
+        self.calculate_executor = self._create_calculate_executor()
+        try:
+            with ThreadPoolExecutor(max_workers=self.number_of_readers, thread_name_prefix="read") as read_executor, \
+                    ThreadPoolExecutor(max_workers=1, thread_name_prefix="write") as write_executor:
+                readers = [asyncio.create_task(self._read(path_queue, calculate_queue, read_executor))
+                           for _ in range(self.number_of_readers)]
+                calculators = [asyncio.create_task(self._calculate(calculate_queue, write_queue))
+                               for _ in range(number_of_calculators)]
+                writer = asyncio.create_task(self._write(write_queue, write_executor))
+
+                await asyncio.gather(*readers)
+                for _ in calculators:
+                    await calculate_queue.put(None)
+                await asyncio.gather(*calculators)
+                await write_queue.put(None)
+                await writer
+        finally:
+            self.calculate_executor.shutdown()
+            self.calculate_executor = None
+
+        return {path: self.checkpoint.dict_results[path] for path in paths if path in self.checkpoint.dict_results}
+
+
+def run_async_batch(paths: List[str], output_directory: str, retry_failed: bool = False, **kwargs) -> Dict[str, dict]:
+    """
+    Process the workbooks with AsyncWorkbookPipeline.
+
+    :param kwargs: the arguments of AsyncWorkbookPipeline.
+    :return: {path: result} of all the workbooks, also of the workbooks which were done before.
+    """
+    pipeline = AsyncWorkbookPipeline(output_directory=output_directory, **kwargs)
+    return asyncio.run(pipeline.run(paths=paths, retry_failed=retry_failed))
+
+
+def main(arguments: List[str] = None) -> Dict[str, dict]:
+    parser = argparse.ArgumentParser(description="Load, validate, calculate and export many workbooks, with the "
+                                                 "reading, calculating and writing at the same time.")
+    parser.add_argument("inputs", nargs="+", help="directories or glob patterns of the workbooks")
+    parser.add_argument("--output-directory", required=True, help="the directory of the calculated workbooks")
+    parser.add_argument("--checkpoint", default=None,
+                        help="the checkpoint file, by default checkpoint.json in the output directory")
+    parser.add_argument("--readers", type=int, default=2, help="the number of threads which read workbooks")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="the number of calculation processes, 0 to calculate in this process")
+    parser.add_argument("--queue-size", type=int, default=2,
+                        help="the maximum number of workbooks waiting between two steps")
+    parser.add_argument("--retry-failed", action="store_true", help="process the failed workbooks again")
+    parser.add_argument("--cache-directory", default=None, help="the directory of the cache of the calculated sheets")
+    parsed_arguments = parser.parse_args(arguments)
+
+    dict_results = run_async_batch(paths=find_workbooks(parsed_arguments.inputs),
+                                   output_directory=parsed_arguments.output_directory,
+                                   retry_failed=parsed_arguments.retry_failed,
+                                   checkpoint_path=parsed_arguments.checkpoint,
+                                   number_of_readers=parsed_arguments.readers,
+                                   number_of_workers=parsed_arguments.workers,
+                                   queue_size=parsed_arguments.queue_size,
+                                   cache_directory=parsed_arguments.cache_directory, show_process=True)
+
+    dict_status = {}
+    for result in dict_results.values():
+        dict_status[result["status"]] = dict_status.get(result["status"], 0) + 1
+    emit_progress(kind="write", step="async_pipeline",
+                  message=", ".join(f"{number} {status}" for status, number in sorted(dict_status.items())),
+                  show_process=True, **dict_status)
+    return dict_results
+
+
+if __name__ == '__main__':
+    main()
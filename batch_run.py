@@ -0,0 +1,233 @@
+"""
+Run load -> validate -> calculate -> export for many workbooks in a pool of worker processes.
+
+Every finished workbook is written in the checkpoint file, so an interrupted or crashed batch continues with the
+workbooks which are not done yet when it is started again with the same checkpoint.
+
+Example:
+    python batch_run.py "data/*.xlsx" --output-directory results --workers 4
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict
+
+from calculation_cache import CalculationCache
+from progress_events import emit_progress
+from workbook_pipeline import WorkbookLayout, process_workbook
+
+
+def find_workbooks(inputs: List[str]) -> List[str]:
+    """
+    :param inputs: directories (all the .xlsx files in it) or glob patterns.
+    :return: the sorted absolute paths of the workbooks, without the lock files of Excel (~$...).
+    """
+    paths = set()
+    for path_input in inputs:
+        if os.path.isdir(path_input):
+            candidates = glob.glob(os.path.join(path_input, "*.xlsx"))
+        else:
+            candidates = glob.glob(path_input)
+        for candidate in candidates:
+            if os.path.isfile(candidate) and not os.path.basename(candidate).startswith("~$"):
+                paths.add(os.path.abspath(candidate))
+    return sorted(paths)
+
+
+def get_file_signature(path: str) -> list:
+    """The modification time and the size of the file, a changed workbook is processed again."""
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class BatchCheckpoint:
+    """
+    The results of the finished workbooks of a batch, saved in a JSON file after every workbook.
+
+    The file is written to a temporary file first and then replaced, so a crash during the save does not break the
+    checkpoint.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dict_results: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.dict_results = json.load(file)
+
+    def is_done(self, path_workbook: str, retry_failed: bool = False) -> bool:
+        """True when the workbook is finished before and not changed since."""
+        result = self.dict_results.get(path_workbook)
+        if result is None or result.get("signature") != get_file_signature(path_workbook):
+            return False
+        if retry_failed and result["status"] == "failed":
+            return False
+        return True
+
+    def add_result(self, path_workbook: str, result: dict) -> None:
+        self.dict_results[path_workbook] = result
+        self.save()
+
+    def save(self) -> None:
+        path_temporary = self.path + ".tmp"
+        with open(path_temporary, "w") as file:
+            json.dump(self.dict_results, file, indent=2)
+        os.replace(path_temporary, self.path)
+
+
+def process_workbook_in_worker(path: str, output_directory: str, layout: WorkbookLayout,
+                               dict_previous_sheet_hashes: Dict[str, str] = None, cache_directory: str = None) -> dict:
+    """
+    Process one workbook in a worker, an error of the workbook is returned as result with status failed.
+
+    :param dict_previous_sheet_hashes: the sheet hashes of the previous run, to calculate only the changed sheets.
+    :param cache_directory: the directory of the CalculationCache, which the workers share. Without cache when None.
+    """
+    signature = get_file_signature(path)
+    start = time.perf_counter()
+    try:
+        cache = CalculationCache(cache_directory) if cache_directory is not None else None
+        result = process_workbook(path=path, output_directory=output_directory, layout=layout,
+                                  dict_previous_sheet_hashes=dict_previous_sheet_hashes, cache=cache)
+    except Exception as error:
+        result = {"path": path, "status": "failed", "error": repr(error)}
+    result["signature"] = signature
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def emit_workbook_result(path: str, result: dict, show_process: bool = False) -> None:
+    """The write event of a finished workbook, with the seconds of the worker as duration."""
+    seconds = result.get("seconds")
+    message = f"{result['status']}: {path}" + (f" ({seconds:.1f}s)" if seconds is not None else
+                                                 f" ({result.get('error')})")
+    emit_progress(kind="write", step="run_batch", duration=seconds, message=message, show_process=show_process,
+                  file_path=path, status=result["status"])
+
+
+def run_batch(paths: List[str],
+              output_directory: str,
+              checkpoint_path: str = None,
+              number_of_workers: int = None,
+              max_in_flight: int = None,
+              max_tasks_per_child: int = 20,
+              retry_failed: bool = False,
+              layout: WorkbookLayout = None,
+              cache_directory: str = None,
+              show_process: bool = False) -> Dict[str, dict]:
+    """
+    Process the workbooks in a pool of worker processes.
+
+    :param paths: the paths of the workbooks.
+    :param output_directory: the directory of the calculated workbooks.
+    :param checkpoint_path: the JSON file with the results of the finished workbooks, by default checkpoint.json in
+    the output directory. The workbooks in it which are not changed since are skipped.
+    :param number_of_workers: the number of worker processes, by default the number of CPUs. With 0 the workbooks are
+    processed one by one in this process.
+    :param max_in_flight: the maximum number of workbooks which are processed or waiting in the pool at the same time,
+    this bounds the memory. By default the number of workers.
+    :param max_tasks_per_child: a worker is replaced by a new process after this number of workbooks, so the memory
+    of the workers does not keep growing during a long batch.
+    :param retry_failed: process the workbooks again which failed in a previous run.
+    :param layout: the layout of the workbooks, the layout of the template when None.
+    :param cache_directory: the directory of the CalculationCache, the sheets which are calculated before (for example
+    the unchanged sheets of a workbook which is submitted again) are taken from it. Without cache when None.
+    :param show_process: print every finished workbook. The sinks of progress_events get a write event for every
+    finished workbook also without show_process.
+    :return: {path: result} of all the workbooks, also of the workbooks which were done before.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    if checkpoint_path is None:
+        checkpoint_path = os.path.join(output_directory, "checkpoint.json")
+    if number_of_workers is None:
+        number_of_workers = os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = number_of_workers
+    if layout is None:
+        layout = WorkbookLayout()
+
+    checkpoint = BatchCheckpoint(checkpoint_path)
+    paths_to_do = [path for path in paths if not checkpoint.is_done(path, retry_failed=retry_failed)]
+    emit_progress(kind="write", step="run_batch",
+                  message=f"{len(paths) - len(paths_to_do)} of {len(paths)} workbooks are done before",
+                  show_process=show_process, workbooks=len(paths), workbooks_done_before=len(paths) - len(paths_to_do))
+
+    if number_of_workers == 0:
+        # without a pool, in this process, for example to debug a workbook
+        for path in paths_to_do:
+            result = process_workbook_in_worker(path=path, output_directory=output_directory, layout=layout,
+                                                cache_directory=cache_directory)
+            checkpoint.add_result(path, result)
+            emit_workbook_result(path, result, show_process=show_process)
+        return {path: checkpoint.dict_results[path] for path in paths if path in checkpoint.dict_results}
+
+    # spawn gives workers without the state of the parent and max_tasks_per_child is not allowed with fork
+    context = multiprocessing.get_context("spawn")
+    paths_waiting = list(reversed(paths_to_do))
+    while paths_waiting:
+        dict_futures = {}
+        try:
+            with ProcessPoolExecutor(max_workers=number_of_workers, mp_context=context,
+                                     max_tasks_per_child=max_tasks_per_child) as executor:
+                while paths_waiting or dict_futures:
+                    while paths_waiting and len(dict_futures) < max_in_flight:
+                        path = paths_waiting.pop()
+                        dict_futures[executor.submit(process_workbook_in_worker, path, output_directory, layout,
+                                                     None, cache_directory)] = path
+                    done, _ = wait(dict_futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        path = dict_futures.pop(future)
+                        checkpoint.add_result(path, result)
+                        emit_workbook_result(path, result, show_process=show_process)
+        except BrokenProcessPool:
+            # a worker died (for example out of memory): the workbooks in flight are failed, the others go on with a
+            # new pool
+            for path in dict_futures.values():
+                result = {"path": path, "status": "failed", "error": "the worker process died",
+                          "signature": get_file_signature(path)}
+                checkpoint.add_result(path, result)
+                emit_workbook_result(path, result, show_process=show_process)
+
+    return {path: checkpoint.dict_results[path] for path in paths if path in checkpoint.dict_results}
+
+
+def main(arguments: List[str] = None) -> Dict[str, dict]:
+    parser = argparse.ArgumentParser(description="Load, validate, calculate and export many workbooks.")
+    parser.add_argument("inputs", nargs="+", help="directories or glob patterns of the workbooks")
+    parser.add_argument("--output-directory", required=True, help="the directory of the calculated workbooks")
+    parser.add_argument("--checkpoint", default=None,
+                        help="the checkpoint file, by default checkpoint.json in the output directory")
+    parser.add_argument("--workers", type=int, default=None, help="the number of worker processes, 0 to run without a pool")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="the maximum number of workbooks in the pool at the same time")
+    parser.add_argument("--max-tasks-per-child", type=int, default=20,
+                        help="the number of workbooks after which a worker is replaced")
+    parser.add_argument("--retry-failed", action="store_true", help="process the failed workbooks again")
+    parser.add_argument("--cache-directory", default=None, help="the directory of the cache of the calculated sheets")
+    parsed_arguments = parser.parse_args(arguments)
+
+    paths = find_workbooks(parsed_arguments.inputs)
+    dict_results = run_batch(paths=paths, output_directory=parsed_arguments.output_directory,
+                             checkpoint_path=parsed_arguments.checkpoint, number_of_workers=parsed_arguments.workers,
+                             max_in_flight=parsed_arguments.max_in_flight,
+                             max_tasks_per_child=parsed_arguments.max_tasks_per_child,
+                             retry_failed=parsed_arguments.retry_failed,
+                             cache_directory=parsed_arguments.cache_directory, show_process=True)
+
+    dict_status = {}
+    for result in dict_results.values():
+        dict_status[result["status"]] = dict_status.get(result["status"], 0) + 1
+    emit_progress(kind="write", step="run_batch",
+                  message=", ".join(f"{number} {status}" for status, number in sorted(dict_status.items())),
+                  show_process=True, **dict_status)
+    return dict_results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import os
+from datetime import datetime, timedelta
+from typing import List
+
+import numpy as np
+from openpyxl import load_workbook
+
+PATH_TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "excel_sheets",
+                             "Gas_production_template.xlsx")
+
+# the layout of the template
+HEADER_ROW = 11
+START_ROW_VALUES_TABLE_IN_EXCEL = 13
+BASIC_COLUMN_NAMES = ['Sample ID', 'Parallel', 'Date', 'Time', 'P atm [hPa]', 'P sample before gc [hPa]',
+                      'P sample after gc [hPa]', 'CH4 [%]', 'CO2 [%]', 'O2 [%]', 'N2 [%]', 'Flush (1=yes; 0=no)',
+                      'Comments', 'GC method', 'Weight [g]']
+NUMERIC_COLUMN_NAMES = ['P atm [hPa]', 'P sample before gc [hPa]', 'P sample after gc [hPa]', 'CH4 [%]', 'CO2 [%]',
+                        'O2 [%]', 'N2 [%]']
+
+
+def get_sample_sheet_names(number_of_sheets: int) -> List[str]:
+    """
+    The names of the sample sheets like in the template: GT1.1, GT1.2, GT2.1, ...
+
+    :param number_of_sheets: the number of sample sheets.
+    """
+    return [f"GT{sheet_number // 2 + 1}.{sheet_number % 2 + 1}" for sheet_number in range(number_of_sheets)]
+
+
+def generate_sheet_rows(sample_sheet_name: str, number_of_rows: int, flush_frequency: int,
+                        rng: np.random.Generator) -> List[list]:
+    """
+    Generate the measurements of one sample sheet. The CO2 rises and the O2 drops between the flushes, and after a
+    flush the gas composition is close to air again.
+
+    :param sample_sheet_name: the name of the sheet, for example GT1.1.
+    :param number_of_rows: the number of measurements.
+    :param flush_frequency: every flush_frequency rows there is a flush.
+    :param rng: the random generator.
+    :return: a list with the values of columns A until O for every row.
+    """
+    sample_id, parallel = sample_sheet_name.split(".")
+    start = datetime(2023, 4, 17, 14, 42)
+
+    rows = []
+    co2, o2 = 0.03, 21.90
+    for row in range(number_of_rows):
+        moment = start + timedelta(hours=12 * row + float(rng.uniform(0, 2)))
+        pressure_atmosphere = round(float(rng.normal(1013, 8)), 1)
+
+        if row == 0:
+            flush, comment, gc_method, weight = None, "start expiriment", None, round(float(rng.normal(793.5, 0.1)), 2)
+            pressure_before, pressure_after = pressure_atmosphere, None
+        elif row % flush_frequency == 0:
+            flush, comment, gc_method, weight = 1, None, "LM", round(float(rng.normal(793.5, 0.1)), 2)
+            co2, o2 = float(rng.uniform(0.4, 0.8)), float(rng.uniform(19.5, 20.5))
+            pressure_before = round(float(rng.normal(1110, 8)), 1)
+            pressure_after = round(pressure_before - float(rng.uniform(4, 19)), 1)
+        else:
+            flush, comment, gc_method, weight = 0, None, "LM", None
+            co2 = co2 + float(rng.uniform(0.3, 1.2))
+            o2 = max(o2 - float(rng.uniform(0.5, 2.0)), 0.5)
+            pressure_before = round(float(rng.normal(1000, 30)), 1)
+            pressure_after = round(pressure_before - float(rng.uniform(1, 4)), 1)
+
+        ch4 = 0 if row == 0 else round(float(rng.uniform(0, 0.2)), 2)
+        n2 = round(100 - co2 - o2 - ch4 + float(rng.normal(0, 0.5)), 2)
+        rows.append([sample_id, int(parallel), datetime(moment.year, moment.month, moment.day), moment.time(),
+                     pressure_atmosphere, pressure_before, pressure_after, ch4, round(co2, 2), round(o2, 2), n2,
+                     flush, comment, gc_method, weight])
+
+    return rows
+
+
+def inject_outliers(rows: List[list], outlier_fraction: float, rng: np.random.Generator) -> int:
+    """Multiply random numeric cells (not of the first row) by 10. Returns the number of outliers."""
+    numeric_column_indexes = [BASIC_COLUMN_NAMES.index(column_name) for column_name in NUMERIC_COLUMN_NAMES]
+    number_of_outliers = int(round(outlier_fraction * (len(rows) - 1) * len(numeric_column_indexes)))
+    for _ in range(number_of_outliers):
+        row = rows[int(rng.integers(1, len(rows)))]
+        column_index = numeric_column_indexes[int(rng.integers(0, len(numeric_column_indexes)))]
+        if isinstance(row[column_index], (int, float)):
+            row[column_index] = row[column_index] * 10
+    return number_of_outliers
+
+
+def inject_invalid_cells(rows: List[list], invalid_cell_fraction: float, rng: np.random.Generator) -> int:
+    """Replace random numeric cells by text or empty cells. Returns the number of invalid cells."""
+    numeric_column_indexes = [BASIC_COLUMN_NAMES.index(column_name) for column_name in NUMERIC_COLUMN_NAMES]
+    number_of_invalid_cells = int(round(invalid_cell_fraction * len(rows) * len(numeric_column_indexes)))
+    for invalid_cell in range(number_of_invalid_cells):
+        row = rows[int(rng.integers(0, len(rows)))]
+        column_index = numeric_column_indexes[int(rng.integers(0, len(numeric_column_indexes)))]
+        row[column_index] = "not measured" if invalid_cell % 2 == 0 else None
+    return number_of_invalid_cells
+
+
+def generate_workbook(path: str,
+                      number_of_sheets: int = 16,
+                      number_of_rows: int = 25,
+                      flush_frequency: int = 2,
+                      invalid_cell_fraction: float = 0.0,
+                      outlier_fraction: float = 0.0,
+                      seed: int = 0,
+                      path_template: str = PATH_TEMPLATE) -> dict:
+    """
+    Generate a workbook in the layout of Gas_production_template.xlsx with synthetic measurements.
+
+    The constants and the units of the template are kept, the header row gets the column names with the units (like
+    'CO2 [%]') and the measurements of the template are replaced by the synthetic measurements from row 13.
+
+    :param path: the path of the new Excel file.
+    :param number_of_sheets: the number of sample sheets (GT1.1, GT1.2, ...). The Notes sheet is kept.
+    :param number_of_rows: the number of measurements in every sample sheet.
+    :param flush_frequency: every flush_frequency rows there is a flush.
+    :param invalid_cell_fraction: the fraction of the numeric cells that is not filled correctly (text or empty).
+    :param outlier_fraction: the fraction of the numeric cells that is an outlier.
+    :param seed: the seed of the random generator, the same seed gives the same workbook.
+    :param path_template: the path of the template.
+    :return: {"path", "sheet_names", "number_of_rows", "number_of_invalid_cells", "number_of_outliers"}
+    """
+    if flush_frequency < 1:
+        raise ValueError("flush_frequency must be at least 1.")
+
+    rng = np.random.default_rng(seed)
+    workbook = load_workbook(path_template)
+    template_sheet = workbook[workbook.sheetnames[1]]
+    sample_sheet_names = get_sample_sheet_names(number_of_sheets)
+
+    # remove the measurements and the calculations of the template sheet, the sample sheets are copies of it
+    template_sheet.delete_rows(START_ROW_VALUES_TABLE_IN_EXCEL, template_sheet.max_row)
+    # the header gets the column names of the data frames, so the validation can color the cells by column name
+    for column_number, column_name in enumerate(BASIC_COLUMN_NAMES, start=1):
+        template_sheet.cell(row=HEADER_ROW, column=column_number, value=column_name)
+    for sheet_name in workbook.sheetnames[2:]:
+        del workbook[sheet_name]
+
+    number_of_invalid_cells = 0
+    number_of_outliers = 0
+    for sheet_number, sample_sheet_name in enumerate(sample_sheet_names):
+        if sheet_number == 0:
+            sheet = template_sheet
+            sheet.title = sample_sheet_name
+        else:
+            sheet = workbook.copy_worksheet(template_sheet)
+            sheet.title = sample_sheet_name
+
+        rows = generate_sheet_rows(sample_sheet_name=sample_sheet_name, number_of_rows=number_of_rows,
+                                   flush_frequency=flush_frequency, rng=rng)
+        number_of_outliers += inject_outliers(rows=rows, outlier_fraction=outlier_fraction, rng=rng)
+        number_of_invalid_cells += inject_invalid_cells(rows=rows, invalid_cell_fraction=invalid_cell_fraction,
+                                                        rng=rng)
+
+        for row_number, row in enumerate(rows, start=START_ROW_VALUES_TABLE_IN_EXCEL):
+            for column_number, value in enumerate(row, start=1):
+                sheet.cell(row=row_number, column=column_number, value=value)
+
+    workbook.save(path)
+
+    return {"path": path, "sheet_names": sample_sheet_names, "number_of_rows": number_of_rows,
+            "number_of_invalid_cells": number_of_invalid_cells, "number_of_outliers": number_of_outliers}
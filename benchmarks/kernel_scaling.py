@@ -0,0 +1,330 @@
+"""
+Micro-benchmarks of the calculation kernels, to find kernels that scale worse than linear with the number of rows or
+that became slower than a stored baseline.
+
+Every static method of the classes in data_frame_calculations and data_frame_calculations_standard_for_gas_respiration
+_tests is a kernel. Every kernel is timed at 1k, 10k, 100k and 1M rows and the complexity exponent b of
+time = a * rows ** b is fitted. Sizes of which the predicted time is above the time cap are skipped.
+
+Example:
+    python -m benchmarks.kernel_scaling --update-baseline
+    python -m benchmarks.kernel_scaling --baseline benchmarks/kernel_scaling_baseline.json
+"""
+import argparse
+import inspect
+import json
+import os
+import time
+import warnings
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+import data_frame_calculations
+import data_frame_calculations_standard_for_gas_respiration_tests
+from data_frame_calculations import PercentageO2ConsumedAndCO2ProducedAndRatio, MolesProduced, \
+    CumulativeProductionGasPhase, CarbonInAqueousPhase, ResultsInterpretations
+from data_frame_calculations_standard_for_gas_respiration_tests import GasComposition, MolGasCompositionCalculations
+
+KERNEL_MODULES = [data_frame_calculations, data_frame_calculations_standard_for_gas_respiration_tests]
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+PATH_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernel_scaling_baseline.json")
+
+# the exponent above which a kernel is worse than linear. A bit above 1 because of the noise of the timings.
+MAX_EXPONENT = 1.25
+# a kernel is regressed when it is this many times slower than the baseline at the same number of rows
+REGRESSION_THRESHOLD = 2.0
+# timings below this number of seconds are mostly overhead and are not used to fit the exponent
+MINIMUM_TIME_FOR_FIT = 1e-3
+
+
+def make_kernel_data_frame(number_of_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    A data frame with all the columns that the kernels read. After the first row every second row is a flush.
+
+    :param number_of_rows: the number of rows.
+    :param seed: the seed of the random generator.
+    """
+    rng = np.random.default_rng(seed)
+    flush = np.tile([1, 0], number_of_rows // 2 + 1)[:number_of_rows].astype(float)
+    flush[0] = 0
+
+    def random_column(low: float, high: float) -> np.ndarray:
+        return rng.uniform(low, high, number_of_rows)
+
+    return pd.DataFrame({
+        "CH4 [%]": random_column(0, 0.2), "CO2 [%]": random_column(0.5, 6), "O2 [%]": random_column(5, 21),
+        "N2 [%]": random_column(75, 95), "Flush (1=yes; 0=no)": flush,
+        "P sample before gc [hPa]": random_column(950, 1120), "P sample after gc [hPa]": random_column(945, 1110),
+        "CH4-corr [%]": random_column(0, 0.2), "CO2-corr [%]": random_column(0.5, 6),
+        "O2-corr [%]": random_column(5, 21), "N2-corr [%]": random_column(75, 95),
+        "O2 consumed [%]": random_column(0, 3), "CO2 produced [%]": random_column(0, 3),
+        "mg_bs": random_column(0.03, 0.05), "mg_as": random_column(0.03, 0.05),
+        "mCO2_b": random_column(0, 1e-3), "mCH4_b": random_column(0, 1e-5), "mO2_b": random_column(0, 1e-2),
+        "mCO2_a": random_column(0, 1e-3), "mCH4_a": random_column(0, 1e-5), "mO2_a": random_column(0, 1e-2),
+        "mCTot_b": random_column(0, 1e-3), "mCTot_a": random_column(0, 1e-3),
+        "mCTot_produced": random_column(0, 1e-4), "mCTot_produced_cum": random_column(0, 1e-2),
+        "O2 consumed": random_column(0, 1e-4), "CO2 produced": random_column(0, 1e-4),
+        "PP CO2_b ": random_column(0, 6000), "CO2_b_aq [mol/m3]": random_column(0, 30),
+        "CO2_b_aq [mol]": random_column(0, 3e-3), "CO2_a_aq [mol]": random_column(0, 3e-3),
+        "CO2_dissolved_between_time_steps_aq": random_column(-1e-4, 1e-4),
+        "CO2_produced_aq_cum": random_column(0, 1e-2), "Cgas_DM_cum": random_column(0, 5),
+        "DIC_cum": random_column(0, 1),
+    })
+
+
+# {kernel name: function that runs the kernel on the data frame of make_kernel_data_frame}
+KERNELS: Dict[str, Callable[[pd.DataFrame], None]] = {
+    "PercentageO2ConsumedAndCO2ProducedAndRatio.calculate_o2_consumed":
+        lambda df: PercentageO2ConsumedAndCO2ProducedAndRatio.calculate_o2_consumed(data_frame=df),
+    "PercentageO2ConsumedAndCO2ProducedAndRatio.calculate_co2_produced":
+        lambda df: PercentageO2ConsumedAndCO2ProducedAndRatio.calculate_co2_produced(data_frame=df),
+    "PercentageO2ConsumedAndCO2ProducedAndRatio.calculate_ratio_o2_co2":
+        lambda df: PercentageO2ConsumedAndCO2ProducedAndRatio.calculate_ratio_o2_co2(data_frame=df),
+    "MolesProduced.total_carbon_produced_moles":
+        lambda df: MolesProduced.total_carbon_produced_moles(
+            data_frame=df, name_column="mCTot_produced", name_column_mCTot_b="mCTot_b",
+            name_column_mCTot_a="mCTot_a", name_column_flush="Flush (1=yes; 0=no)"),
+    "MolesProduced.oxygen_consumed_moles":
+        lambda df: MolesProduced.oxygen_consumed_moles(
+            data_frame=df, name_column="O2 consumed", name_column_mO2_b="mO2_b", name_column_mO2_a="mO2_a",
+            name_column_flush="Flush (1=yes; 0=no)"),
+    "MolesProduced.carbon_dioxide_produced_moles":
+        lambda df: MolesProduced.carbon_dioxide_produced_moles(
+            data_frame=df, name_column="CO2 produced", name_column_mCO2_b="mCO2_b", name_column_mCO2_a="mCO2_a",
+            name_column_flush="Flush (1=yes; 0=no)"),
+    "MolesProduced.moles_produced_between_samplings":
+        lambda df: MolesProduced.moles_produced_between_samplings(
+            data_frame=df, name_column="O2 consumed", moles_before=df["mO2_b"].to_numpy(),
+            moles_after=df["mO2_a"].to_numpy(), name_column_flush="Flush (1=yes; 0=no)", sign=-1),
+    "CumulativeProductionGasPhase.cumulative_operation":
+        lambda df: CumulativeProductionGasPhase.cumulative_operation(
+            data_frame=df, name_column_cum="O2 consumed_cum", name_column_produced_or_consumed="O2 consumed",
+            name_column_flush="Flush (1=yes; 0=no)"),
+    "CumulativeProductionGasPhase.carbon_gas_dry_mass_cumulative":
+        lambda df: CumulativeProductionGasPhase.carbon_gas_dry_mass_cumulative(
+            data_frame=df, name_column="Cgas_DM_cum", name_column_mCTot_produced_cumulative="mCTot_produced_cum",
+            molar_mass_carbon=12, dry_mass_sample=153.6, name_column_flush="Flush (1=yes; 0=no)"),
+    "CarbonInAqueousPhase.partial_pressure_carbon_dioxide":
+        lambda df: CarbonInAqueousPhase.partial_pressure_carbon_dioxide(
+            data_frame=df, name_column="PP CO2_b ", column_name_pressure_sampling="P sample before gc [hPa]",
+            column_name_corrected_carbon_dioxide_in_percentage="CO2-corr [%]"),
+    "CarbonInAqueousPhase.carbon_dioxide_in_aqueous_phase_mol_per_m3":
+        lambda df: CarbonInAqueousPhase.carbon_dioxide_in_aqueous_phase_mol_per_m3(
+            data_frame=df, name_column="CO2_b_aq [mol/m3]", column_name_PP_CO2="PP CO2_b "),
+    "CarbonInAqueousPhase.carbon_dioxide_in_aqueous_phase_mol":
+        lambda df: CarbonInAqueousPhase.carbon_dioxide_in_aqueous_phase_mol(
+            data_frame=df, name_column="CO2_b_aq [mol]", column_name_CO2_aq_in_mol_per_m3="CO2_b_aq [mol/m3]",
+            water_volume_in_liters=0.098),
+    "CarbonInAqueousPhase.carbon_dioxide_dissolved_between_time_steps_aqueous":
+        lambda df: CarbonInAqueousPhase.carbon_dioxide_dissolved_between_time_steps_aqueous(
+            data_frame=df, name_column="CO2_dissolved_between_time_steps_aq",
+            column_name_CO2_before_aq_in_mol="CO2_b_aq [mol]", column_name_CO2_after_aq_in_mol="CO2_a_aq [mol]"),
+    "CarbonInAqueousPhase.carbon_dioxide_produced_aqueous_phase_cumulative":
+        lambda df: CarbonInAqueousPhase.carbon_dioxide_produced_aqueous_phase_cumulative(
+            data_frame=df, name_column="CO2_produced_aq_cum",
+            carbon_dioxide_dissolved_between_time_steps_aqueous="CO2_dissolved_between_time_steps_aq"),
+    "CarbonInAqueousPhase.dissolved_inorganic_carbon_cumulative":
+        lambda df: CarbonInAqueousPhase.dissolved_inorganic_carbon_cumulative(
+            data_frame=df, name_column="DIC_cum", column_name_CO2_aq_in_mol_per_m3="CO2_produced_aq_cum",
+            dry_mass_sample=153.6),
+    "ResultsInterpretations.total_carbon_dry_matter":
+        lambda df: ResultsInterpretations.total_carbon_dry_matter(
+            data_frame=df, name_column="Ctot_DM [mg C/gDW]", name_column_flush="Flush (1=yes; 0=no)",
+            name_column_C_gas_dry_mass_cum="Cgas_DM_cum", name_column_DIC_cum="DIC_cum"),
+    "ResultsInterpretations.ratio_oxygen_consumed_carbon_dioxide_produced":
+        lambda df: ResultsInterpretations.ratio_oxygen_consumed_carbon_dioxide_produced(
+            data_frame=df, name_column="Ratio O2/CO2", name_column_O2_consumed_mol="O2 consumed",
+            name_column_CO2_produced_gas_mol="CO2 produced",
+            carbon_dioxide_dissolved_between_time_steps_aqueous="CO2_dissolved_between_time_steps_aq",
+            name_column_flush="Flush (1=yes; 0=no)"),
+    "GasComposition.set_gas_composition":
+        lambda df: GasComposition.set_gas_composition(data_frame=df, ch4=0, co2=0.03, o2=21.90, n2=78.07),
+    "GasComposition.sum_correct_sum":
+        lambda df: GasComposition.sum_correct_sum(data_frame=df),
+    "GasComposition.correct_gas_composition":
+        lambda df: GasComposition.correct_gas_composition(
+            data_frame=df, gas_column_names=["CH4 [%]", "CO2 [%]", "O2 [%]", "N2 [%]"]),
+    "MolGasCompositionCalculations.mol_gas_sampling":
+        lambda df: MolGasCompositionCalculations.mol_gas_sampling(
+            data_frame=df, Rgas=8314.5, exp_temperature=293.15, volume_headspace=0.961,
+            column_name_pressure="P sample before gc [hPa]", name_column="mg_bs"),
+    "MolGasCompositionCalculations.specific_gas_in_moles_before_sampling":
+        lambda df: MolGasCompositionCalculations.specific_gas_in_moles_before_sampling(
+            data_frame=df, name_column="mCO2_b", name_column_mg_before_or_after="mg_bs",
+            name_column_specific_gas_corrected="CO2-corr [%]"),
+    "MolGasCompositionCalculations.carbon_total_moles":
+        lambda df: MolGasCompositionCalculations.carbon_total_moles(
+            data_frame=df, name_column="mCTot_b", name_column_CO2="mCO2_b", name_column_CH4="mCH4_b"),
+    "MolGasCompositionCalculations.gas_moles_before_and_after_sampling":
+        lambda df: MolGasCompositionCalculations.gas_moles_before_and_after_sampling(
+            data_frame=df, name_columns_mg=["mg_bs", "mg_as"],
+            name_columns_specific_gas_corrected=["CO2-corr [%]", "CH4-corr [%]", "O2-corr [%]", "N2-corr [%]"],
+            name_columns_carbon_gas_corrected=["CO2-corr [%]", "CH4-corr [%]"],
+            name_columns_moles=[["mCO2_b", "mCH4_b", "mO2_b", "mN2_b"], ["mCO2_a", "mCH4_a", "mO2_a", "mN2_a"]],
+            name_columns_carbon_total=["mCTot_b", "mCTot_a"]),
+}
+
+
+def discover_kernel_names() -> List[str]:
+    """The names (Class.method) of all the public static methods of the classes in the kernel modules."""
+    kernel_names = []
+    for module in KERNEL_MODULES:
+        for class_name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            for method_name, attribute in vars(cls).items():
+                if isinstance(attribute, staticmethod) and not method_name.startswith("_"):
+                    kernel_names.append(f"{class_name}.{method_name}")
+    return kernel_names
+
+
+def time_kernel(kernel_name: str, number_of_rows: int, repeat: int = 3) -> float:
+    """
+    Time a kernel on a data frame with the number of rows. The data frame is made and copied outside the timing.
+
+    :return: the minimum time of the repeats in seconds.
+    """
+    data_frame = make_kernel_data_frame(number_of_rows)
+    kernel = KERNELS[kernel_name]
+    timings = []
+    for _ in range(repeat):
+        data_frame_copy = data_frame.copy()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            start = time.perf_counter()
+            kernel(data_frame_copy)
+            timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def fit_exponent(sizes: List[int], times: List[float], minimum_time_for_fit: float = MINIMUM_TIME_FOR_FIT) -> float:
+    """
+    Fit the exponent b of time = a * rows ** b with least squares on the logarithms. Timings below
+    minimum_time_for_fit are mostly overhead and are left out, unless then less than two timings are left.
+
+    :return: the exponent, NaN when there are less than two timings.
+    """
+    sizes, times = np.asarray(sizes, dtype=float), np.asarray(times, dtype=float)
+    selection = times >= minimum_time_for_fit
+    if selection.sum() < 2:
+        selection = np.zeros(len(times), dtype=bool)
+        selection[-2:] = True
+    if selection.sum() < 2:
+        return np.nan
+    exponent, _ = np.polyfit(np.log(sizes[selection]), np.log(times[selection]), 1)
+    return float(exponent)
+
+
+def measure_scaling(kernel_names: List[str] = None, sizes: List[int] = None, time_cap: float = 10.0,
+                    repeat: int = 3, show_process: bool = False) -> Dict[str, dict]:
+    """
+    Time every kernel at every size and fit the complexity exponent.
+
+    :param kernel_names: the kernels to measure. Defaults to all the kernels.
+    :param sizes: the numbers of rows. Defaults to 1k, 10k, 100k and 1M.
+    :param time_cap: a size is skipped when the time predicted from the smaller sizes is above this number of
+    seconds. The two smallest sizes are always timed, so the exponent can always be fitted.
+    :param repeat: the number of timings of every size, the minimum is kept.
+    :param show_process: when set on True than the function shows the process.
+    :return: {kernel_name: {"sizes": [...], "times": [...], "exponent": float, "skipped_sizes": [...]}}
+    """
+    kernel_names = list(KERNELS.keys()) if kernel_names is None else kernel_names
+    sizes = sorted(DEFAULT_SIZES if sizes is None else sizes)
+
+    results = {}
+    for kernel_name in kernel_names:
+        measured_sizes, times, skipped_sizes = [], [], []
+        for number_of_rows in sizes:
+            if len(measured_sizes) >= 2:
+                exponent = max(fit_exponent(measured_sizes, times), 1)
+                predicted_time = times[-1] * (number_of_rows / measured_sizes[-1]) ** exponent
+                if predicted_time > time_cap:
+                    skipped_sizes.append(number_of_rows)
+                    continue
+            measured_sizes.append(number_of_rows)
+            times.append(time_kernel(kernel_name, number_of_rows, repeat=repeat))
+
+        results[kernel_name] = {"sizes": measured_sizes, "times": times,
+                                "exponent": fit_exponent(measured_sizes, times), "skipped_sizes": skipped_sizes}
+        if show_process:
+            timings = ", ".join(f"{size}: {seconds:.4f}s" for size, seconds in zip(measured_sizes, times))
+            print(f"{kernel_name}: exponent {results[kernel_name]['exponent']:.2f} ({timings})")
+
+    return results
+
+
+def find_scaling_problems(results: Dict[str, dict], baseline: Dict[str, dict] = None,
+                          max_exponent: float = MAX_EXPONENT,
+                          regression_threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """
+    Find the kernels that scale worse than linear, or that are slower than the baseline at the same number of rows.
+    Only timings above MINIMUM_TIME_FOR_FIT are compared with the baseline, the smaller ones are mostly noise. A
+    kernel of which the exponent could not be fitted (less than two sizes are timed) is a problem as well.
+
+    :return: a list with a message for every problem, empty when there are no problems.
+    """
+    problems = []
+    for kernel_name, result in results.items():
+        if np.isnan(result["exponent"]):
+            problems.append(f"{kernel_name} has no exponent: {len(result['sizes'])} size(s) timed, skipped sizes "
+                            f"{result.get('skipped_sizes', [])}")
+        elif result["exponent"] > max_exponent:
+            problems.append(f"{kernel_name} scales worse than linear: exponent {result['exponent']:.2f}")
+
+        if baseline is None or kernel_name not in baseline:
+            continue
+        dict_baseline_times = dict(zip(baseline[kernel_name]["sizes"], baseline[kernel_name]["times"]))
+        for number_of_rows, seconds in zip(result["sizes"], result["times"]):
+            baseline_seconds = dict_baseline_times.get(number_of_rows)
+            if baseline_seconds is None or seconds < MINIMUM_TIME_FOR_FIT:
+                continue
+            if seconds > regression_threshold * baseline_seconds:
+                problems.append(f"{kernel_name} is {seconds / baseline_seconds:.1f} times slower than the baseline "
+                                f"at {number_of_rows} rows")
+    return problems
+
+
+def save_baseline(results: Dict[str, dict], path: str = PATH_BASELINE) -> None:
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+
+
+def load_baseline(path: str = PATH_BASELINE) -> Dict[str, dict] | None:
+    """:return: the baseline, or None when there is no baseline file."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def main(arguments: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the scaling of the calculation kernels.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--time-cap", type=float, default=10.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=PATH_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--max-exponent", type=float, default=MAX_EXPONENT)
+    parser.add_argument("--regression-threshold", type=float, default=REGRESSION_THRESHOLD)
+    parsed_arguments = parser.parse_args(arguments)
+
+    results = measure_scaling(sizes=parsed_arguments.sizes, time_cap=parsed_arguments.time_cap,
+                              repeat=parsed_arguments.repeat, show_process=True)
+
+    if parsed_arguments.update_baseline:
+        save_baseline(results, parsed_arguments.baseline)
+        print(f"baseline is saved in {parsed_arguments.baseline}")
+        return 0
+
+    problems = find_scaling_problems(results, baseline=load_baseline(parsed_arguments.baseline),
+                                     max_exponent=parsed_arguments.max_exponent,
+                                     regression_threshold=parsed_arguments.regression_threshold)
+    for problem in problems:
+        print(problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
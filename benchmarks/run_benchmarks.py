@@ -0,0 +1,224 @@
+"""
+Time the load, validation, calculations and write-back of generated workbooks over a grid of sizes.
+
+Example:
+    python -m benchmarks.run_benchmarks --sheets 2 16 --rows 25 250 --output benchmark_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List
+
+import pandas as pd
+
+from benchmarks.generate_workbook import generate_workbook, BASIC_COLUMN_NAMES, NUMERIC_COLUMN_NAMES, HEADER_ROW, \
+    START_ROW_VALUES_TABLE_IN_EXCEL
+from excel_manager import ExcelManager
+from run_data_frame_calculations import RunDataFrameCalculationsForOneDataFrame
+from validation_input_data.validate_input_data import validate_if_all_cells_are_correctly_filled, \
+    ValidateInputDataStatistics
+
+
+@contextmanager
+def timed(dict_timings: Dict[str, float], stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        dict_timings[stage] = time.perf_counter() - start
+
+
+def load_tables(manager: ExcelManager, sheet_names: List[str]) -> (Dict[str, pd.DataFrame], dict):
+    """Load the tables and the constants of the sample sheets, like the notebook running_sheet_with_given_layout."""
+    dict_data_frames = {}
+    dict_constants = {}
+    for sheet_name in sheet_names:
+        dict_data_frames[sheet_name] = manager.load_sheet_table_with_input_header(
+            sheet_name=sheet_name, column_names=BASIC_COLUMN_NAMES, start_row=START_ROW_VALUES_TABLE_IN_EXCEL - 1,
+            end_column=len(BASIC_COLUMN_NAMES))
+        constants_data_frame = manager.load_constants_as_data_frame(sheet_name=sheet_name, start_row=1, end_row=7,
+                                                                    start_col=3, data_only=True)
+        dict_constants[sheet_name] = constants_data_frame.iloc[0].to_dict()
+    return dict_data_frames, dict_constants
+
+
+def run_validation(dict_data_frames: Dict[str, pd.DataFrame], sheet_names: List[str],
+                   workbook) -> validate_if_all_cells_are_correctly_filled:
+    validation = validate_if_all_cells_are_correctly_filled(dict_data_frames=dict_data_frames)
+    validation.fill_dict_indexes_as_panda_indexes_no_int_or_float(
+        list_column_names_to_be_checked=NUMERIC_COLUMN_NAMES + ['Flush (1=yes; 0=no)'])
+    validation.fill_dict_indexes_as_pandas_incorrect_sample_id(
+        column_name_to_be_checked="Sample ID",
+        list_specific_string=sorted({sheet_name.split(".")[0] for sheet_name in sheet_names}))
+    validation.fill_dict_indexes_as_pandas_incorrect_parallel(column_name_to_be_checked="Parallel",
+                                                              list_specific_float_or_integer=[1, 2])
+    validation.fill_dict_indexes_as_pandas_incorrect_gc_method(column_name_to_be_checked="GC method")
+    validation.fill_dict_indexes_as_pandas_no_weight_when_flush(column_name_to_be_checked="Weight [g]",
+                                                                column_name_flush="Flush (1=yes; 0=no)")
+    validation.fill_dict_indexes_as_pandas_incorrect_date(column_name_date="Date", format_date="%Y-%m-%d %H:%M:%S")
+    validation.fill_dict_indexes_as_pandas_incorrect_time(column_name_time="Time")
+    validation.fill_dict_with_indexes_as_excel_when_constants_is_not_filled(workbook=workbook,
+                                                                            start_row_constants_value=1,
+                                                                            end_row_constants_value=7,
+                                                                            column_letter_values="D")
+    return validation
+
+
+def run_calculations(data_frame: pd.DataFrame, constants: dict) -> pd.DataFrame:
+    """Run all the calculations for one sheet, like the notebook running_sheet_with_given_layout."""
+    run = RunDataFrameCalculationsForOneDataFrame(data_frame=data_frame)
+    run.run_data_frame_processor_calculations()
+    run.run_gas_composition_calculations(set_values_gas_composition_first_row=True,
+                                         ch4=0, co2=0.03, o2=21.90, n2=78.07)
+    run.run_mol_gases_before_and_after_sampling(Rgas=constants["Rgas"], exp_temperature=constants["expTemp"],
+                                                volume_headspace=constants["volume_headspace"])
+    data_frame.loc[0, "mg_as"] = data_frame.loc[0, "mg_bs"]
+    run.run_mol_gas_composition_calculation(write_columns=True)
+    run.run_moles_produced()
+    run.run_cumulative_production_in_the_gas_phase(molar_mass_carbon=constants["MM_C"],
+                                                   dry_mass_sample=constants["dry_mass_sample"])
+    run.run_carbon_in_aqueous_phase(water_volume_in_liters=constants["water_volume"],
+                                    dry_mass_sample=constants["dry_mass_sample"])
+    run.run_results_Interpretations()
+    return data_frame
+
+
+def run_benchmark_case(directory: str, number_of_sheets: int, number_of_rows: int, flush_frequency: int,
+                       invalid_cell_fraction: float, outlier_fraction: float, seed: int = 0) -> dict:
+    """
+    Time all the stages for one workbook size.
+
+    The calculations and the write-back use a workbook without invalid cells, because the calculations can not handle
+    text in the measurements. The validation uses a workbook with the same measurements and the invalid cells.
+
+    :return: {"sheets", "rows", ..., "timings": {stage: seconds}, "errors": {stage: message}}
+    """
+    path_clean = os.path.join(directory, f"clean_{number_of_sheets}_{number_of_rows}.xlsx")
+    path_invalid = os.path.join(directory, f"invalid_{number_of_sheets}_{number_of_rows}.xlsx")
+    generated = generate_workbook(path=path_clean, number_of_sheets=number_of_sheets, number_of_rows=number_of_rows,
+                                  flush_frequency=flush_frequency, outlier_fraction=outlier_fraction, seed=seed)
+    generated_invalid = generate_workbook(path=path_invalid, number_of_sheets=number_of_sheets,
+                                          number_of_rows=number_of_rows, flush_frequency=flush_frequency,
+                                          invalid_cell_fraction=invalid_cell_fraction,
+                                          outlier_fraction=outlier_fraction, seed=seed)
+    sheet_names = generated["sheet_names"]
+
+    dict_timings = {}
+    dict_errors = {}
+
+    # validation of the workbook with the invalid cells
+    manager_invalid = ExcelManager(path_invalid)
+    manager_invalid.load_workbook()
+    dict_data_frames_invalid, _ = load_tables(manager_invalid, sheet_names)
+    with timed(dict_timings, "validation"):
+        validation = run_validation(dict_data_frames_invalid, sheet_names, manager_invalid.workbook_formula)
+    with timed(dict_timings, "validation_statistics"):
+        statistics = ValidateInputDataStatistics(dict_sheet_name_with_panda_data_frames=dict_data_frames_invalid)
+        statistics.fill_dict_outliers_indexes_as_pandas(list_column_names_to_be_checked=NUMERIC_COLUMN_NAMES)
+        statistics.fill_dict_segment_outliers_indexes_as_pandas(list_column_names_to_be_checked=NUMERIC_COLUMN_NAMES)
+    with timed(dict_timings, "validation_styling"):
+        validation.fill_wrong_cells_in_excel_no_int_or_float(
+            workbook=manager_invalid.workbook_formula, header_row=HEADER_ROW,
+            start_row_values_table_in_excel=START_ROW_VALUES_TABLE_IN_EXCEL)
+        statistics.fill_outliers_in_excel(workbook=manager_invalid.workbook_formula, header_row=HEADER_ROW,
+                                          start_row_values_table_in_excel=START_ROW_VALUES_TABLE_IN_EXCEL)
+
+    # load, calculations and write-back of the clean workbook
+    manager = ExcelManager(path_clean)
+    with timed(dict_timings, "load_workbook"):
+        manager.load_workbook()
+    with timed(dict_timings, "load_tables"):
+        dict_data_frames, dict_constants = load_tables(manager, sheet_names)
+    with timed(dict_timings, "calculations"):
+        try:
+            for sheet_name in sheet_names:
+                run_calculations(dict_data_frames[sheet_name], dict_constants[sheet_name])
+        except Exception as error:
+            dict_errors["calculations"] = repr(error)
+    with timed(dict_timings, "write_back"):
+        for sheet_name in sheet_names:
+            ExcelManager.replace_table_in_specific_sheet_with_data_frame(
+                excel_file_path=path_clean, sheet_name=sheet_name, start_row=START_ROW_VALUES_TABLE_IN_EXCEL,
+                header=False, data_frame=dict_data_frames[sheet_name])
+
+    return {"sheets": number_of_sheets, "rows": number_of_rows, "flush_frequency": flush_frequency,
+            "invalid_cell_fraction": invalid_cell_fraction, "outlier_fraction": outlier_fraction,
+            "number_of_invalid_cells": generated_invalid["number_of_invalid_cells"],
+            "number_of_outliers": generated["number_of_outliers"],
+            "timings": dict_timings, "errors": dict_errors}
+
+
+def get_version() -> str:
+    """The git commit of the code, to compare the results of different versions."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def run_benchmarks(list_number_of_sheets: List[int], list_number_of_rows: List[int], flush_frequency: int = 2,
+                   invalid_cell_fraction: float = 0.01, outlier_fraction: float = 0.01, repeat: int = 1,
+                   show_process: bool = False) -> dict:
+    """
+    Run the benchmark for every combination of the number of sheets and the number of rows.
+
+    :param repeat: the number of times every case is run. The minimum time of every stage is kept.
+    :return: {"version", "date", "python", "pandas", "results": [result of every case]}
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for number_of_sheets in list_number_of_sheets:
+            for number_of_rows in list_number_of_rows:
+                case_results = [run_benchmark_case(directory=directory, number_of_sheets=number_of_sheets,
+                                                   number_of_rows=number_of_rows, flush_frequency=flush_frequency,
+                                                   invalid_cell_fraction=invalid_cell_fraction,
+                                                   outlier_fraction=outlier_fraction)
+                                for _ in range(repeat)]
+                result = case_results[0]
+                result["timings"] = {stage: min(case_result["timings"][stage] for case_result in case_results)
+                                     for stage in result["timings"]}
+                results.append(result)
+
+                if show_process:
+                    timings = ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in result["timings"].items())
+                    print(f"{number_of_sheets} sheets x {number_of_rows} rows: {timings}")
+
+    return {"version": get_version(), "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "pandas": pd.__version__, "results": results}
+
+
+def main(arguments: List[str] = None) -> dict:
+    parser = argparse.ArgumentParser(description="Benchmark the load, validation, calculations and write-back.")
+    parser.add_argument("--sheets", type=int, nargs="+", default=[2, 16], help="the numbers of sample sheets")
+    parser.add_argument("--rows", type=int, nargs="+", default=[25, 250], help="the numbers of rows per sheet")
+    parser.add_argument("--flush-frequency", type=int, default=2)
+    parser.add_argument("--invalid-cell-fraction", type=float, default=0.01)
+    parser.add_argument("--outlier-fraction", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", default="benchmark_results.json", help="the JSON file for the results")
+    parsed_arguments = parser.parse_args(arguments)
+
+    benchmark_results = run_benchmarks(list_number_of_sheets=parsed_arguments.sheets,
+                                       list_number_of_rows=parsed_arguments.rows,
+                                       flush_frequency=parsed_arguments.flush_frequency,
+                                       invalid_cell_fraction=parsed_arguments.invalid_cell_fraction,
+                                       outlier_fraction=parsed_arguments.outlier_fraction,
+                                       repeat=parsed_arguments.repeat,
+                                       show_process=True)
+
+    with open(parsed_arguments.output, "w") as file:
+        json.dump(benchmark_results, file, indent=2)
+    print(f"results are saved in {parsed_arguments.output}")
+
+    return benchmark_results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+A cache of the calculated sheets on disk, so an unchanged sheet of a workbook which is submitted again is not
+calculated again.
+
+The key of a sheet is the hash of everything the calculations depend on: the measurements, the constants of the
+sheet, the gas composition of the first row and ENGINE_VERSION. A changed input therefore gives a new key, an entry is
+never updated in place. The entries are Arrow (Feather) files, read memory-mapped, when pyarrow is installed and pickle
+files otherwise. The numeric columns of an Arrow entry are read without copying, see CalculationCache.get.
+
+Example:
+    cache = CalculationCache("cache")
+    key = get_calculation_key(data_frame, constants, first_row_gas_composition)
+    calculated_data_frame = cache.get(key)
+    if calculated_data_frame is None:
+        calculated_data_frame = calculate_sheet(...)
+        cache.put(key, calculated_data_frame)
+"""
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import os
+import pickle
+import shutil
+from typing import Dict, List, Optional
+
+from lazy_imports import lazy_import
+from validation_input_data.validation_state import ValidationState
+
+pd = lazy_import("pandas")
+
+# change this version when a calculation changes, the cached results of the old calculations are not used anymore
+ENGINE_VERSION = "1"
+
+ARROW_SUFFIX = ".feather"
+PICKLE_SUFFIX = ".pkl"
+
+
+def get_calculation_key(data_frame: pd.DataFrame, constants: dict, first_row_gas_composition: Dict[str, float],
+                        column_names: List[str] = None, engine_version: str = ENGINE_VERSION) -> str:
+    """
+    The hash of the inputs of the calculations of one sheet.
+
+    :param data_frame: the data frame with the measurements, before the calculations.
+    :param constants: {constant name: value} of the sheet (Rgas, expTemp, volume_headspace, ...).
+    :param first_row_gas_composition: the values of set_gas_composition for the first row, {"ch4": 0, "co2": 0.03, ...}.
+    :param column_names: the input columns, by default all the columns of the data frame.
+    :param engine_version: the version of the calculations.
+    :return: the key as hexadecimal string.
+    """
+    if column_names is None:
+        column_names = list(data_frame.columns)
+    input_data_frame = data_frame[[column_name for column_name in column_names if column_name in data_frame.columns]]
+
+    hasher = hashlib.sha256()
+    hasher.update(engine_version.encode())
+    hasher.update(repr(list(input_data_frame.columns)).encode())
+    hasher.update(ValidationState.hash_rows(input_data_frame).to_numpy().tobytes())
+    hasher.update(ValidationState.hash_values(sorted(constants.items())).encode())
+    hasher.update(ValidationState.hash_values(sorted(first_row_gas_composition.items())).encode())
+    return hasher.hexdigest()
+
+
+class CalculationCache:
+    """
+    The calculated data frames of sheets on disk, with a bound on the total size.
+
+    The entries of an engine version are in the subdirectory with the name of the version. When the total size is
+    larger than max_bytes the least recently used entries are removed; the modification time of an entry is updated
+    at every hit, so it is also the time of the last use. Every entry is written to a temporary file first and then
+    renamed, so more processes (the workers of batch_run) can use the same directory.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 ** 2, engine_version: str = ENGINE_VERSION,
+                 use_arrow: bool = None):
+        """
+        :param directory: the directory of the cache, it is created when it does not exist.
+        :param max_bytes: the maximum total size of the entries of this engine version.
+        :param engine_version: the version of the calculations.
+        :param use_arrow: write Arrow files, by default when pyarrow is installed.
+        """
+        if use_arrow is None:
+            use_arrow = importlib.util.find_spec("pyarrow") is not None
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.engine_version = engine_version
+        self.use_arrow = use_arrow
+        self.version_directory = os.path.join(directory, engine_version)
+        os.makedirs(self.version_directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+    def _get_entry_path(self, key: str) -> Optional[str]:
+        for suffix in (ARROW_SUFFIX, PICKLE_SUFFIX):
+            path = os.path.join(self.version_directory, key + suffix)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def __contains__(self, key: str) -> bool:
+        return self._get_entry_path(key) is not None
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """
+        Read the cached data frame of a key. An Arrow entry is read memory-mapped and converted with split_blocks and
+        self_destruct: the numeric columns without missing values are then read-only views on the file (no copy),
+        the other columns (the texts and the columns with NaN) are copied. Copy the data frame before changing values
+        in place. A pickle entry is always a copy.
+
+        :return: the cached data frame of the key, or None when it is not in the cache.
+        """
+        path = self._get_entry_path(key)
+        if path is None:
+            self.misses += 1
+            return None
+        try:
+            if path.endswith(ARROW_SUFFIX):
+                import pyarrow.feather
+                # without consolidating the columns in blocks, which would copy them all, and the Arrow table is freed
+                # column by column during the conversion
+                data_frame = pyarrow.feather.read_table(path, memory_map=True).to_pandas(split_blocks=True,
+                                                                                          self_destruct=True)
+            else:
+                with open(path, "rb") as file:
+                    data_frame = pickle.load(file)
+            # the last use, for the eviction
+            os.utime(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            # removed or evicted by another process
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data_frame
+
+    def put(self, key: str, data_frame: pd.DataFrame) -> str:
+        """
+        Store the calculated data frame of a key and remove the least recently used entries when the cache is full.
+
+        :return: the path of the entry.
+        """
+        path = None
+        if self.use_arrow:
+            path = self._write_arrow(key, data_frame)
+        if path is None:
+            path = os.path.join(self.version_directory, key + PICKLE_SUFFIX)
+            path_temporary = f"{path}.{os.getpid()}.tmp"
+            with open(path_temporary, "wb") as file:
+                pickle.dump(data_frame, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path_temporary, path)
+        self.evict()
+        return path
+
+    def _write_arrow(self, key: str, data_frame: pd.DataFrame) -> Optional[str]:
+        """Write an Arrow file, None when the data frame can not be converted (for example mixed object columns)."""
+        import pyarrow
+        import pyarrow.feather
+        try:
+            table = pyarrow.Table.from_pandas(data_frame, preserve_index=True)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, TypeError, ValueError):
+            return None
+        path = os.path.join(self.version_directory, key + ARROW_SUFFIX)
+        # without compression, so the file can be memory-mapped
+        path_temporary = f"{path}.{os.getpid()}.tmp"
+        pyarrow.feather.write_feather(table, path_temporary, compression="uncompressed")
+        os.replace(path_temporary, path)
+        return path
+
+    def _get_entries_with_stat(self) -> List[tuple]:
+        """
+        :return: [(entry, stat)] of the entries of this engine version, the least recently used first. An entry which
+        is removed by another process (for example a batch worker which shares the directory) is left out.
+        """
+        entries = []
+        with os.scandir(self.version_directory) as iterator:
+            for entry in iterator:
+                if not entry.name.endswith((ARROW_SUFFIX, PICKLE_SUFFIX)):
+                    continue
+                try:
+                    if entry.is_file():
+                        entries.append((entry, entry.stat()))
+                except FileNotFoundError:
+                    continue
+        return sorted(entries, key=lambda entry_with_stat: entry_with_stat[1].st_mtime_ns)
+
+    def get_entries(self) -> List[os.DirEntry]:
+        """:return: the entries of this engine version, the least recently used first."""
+        return [entry for entry, _ in self._get_entries_with_stat()]
+
+    def get_size(self) -> int:
+        """:return: the total size in bytes of the entries of this engine version."""
+        return sum(stat.st_size for _, stat in self._get_entries_with_stat())
+
+    def evict(self) -> List[str]:
+        """
+        Remove the least recently used entries until the total size is not larger than max_bytes.
+
+        :return: the keys of the removed entries.
+        """
+        entries = [(entry, stat.st_size) for entry, stat in self._get_entries_with_stat()]
+        total_bytes = sum(size for _, size in entries)
+        keys_removed = []
+        for entry, size in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            # also when another process removed the entry in the meantime, its bytes are gone
+            total_bytes -= size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            keys_removed.append(os.path.splitext(entry.name)[0])
+        return keys_removed
+
+    def invalidate(self, key: str) -> bool:
+        """
+        Remove the entry of a key.
+
+        :return: True when there was an entry.
+        """
+        removed = False
+        for suffix in (ARROW_SUFFIX, PICKLE_SUFFIX):
+            try:
+                os.remove(os.path.join(self.version_directory, key + suffix))
+                removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def invalidate_other_engine_versions(self) -> List[str]:
+        """
+        Remove the entries of all the other engine versions, which are never used anymore.
+
+        :return: the removed versions.
+        """
+        versions_removed = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name != self.engine_version and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+                versions_removed.append(name)
+        return versions_removed
+
+    def clear(self) -> None:
+        """Remove all the entries of this engine version."""
+        for entry in self.get_entries():
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
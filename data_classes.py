@@ -1,7 +1,5 @@
 from dataclasses import dataclass
 
-from validation_input_data.general_validation_functions import validate_if_there_is_a_float_or_integer_in_cell
-
 
 @dataclass
 class ConstantsSample:
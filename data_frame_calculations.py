@@ -1,7 +1,11 @@
+from __future__ import annotations
+
 import warnings
 
-import numpy as np
-import pandas as pd
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 
 # This class is not used.
@@ -134,6 +138,34 @@ class MolesProduced:
         data_frame.loc[mask, name_column] = np.nan
 
 
+    @staticmethod
+    def moles_produced_between_samplings(data_frame: pd.DataFrame, name_column: str, moles_before: np.ndarray,
+                                         moles_after: np.ndarray, name_column_flush: str, sign: float = 1,
+                                         first_row_value: float = 0) -> None:
+        """
+        Like total_carbon_produced_moles, oxygen_consumed_moles and carbon_dioxide_produced_moles, but with the moles
+        as arrays instead of columns, for example a slice of the moles of
+        MolGasCompositionCalculations.gas_moles_before_and_after_sampling: the moles before sampling minus the moles
+        after the previous sampling.
+
+        Parameters:
+            - data_frame (pd.DataFrame): The DataFrame to modify.
+            - name_column (str): The name of the column to store the result. [mol]
+            - moles_before (np.ndarray): The moles before sampling of every row. [mol]
+            - moles_after (np.ndarray): The moles after sampling of every row. [mol]
+            - name_column_flush (str): The name of the column used for flushing indication.
+            - sign (float, optional): -1 for the consumed gases, like oxygen_consumed_moles. Defaults to 1.
+            - first_row_value (float, optional): The value of the first row. Defaults to 0.
+        """
+        moles_after_previous = np.empty(len(moles_after), dtype=float)
+        moles_after_previous[:1] = np.nan
+        moles_after_previous[1:] = moles_after[:-1]
+        values = (moles_before - moles_after_previous) * sign
+        values[:1] = first_row_value
+        values[data_frame[name_column_flush].to_numpy() == 1] = np.nan
+        data_frame[name_column] = values
+
+
 class CumulativeProductionGasPhase:
     @staticmethod
     def cumulative_operation(data_frame: pd.DataFrame, name_column_cum: str,
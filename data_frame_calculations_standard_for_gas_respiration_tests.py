@@ -1,4 +1,11 @@
-import pandas as pd
+from __future__ import annotations
+
+from typing import List, Sequence
+
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 
 class GasComposition:
@@ -79,20 +86,68 @@ class GasComposition:
         NicePandaFrameFunctions.sum_correct_sum(data_frame=my_data_frame)
         # The measuring values are corrected so that the sum is 100% in the DataFrame.
         """
-        df = data_frame
+        GasComposition.correct_gas_composition(
+            data_frame=data_frame,
+            gas_column_names=[name_column_ch4, name_column_co2, name_column_o2, name_column_n2],
+            correction_column_names=[name_correction_ch4, name_correction_co2, name_correction_o2, name_correction_n2],
+            name_column_summation=name_column_summation,
+            name_column_summation_correction=name_column_summation_correction)
+
+    @staticmethod
+    def correct_gas_composition(data_frame: pd.DataFrame,
+                                gas_column_names: List[str],
+                                correction_column_names: List[str] = None,
+                                name_column_summation: str = "Sum [%]",
+                                name_column_summation_correction: str = "Sum-corr [%]",
+                                ) -> None:
+        """
+        Correct the measuring values of any set of gases so that the sum is 100%, like sum_correct_sum for CH4, CO2,
+        O2 and N2. The values are corrected as one (rows x gases) array, with one division per row.
+
+        Parameters:
+        - data_frame (pd.DataFrame): The DataFrame to modify.
+        - gas_column_names (List[str]): The names of the columns of the gases in [%], for example
+        ["H2 [%]", "H2S [%]", "N2O [%]"].
+        - correction_column_names (List[str], optional): The names of the columns for the corrected values, in the
+        order of gas_column_names. Defaults to the names of the gas columns with "-corr", "H2 [%]" gives
+        "H2-corr [%]".
+        - name_column_summation (str, optional): The name of the column for the summation of measuring values.
+        Defaults to "Sum [%]".
+        - name_column_summation_correction (str, optional): The name of the column for the corrected summation
+        of measuring values. Defaults to "Sum-corr [%]".
+
+        Returns:
+        None
+
+        Example:
+        my_data_frame = pd.DataFrame(...)
+        GasComposition.correct_gas_composition(data_frame=my_data_frame, gas_column_names=["H2 [%]", "N2 [%]"])
+        # The columns Sum [%], H2-corr [%], N2-corr [%] and Sum-corr [%] are added to the DataFrame.
+        """
+        if correction_column_names is None:
+            correction_column_names = [GasComposition._get_correction_column_name(column_name)
+                                       for column_name in gas_column_names]
+        if len(correction_column_names) != len(gas_column_names):
+            raise ValueError("There must be a correction column name for every gas column.")
 
-        # summation of the measuring values CH4, CO2, O2, N2 in [%]
-        df[name_column_summation] = df[name_column_ch4] + df[name_column_co2] + df[name_column_o2] + df[name_column_n2]
+        values = data_frame[gas_column_names].to_numpy(dtype=float)
 
-        # Correct the measuring values so that the sum is 100%
-        df[name_correction_ch4] = (100 / df[name_column_summation]) * df[name_column_ch4]
-        df[name_correction_co2] = (100 / df[name_column_summation]) * df[name_column_co2]
-        df[name_correction_o2] = (100 / df[name_column_summation]) * df[name_column_o2]
-        df[name_correction_n2] = (100 / df[name_column_summation]) * df[name_column_n2]
+        # the gases are added in the order of the columns, like the summation of the columns in pandas
+        summation = np.add.reduce(values, axis=1)
+        corrected_values = values * (100 / summation)[:, np.newaxis]
+        # must all be equal to 100%
+        summation_correction = np.add.reduce(corrected_values, axis=1)
 
-        # The summation of the corrected values CH4, CO2, O2, N2. Must all be equal to 100%
-        df[name_column_summation_correction] = df[name_correction_ch4] + df[name_correction_co2] + \
-                                               df[name_correction_o2] + df[name_correction_n2]
+        data_frame[name_column_summation] = summation
+        for position, column_name in enumerate(correction_column_names):
+            data_frame[column_name] = corrected_values[:, position]
+        data_frame[name_column_summation_correction] = summation_correction
+
+    @staticmethod
+    def _get_correction_column_name(column_name: str) -> str:
+        if column_name.endswith(" [%]"):
+            return column_name[:-len(" [%]")] + "-corr [%]"
+        return column_name + "-corr"
 
 
 class MolGasCompositionCalculations:
@@ -192,3 +247,62 @@ class MolGasCompositionCalculations:
               # The DataFrame now contains a new column 'Total Moles of Carbon' representing the total moles of carbon.
           """
         data_frame[name_column] = data_frame[name_column_CO2] + data_frame[name_column_CH4]
+
+    @staticmethod
+    def gas_moles_before_and_after_sampling(data_frame: pd.DataFrame,
+                                            name_columns_mg: Sequence[str],
+                                            name_columns_specific_gas_corrected: Sequence[str],
+                                            name_columns_carbon_gas_corrected: Sequence[str],
+                                            name_columns_moles: Sequence[Sequence[str]] = None,
+                                            name_columns_carbon_total: Sequence[str] = None,
+                                            ) -> (np.ndarray, np.ndarray):
+        """
+        Calculate the moles of all the gases before and after sampling at once, like
+        specific_gas_in_moles_before_sampling for every gas and carbon_total_moles. The moles are one (rows x
+        samplings x gases) array: the column of the gas in moles of every sampling (mg_bs, mg_as) times the corrected
+        gas composition of the row. The total moles of carbon are the sum over the gases with carbon.
+
+        Parameters:
+            - data_frame (pd.DataFrame): The DataFrame with the gas in moles and the corrected gas composition.
+            - name_columns_mg (Sequence[str]): The names of the columns with the gas in moles of every sampling, for
+            example ["mg_bs", "mg_as"].
+            - name_columns_specific_gas_corrected (Sequence[str]): The names of the columns with the corrected values
+            of the gases, for example ["CO2-corr [%]", "CH4-corr [%]", "O2-corr [%]", "N2-corr [%]"].
+            - name_columns_carbon_gas_corrected (Sequence[str]): The gases with carbon, of
+            name_columns_specific_gas_corrected, for example ["CO2-corr [%]", "CH4-corr [%]"].
+            - name_columns_moles (Sequence[Sequence[str]], optional): The names of the columns to store the moles, for
+            every sampling the names for the gases, for example [["mCO2_b", ...], ["mCO2_a", ...]]. Without the
+            moles are only returned.
+            - name_columns_carbon_total (Sequence[str], optional): The names of the columns to store the total moles
+            of carbon of every sampling, for example ["mCTot_b", "mCTot_a"]. The columns of a sampling are added
+            after its columns of the moles.
+
+        Returns:
+            (np.ndarray, np.ndarray): the moles (rows x samplings x gases) and the total moles of carbon
+            (rows x samplings).
+
+        Example:
+            my_data_frame = pd.DataFrame(...)
+            moles, carbon_total = MolGasCompositionCalculations.gas_moles_before_and_after_sampling(
+                data_frame=my_data_frame, name_columns_mg=["mg_bs", "mg_as"],
+                name_columns_specific_gas_corrected=["CO2-corr [%]", "CH4-corr [%]"],
+                name_columns_carbon_gas_corrected=["CO2-corr [%]", "CH4-corr [%]"])
+            # moles[:, 1, 0] are the moles of CO2 after sampling.
+        """
+        name_columns_specific_gas_corrected = list(name_columns_specific_gas_corrected)
+        carbon_positions = [name_columns_specific_gas_corrected.index(column_name)
+                            for column_name in name_columns_carbon_gas_corrected]
+
+        mg = data_frame[list(name_columns_mg)].to_numpy(dtype=float)
+        gas_corrected = data_frame[name_columns_specific_gas_corrected].to_numpy(dtype=float)
+        # (rows x samplings x 1) * (rows x 1 x gases)
+        moles = mg[:, :, np.newaxis] * gas_corrected[:, np.newaxis, :] * (1 / 100)
+        carbon_total = np.add.reduce(moles[:, :, carbon_positions], axis=2)
+
+        if name_columns_moles is not None:
+            for sampling, name_columns_moles_sampling in enumerate(name_columns_moles):
+                for position, column_name in enumerate(name_columns_moles_sampling):
+                    data_frame[column_name] = moles[:, sampling, position]
+                if name_columns_carbon_total is not None:
+                    data_frame[name_columns_carbon_total[sampling]] = carbon_total[:, sampling]
+        return moles, carbon_total
@@ -1,6 +1,11 @@
-import pandas as pd
+from __future__ import annotations
+
 from typing import Any
 
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
 
 class DataFrameProcessor:
     """
@@ -1,15 +1,30 @@
+from __future__ import annotations
+
 import dataclasses
+import itertools
 import os
+import pickle
 import shutil
+import tempfile
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import Mapping
 from datetime import datetime
-from typing import List
-
-import pandas as pd
-from openpyxl.reader.excel import load_workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.workbook import Workbook
+from typing import Iterator, List, TYPE_CHECKING
 
 from data_classes import ConstantsSample
+from instrumentation import record_block
+from lazy_imports import lazy_import
+from nice_functions import HeaderIndex
+from progress_events import emit_progress, emit_sheet_progress, is_listening
+
+if TYPE_CHECKING:
+    from openpyxl.workbook import Workbook
+
+pd = lazy_import("pandas")
+openpyxl = lazy_import("openpyxl")
+openpyxl_dataframe = lazy_import("openpyxl.utils.dataframe")
 
 
 class ExcelManager:
@@ -33,8 +48,30 @@ class ExcelManager:
     def load_workbook(self) -> None:
         """Load the Excel file as a workbook. With data only on True, the workbook is loaded with
         only the values of the cell and not the formulas."""
-        self.workbook_values = load_workbook(filename=self.file_path, data_only=True)
-        self.workbook_formula = load_workbook(filename=self.file_path)
+        start = time.perf_counter()
+        with record_block("load_workbook_values"):
+            self.workbook_values = openpyxl.load_workbook(filename=self.file_path, data_only=True)
+        with record_block("load_workbook_formula"):
+            self.workbook_formula = openpyxl.load_workbook(filename=self.file_path)
+        if is_listening():
+            emit_progress(kind="load", step="load_workbook",
+                          rows=sum(sheet.max_row for sheet in self.workbook_values.worksheets),
+                          duration=time.perf_counter() - start, file_path=self.file_path,
+                          sheets=len(self.workbook_values.sheetnames))
+
+    def load_workbook_read_only(self) -> None:
+        """
+        Load the Excel file as a read-only workbook with only the values, for the sheets which are too long to load
+        completely. The rows are read from the file when they are iterated, see iter_sheet_table_chunks. The workbook
+        with the formulas is not loaded.
+        """
+        self.workbook_values = openpyxl.load_workbook(filename=self.file_path, read_only=True, data_only=True)
+        self.workbook_formula = None
+
+    def close(self) -> None:
+        """Close the read-only workbook, which keeps the file open."""
+        if self.workbook_values is not None and getattr(self.workbook_values, "read_only", False):
+            self.workbook_values.close()
 
     def get_sheet_names(self) -> List[str]:
         """
@@ -95,6 +132,7 @@ class ExcelManager:
         if not workbook:
             raise Exception("Workbook is not loaded.")
 
+        start = time.perf_counter()
         sheet = workbook[sheet_name]
 
         data = list(sheet.iter_rows(min_row=start_row,
@@ -106,6 +144,8 @@ class ExcelManager:
         header = data[0]
         values = data[1:]
         data_frame = pd.DataFrame(data=values, columns=header)
+        emit_sheet_progress(kind="load", step="load_sheet_table", sheet_name=sheet_name, data_frame=data_frame,
+                            start=start)
 
         return data_frame
 
@@ -160,6 +200,7 @@ class ExcelManager:
         if not workbook:
             raise Exception("Workbook is not loaded.")
 
+        start = time.perf_counter()
         sheet = workbook[sheet_name]
 
         data = list(sheet.iter_rows(min_row=start_row,
@@ -170,9 +211,56 @@ class ExcelManager:
 
         values = data[1:]
         data_frame = pd.DataFrame(data=values, columns=column_names)
+        emit_sheet_progress(kind="load", step="load_sheet_table_with_input_header", sheet_name=sheet_name,
+                            data_frame=data_frame, start=start)
 
         return data_frame
 
+    def iter_sheet_table_chunks(
+            self,
+            sheet_name: str,
+            start_row: int,
+            column_names: [str],
+            chunk_size: int = 10000,
+            start_column: int = None,
+            end_column: int = None
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Load a table of a sheet in blocks of rows, like load_sheet_table_with_input_header, so a very long sheet is
+        never completely in memory. Use it with load_workbook_read_only.
+
+        Parameters:
+            - sheet_name (str): The name of the sheet to load.
+            - start_row (int): The row before the values (the row with the units), like in
+            load_sheet_table_with_input_header.
+            - column_names ([str]): A list of the names of the columns.
+            - chunk_size (int, optional): The number of rows of a block. Defaults to 10000.
+            - start_column (int, optional): The first column of the table.
+            - end_column (int, optional): The last column of the table.
+
+        Returns:
+            Iterator[pd.DataFrame]: the blocks, each with the index starting at 0.
+
+        Raises:
+            Exception: If the workbook is not loaded.
+        """
+        if not self.workbook_values:
+            raise Exception("Workbook is not loaded.")
+        if chunk_size < 1:
+            raise ValueError("The chunk size must be at least 1.")
+
+        sheet = self.workbook_values[sheet_name]
+        rows = sheet.iter_rows(min_row=start_row + 1, min_col=start_column, max_col=end_column, values_only=True)
+        while True:
+            start = time.perf_counter()
+            values = list(itertools.islice(rows, chunk_size))
+            if not values:
+                return
+            data_frame = pd.DataFrame(data=values, columns=column_names)
+            emit_sheet_progress(kind="load", step="iter_sheet_table_chunks", sheet_name=sheet_name,
+                                data_frame=data_frame, start=start)
+            yield data_frame
+
     def load_constants_as_data_frame(
             self,
             sheet_name: str,
@@ -350,11 +438,12 @@ class ExcelManager:
         if not excel_file_path:
             raise Exception("there is no excel_file with that path")
 
-        workbook = load_workbook(filename=excel_file_path)
+        start = time.perf_counter()
+        workbook = openpyxl.load_workbook(filename=excel_file_path)
         sheet = workbook[sheet_name]
 
         # change the data frame in to rows. Without index and headers, just only the data.
-        rows = dataframe_to_rows(data_frame, index=False, header=header)
+        rows = openpyxl_dataframe.dataframe_to_rows(data_frame, index=False, header=header)
 
         # remove the existing table
         for row in sheet.iter_rows(min_row=start_row, min_col=start_column):
@@ -365,9 +454,14 @@ class ExcelManager:
         for r_idx, row in enumerate(rows):
             for c_idx, value in enumerate(row):
                 sheet.cell(row=r_idx + start_row, column=c_idx + start_column, value=value)
+        if header:
+            # the names of the header row are changed in place
+            HeaderIndex.invalidate(workbook, sheet_name)
 
         # save copy
         workbook.save(excel_file_path)
+        emit_sheet_progress(kind="write", step="replace_table_in_specific_sheet_with_data_frame", sheet_name=sheet_name,
+                            data_frame=data_frame, start=start, file_path=excel_file_path)
 
     # TODO: does not work yet
     @staticmethod
@@ -417,8 +511,9 @@ class ExcelManager:
         for sheet_name in sheet_names:
             self.dict_panda_data_frames[sheet_name] = data_frame
 
-            if print_process is not False:
-                print(f'Show process: {sheet_name} is done')
+            emit_progress(kind="load", step="fill_dict_panda_data_frames", sheet_name=sheet_name,
+                          rows=len(data_frame),
+                          message=f'Show process: {sheet_name} is done', show_process=print_process is not False)
 
     def get_dict_panda_data_frames(self) -> {str, pd.DataFrame}:
         """
@@ -428,6 +523,40 @@ class ExcelManager:
         """
         return self.dict_panda_data_frames
 
+    def get_lazy_dict_panda_data_frames(self,
+                                        start_row: int,
+                                        column_names: [str],
+                                        sheet_names: [str] = None,
+                                        start_column: int = None,
+                                        end_column: int = None,
+                                        max_data_frames: int = 8,
+                                        spill_directory: str = None,
+                                        spill: bool = True,
+                                        ) -> "LazySheetMapping":
+        """
+        Get the tables of the sheets as a LazySheetMapping, which can be used instead of get_dict_panda_data_frames:
+        a table is only loaded when its sheet is used. The mapping reads the sheets from a read-only workbook of its
+        own, so this manager does not need to load the workbook.
+
+        Parameters:
+            - start_row (int): The row before the values (the row with the units), like in
+            load_sheet_table_with_input_header.
+            - column_names ([str]): A list of the names of the columns.
+            - sheet_names ([str], optional): The sheets of the mapping. Defaults to all the sheets of the workbook.
+            - start_column (int, optional): The first column of the table.
+            - end_column (int, optional): The last column of the table.
+            - max_data_frames (int, optional): The maximum number of data frames in memory. Defaults to 8.
+            - spill_directory (str, optional): The directory where the data frames which do not fit in memory are
+            saved, see LazySheetMapping. Defaults to the temporary directory of the system.
+            - spill (bool, optional): Save the data frames which do not fit in memory. Defaults to True.
+
+        Returns:
+            LazySheetMapping: {sheet name: pd.DataFrame}
+        """
+        return LazySheetMapping(manager=self, sheet_names=sheet_names, start_row=start_row, column_names=column_names,
+                                start_column=start_column, end_column=end_column, max_data_frames=max_data_frames,
+                                spill_directory=spill_directory, spill=spill)
+
     def fill_dict_constants_data_frames(self,
                                         data_frame: pd.DataFrame,
                                         sheets: list[str],
@@ -456,8 +585,9 @@ class ExcelManager:
         for sheet_name in sheet_names:
             self.dict_constants_data_frames[sheet_name] = data_frame
 
-            if print_process is not False:
-                print(f'Show process: {sheet_name} is done')
+            emit_progress(kind="load", step="fill_dict_constants_data_frames", sheet_name=sheet_name,
+                          rows=len(data_frame),
+                          message=f'Show process: {sheet_name} is done', show_process=print_process is not False)
 
     def get_dict_constants_data_frames(self) -> {str, pd.DataFrame}:
         """
@@ -497,8 +627,8 @@ class ExcelManager:
         for sheet_name in sheet_names:
             self.dict_constants_data_classes[sheet_name] = data_class
 
-            if print_process is not False:
-                print(f'Show process: {sheet_name} is done')
+            emit_progress(kind="load", step="fill_dict_constants_data_classes", sheet_name=sheet_name,
+                          message=f'Show process: {sheet_name} is done', show_process=print_process is not False)
 
     def get_dict_constants_data_classes(self) -> {str, ConstantsSample}:
         """
@@ -523,7 +653,7 @@ class ExcelManager:
         :param kwargs:
         :return:
         """
-        return load_workbook(filename=self.file_path, data_only=data_only, **kwargs)
+        return openpyxl.load_workbook(filename=self.file_path, data_only=data_only, **kwargs)
 
     @staticmethod
     def make_excel_based_on_workbook(workbook: Workbook, path_directory: str, filename: str) -> None:
@@ -541,3 +671,178 @@ class ExcelManager:
         filepath = os.path.join(path_directory, filename)
         filepath_with_extension = filepath + ".xlsx"
         workbook.save(filepath_with_extension)
+
+
+class ExcelChunkWriter:
+    """
+    Write a table to a new Excel file block by block, for the results of the chunked calculations. The workbook is
+    write-only, so the rows which are written are not kept in memory.
+
+    Example:
+        with ExcelChunkWriter("GT1.1_calculated.xlsx", sheet_name="GT1.1") as writer:
+            for data_frame in chunks:
+                writer.write_chunk(data_frame)
+    """
+
+    def __init__(self, file_path: str, sheet_name: str = "Sheet") -> None:
+        self.file_path = file_path
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(title=sheet_name)
+        self.column_names = None
+        self.number_of_rows = 0
+
+    def write_chunk(self, data_frame: pd.DataFrame) -> None:
+        """Append the rows of a block, the column names are written before the first block."""
+        start = time.perf_counter()
+        if self.column_names is None:
+            self.column_names = list(data_frame.columns)
+            self.sheet.append(self.column_names)
+        elif list(data_frame.columns) != self.column_names:
+            raise ValueError("The columns of the block are not the columns of the first block.")
+
+        for row in data_frame.itertuples(index=False, name=None):
+            self.sheet.append([None if value is not None and not isinstance(value, str) and pd.isna(value)
+                               else value for value in row])
+        self.number_of_rows += len(data_frame)
+        emit_progress(kind="write", step="write_chunk", rows=len(data_frame), duration=time.perf_counter() - start,
+                      file_path=self.file_path)
+
+    def close(self) -> None:
+        self.workbook.save(self.file_path)
+
+    def __enter__(self) -> "ExcelChunkWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+class LazySheetMapping(Mapping):
+    """
+    A read-only {sheet name: pd.DataFrame} of which a table is loaded the first time its sheet is used, so a report
+    of a few samples does not load all the sheets. The tables are read from a read-only workbook (see
+    load_workbook_read_only), which reads the rows of a sheet from the file when they are used, so the memory does
+    not grow with the size of the workbook.
+
+    At most max_data_frames data frames are kept in memory; when one more is needed the least recently used one is
+    pickled to a file in the spill directory and read back, with its changes, when it is used again. Reading the
+    pickle is much faster than parsing the sheet again. With spill=False a removed data frame is parsed from the
+    workbook again when it is used again and the changes made to it are lost; then a pass over all the sheets (like
+    every fill_dict_* method of the validation) parses every sheet again once the workbook has more sheets than
+    max_data_frames.
+
+    Example:
+        dict_data_frames = manager.get_lazy_dict_panda_data_frames(start_row=12, column_names=column_names)
+        validation = validate_if_all_cells_are_correctly_filled(dict_data_frames=dict_data_frames)
+    """
+
+    def __init__(self, manager: ExcelManager, sheet_names: [str], start_row: int, column_names: [str],
+                 start_column: int = None, end_column: int = None, max_data_frames: int = 8,
+                 spill_directory: str = None, spill: bool = True) -> None:
+        """
+        :param manager: the ExcelManager of the workbook. The sheets are read from its workbook when it is loaded
+        read-only, otherwise from a read-only workbook of the mapping.
+        :param sheet_names: the sheets of the mapping, in this order. All the sheets of the workbook when None.
+        :param start_row: the row before the values, like in load_sheet_table_with_input_header.
+        :param column_names: the names of the columns.
+        :param start_column: the first column of the table.
+        :param end_column: the last column of the table.
+        :param max_data_frames: the maximum number of data frames in memory.
+        :param spill_directory: the directory of the removed data frames, the temporary directory of the system when
+        None. The files are removed by close.
+        :param spill: save the removed data frames. When False they are loaded from the workbook again.
+        """
+        if max_data_frames < 1:
+            raise ValueError("At least one data frame must be kept in memory.")
+        if manager.workbook_values is not None and getattr(manager.workbook_values, "read_only", False):
+            self.reader = manager
+            self._close_reader = False
+        else:
+            self.reader = ExcelManager(manager.file_path)
+            self.reader.load_workbook_read_only()
+            self._close_reader = True
+        self.sheet_names = list(sheet_names) if sheet_names is not None else list(self.reader.get_sheet_names())
+        self.start_row = start_row
+        self.column_names = column_names
+        self.start_column = start_column
+        self.end_column = end_column
+        self.max_data_frames = max_data_frames
+        self.spill = spill
+        self._spill_parent_directory = spill_directory
+        # the directory of its own is made at the first spill, so more mappings can use the same spill directory
+        self.spill_directory = None
+        self._finalizer = None
+
+        # {sheet name: data frame}, the least recently used first
+        self._data_frames = OrderedDict()
+        self._spilled_paths = {}
+        self.number_of_loads = 0
+        self.number_of_spills = 0
+
+    def __getitem__(self, sheet_name: str) -> pd.DataFrame:
+        if sheet_name in self._data_frames:
+            self._data_frames.move_to_end(sheet_name)
+            return self._data_frames[sheet_name]
+        if sheet_name not in self.sheet_names:
+            raise KeyError(sheet_name)
+
+        if sheet_name in self._spilled_paths:
+            with open(self._spilled_paths[sheet_name], "rb") as file:
+                data_frame = pickle.load(file)
+        else:
+            data_frame = self.reader.load_sheet_table_with_input_header(
+                sheet_name=sheet_name, start_row=self.start_row, column_names=self.column_names,
+                start_column=self.start_column, end_column=self.end_column)
+            self.number_of_loads += 1
+        self._data_frames[sheet_name] = data_frame
+        while len(self._data_frames) > self.max_data_frames:
+            self._remove_least_recently_used()
+        return data_frame
+
+    def _remove_least_recently_used(self) -> None:
+        sheet_name, data_frame = self._data_frames.popitem(last=False)
+        if not self.spill:
+            return
+        if self.spill_directory is None:
+            if self._spill_parent_directory is not None:
+                os.makedirs(self._spill_parent_directory, exist_ok=True)
+            self.spill_directory = tempfile.mkdtemp(prefix="sheets_", dir=self._spill_parent_directory)
+            # the files are also removed when the mapping is garbage collected without close
+            self._finalizer = weakref.finalize(self, shutil.rmtree, self.spill_directory, True)
+        path = self._spilled_paths.get(sheet_name)
+        if path is None:
+            path = os.path.join(self.spill_directory, f"{len(self._spilled_paths)}.pkl")
+        with open(path, "wb") as file:
+            pickle.dump(data_frame, file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._spilled_paths[sheet_name] = path
+        self.number_of_spills += 1
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.sheet_names)
+
+    def __len__(self) -> int:
+        return len(self.sheet_names)
+
+    def __contains__(self, sheet_name: object) -> bool:
+        return sheet_name in self.sheet_names
+
+    def get_loaded_sheet_names(self) -> List[str]:
+        """:return: the sheets of which the data frame is in memory, the least recently used first."""
+        return list(self._data_frames)
+
+    def close(self) -> None:
+        """Remove the data frames from memory and the spilled files, and close the read-only workbook."""
+        self._data_frames.clear()
+        self._spilled_paths.clear()
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self.spill_directory = None
+        if self._close_reader:
+            self.reader.close()
+
+    def __enter__(self) -> "LazySheetMapping":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
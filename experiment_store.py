@@ -0,0 +1,388 @@
+"""
+A local SQLite database with the measurements, the constants and the calculated columns of many workbooks, to compare
+experiments without opening all the workbooks.
+
+The values are stored in long format, one row per (sheet, row, column), with the sample ID, the parallel, the
+experiment and the Day of the row, which are indexed. A workbook is ingested again only when the file changed, and
+then only the sheets with changed measurements or constants are replaced.
+
+Example:
+    store = ExperimentStore("experiments.sqlite")
+    store.ingest_workbooks(find_workbooks(["data"]))
+    store.select(column_names=["Ctot_DM [mg C/gDW]"], sample_ids=["GT1"], day_max=14)
+    store.aggregate("Ctot_DM [mg C/gDW]", by=["experiment", "sample_id"])
+
+    python experiment_store.py experiments.sqlite "data/*.xlsx"
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import os
+import sqlite3
+import time
+import traceback
+from typing import List
+
+from calculation_cache import ENGINE_VERSION
+from excel_manager import ExcelManager
+from lazy_imports import lazy_import
+from progress_events import emit_progress
+from workbook_pipeline import WorkbookLayout, calculate_sheet, get_sheet_hash, load_workbook_tables
+
+pd = lazy_import("pandas")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workbooks (
+    workbook_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    experiment TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    ingested_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sheets (
+    sheet_id INTEGER PRIMARY KEY,
+    workbook_id INTEGER NOT NULL REFERENCES workbooks (workbook_id) ON DELETE CASCADE,
+    sheet_name TEXT NOT NULL,
+    sheet_hash TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    error TEXT,
+    UNIQUE (workbook_id, sheet_name)
+);
+CREATE TABLE IF NOT EXISTS constants (
+    sheet_id INTEGER NOT NULL REFERENCES sheets (sheet_id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value REAL,
+    text_value TEXT,
+    PRIMARY KEY (sheet_id, name)
+);
+CREATE TABLE IF NOT EXISTS measurements (
+    sheet_id INTEGER NOT NULL REFERENCES sheets (sheet_id) ON DELETE CASCADE,
+    experiment TEXT NOT NULL,
+    sample_id TEXT,
+    parallel INTEGER,
+    row_number INTEGER NOT NULL,
+    day REAL,
+    column_name TEXT NOT NULL,
+    value REAL,
+    text_value TEXT
+);
+CREATE INDEX IF NOT EXISTS measurements_experiment ON measurements (experiment, sample_id, parallel, day);
+CREATE INDEX IF NOT EXISTS measurements_sample ON measurements (sample_id, parallel, day);
+CREATE INDEX IF NOT EXISTS measurements_column ON measurements (column_name, experiment);
+CREATE INDEX IF NOT EXISTS measurements_sheet ON measurements (sheet_id);
+"""
+
+# the columns of select() and aggregate() which can be used to filter and to group
+DIMENSION_COLUMNS = {"experiment": "m.experiment", "sheet_name": "s.sheet_name", "sample_id": "m.sample_id",
+                     "parallel": "m.parallel", "row_number": "m.row_number", "day": "m.day"}
+AGGREGATE_FUNCTIONS = {"count": "COUNT", "mean": "AVG", "min": "MIN", "max": "MAX", "sum": "SUM"}
+
+
+def split_value(value) -> (float, str):
+    """:return: (value, None) for a number, (None, text) for the other values and (None, None) for an empty cell."""
+    if value is None or (isinstance(value, float) and value != value) or value is pd.NaT:
+        return None, None
+    if isinstance(value, bool):
+        return float(value), None
+    if isinstance(value, (int, float)) or hasattr(value, "dtype") and value.dtype.kind in "iuf":
+        return float(value), None
+    if isinstance(value, (datetime.date, datetime.time)):
+        return None, value.isoformat()
+    return None, str(value)
+
+
+def data_frame_to_long_rows(data_frame: pd.DataFrame, sheet_id: int, experiment: str,
+                            sample_id_column: str = "Sample ID", parallel_column: str = "Parallel",
+                            day_column: str = "Day") -> List[tuple]:
+    """
+    :return: the rows of the measurements table, one for every cell which is not empty, without the sample ID and the
+    parallel columns, which are stored with every row.
+    """
+    number_of_rows = len(data_frame)
+    sample_ids = data_frame[sample_id_column].tolist() if sample_id_column in data_frame.columns \
+        else [None] * number_of_rows
+    parallels = pd.to_numeric(data_frame[parallel_column], errors="coerce").tolist() \
+        if parallel_column in data_frame.columns else [None] * number_of_rows
+    days = pd.to_numeric(data_frame[day_column], errors="coerce").tolist() if day_column in data_frame.columns \
+        else [None] * number_of_rows
+
+    row_dimensions = []
+    for sample_id, parallel, day in zip(sample_ids, parallels, days):
+        row_dimensions.append((None if sample_id is None or sample_id != sample_id else str(sample_id),
+                               None if parallel != parallel or parallel is None else int(parallel),
+                               None if day != day or day is None else float(day)))
+
+    rows = []
+    for column_name in data_frame.columns:
+        if column_name in (sample_id_column, parallel_column):
+            continue
+        for row_number, value in enumerate(data_frame[column_name].tolist()):
+            number, text = split_value(value)
+            if number is None and text is None:
+                continue
+            sample_id, parallel, day = row_dimensions[row_number]
+            rows.append((sheet_id, experiment, sample_id, parallel, row_number, day, str(column_name), number, text))
+    return rows
+
+
+class ExperimentStore:
+    """The database of the experiments, see the module docstring."""
+
+    def __init__(self, path: str, layout: WorkbookLayout = None):
+        """
+        :param path: the SQLite file, it is created when it does not exist.
+        :param layout: the layout of the workbooks, the layout of the template when None.
+        """
+        self.path = path
+        self.layout = layout if layout is not None else WorkbookLayout()
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "ExperimentStore":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def ingest_workbook(self, path: str, experiment: str = None, calculate: bool = True,
+                        force: bool = False) -> dict:
+        """
+        Store the measurements, the constants and the calculated columns of the sample sheets of a workbook.
+
+        Ingesting the same workbook again does not change the database: an unchanged file is skipped and of a changed
+        file only the changed sheets are replaced.
+
+        :param path: the path of the workbook.
+        :param experiment: the name of the experiment, by default the file name without extension.
+        :param calculate: also store the calculated columns. A sheet of which the calculations fail is stored with the
+        measurements only and the error.
+        :param force: ingest the workbook also when the file did not change.
+        :return: {"path", "experiment", "status": "unchanged" or "ingested", "changed_sheets": [sheet_name],
+        "removed_sheets": [sheet_name]}
+        """
+        path = os.path.abspath(path)
+        if experiment is None:
+            experiment = os.path.splitext(os.path.basename(path))[0]
+        stat = os.stat(path)
+        signature = f"{stat.st_mtime_ns}:{stat.st_size}:{ENGINE_VERSION}:{int(calculate)}"
+
+        row = self.connection.execute("SELECT workbook_id, experiment, signature FROM workbooks WHERE path = ?",
+                                      (path,)).fetchone()
+        if row is not None and not force and row[1] == experiment and row[2] == signature:
+            return {"path": path, "experiment": experiment, "status": "unchanged", "changed_sheets": [],
+                    "removed_sheets": []}
+
+        manager = ExcelManager(path)
+        manager.load_workbook()
+        sheet_names = self.layout.get_sample_sheet_names(manager.get_sheet_names())
+        dict_data_frames, dict_constants = load_workbook_tables(manager=manager, sheet_names=sheet_names,
+                                                                layout=self.layout)
+        manager.workbook_values = None
+        manager.workbook_formula = None
+
+        with self.connection:
+            ingested_at = datetime.datetime.now().isoformat(timespec="seconds")
+            if row is None:
+                workbook_id = self.connection.execute(
+                    "INSERT INTO workbooks (path, experiment, signature, ingested_at) VALUES (?, ?, ?, ?)",
+                    (path, experiment, signature, ingested_at)).lastrowid
+                dict_stored_hashes = {}
+            else:
+                workbook_id = row[0]
+                self.connection.execute(
+                    "UPDATE workbooks SET experiment = ?, signature = ?, ingested_at = ? WHERE workbook_id = ?",
+                    (experiment, signature, ingested_at, workbook_id))
+                dict_stored_hashes = dict(self.connection.execute(
+                    "SELECT sheet_name, sheet_hash FROM sheets WHERE workbook_id = ?", (workbook_id,)).fetchall())
+
+            removed_sheets = [sheet_name for sheet_name in dict_stored_hashes if sheet_name not in sheet_names]
+            for sheet_name in removed_sheets:
+                self.connection.execute("DELETE FROM sheets WHERE workbook_id = ? AND sheet_name = ?",
+                                        (workbook_id, sheet_name))
+
+            changed_sheets = []
+            for sheet_name in sheet_names:
+                # the experiment and the engine version are in the hash, so a renamed experiment or changed
+                # calculations replace the stored rows
+                sheet_hash = f"{ENGINE_VERSION}:{int(calculate)}:{experiment}:" \
+                             f"{get_sheet_hash(dict_data_frames[sheet_name], dict_constants[sheet_name])}"
+                if not force and dict_stored_hashes.get(sheet_name) == sheet_hash:
+                    continue
+                self._store_sheet(workbook_id=workbook_id, experiment=experiment, sheet_name=sheet_name,
+                                  sheet_hash=sheet_hash, data_frame=dict_data_frames[sheet_name],
+                                  constants=dict_constants[sheet_name], calculate=calculate)
+                changed_sheets.append(sheet_name)
+
+        return {"path": path, "experiment": experiment, "status": "ingested", "changed_sheets": changed_sheets,
+                "removed_sheets": removed_sheets}
+
+    def _store_sheet(self, workbook_id: int, experiment: str, sheet_name: str, sheet_hash: str,
+                     data_frame: pd.DataFrame, constants: dict, calculate: bool) -> None:
+        error = None
+        if calculate:
+            try:
+                data_frame = calculate_sheet(data_frame=data_frame.copy(), constants=constants, layout=self.layout,
+                                             sheet_name=sheet_name)
+            except Exception:
+                error = traceback.format_exc(limit=3)
+
+        self.connection.execute("DELETE FROM sheets WHERE workbook_id = ? AND sheet_name = ?",
+                                (workbook_id, sheet_name))
+        sheet_id = self.connection.execute(
+            "INSERT INTO sheets (workbook_id, sheet_name, sheet_hash, rows, error) VALUES (?, ?, ?, ?, ?)",
+            (workbook_id, sheet_name, sheet_hash, len(data_frame), error)).lastrowid
+        self.connection.executemany(
+            "INSERT INTO constants (sheet_id, name, value, text_value) VALUES (?, ?, ?, ?)",
+            [(sheet_id, str(name), *split_value(value)) for name, value in constants.items()])
+        self.connection.executemany(
+            "INSERT INTO measurements (sheet_id, experiment, sample_id, parallel, row_number, day, column_name, "
+            "value, text_value) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            data_frame_to_long_rows(data_frame=data_frame, sheet_id=sheet_id, experiment=experiment))
+
+    def ingest_workbooks(self, paths: List[str], calculate: bool = True, show_process: bool = False) -> List[dict]:
+        """
+        Ingest the workbooks one by one, a workbook which can not be loaded is returned with status failed. Every
+        ingested workbook is a write event for the progress sinks, show_process prints it.
+        """
+        results = []
+        for path in paths:
+            start = time.perf_counter()
+            try:
+                result = self.ingest_workbook(path=path, calculate=calculate)
+            except Exception as error:
+                result = {"path": path, "status": "failed", "error": repr(error)}
+            results.append(result)
+            emit_progress(kind="write", step="ingest_workbooks", duration=time.perf_counter() - start,
+                          message=f"{result['status']}: {path}, changed sheets: {result.get('changed_sheets')}",
+                          show_process=show_process, file_path=path, status=result["status"])
+        return results
+
+    def remove_workbook(self, path: str) -> bool:
+        """:return: True when the workbook was in the database."""
+        with self.connection:
+            cursor = self.connection.execute("DELETE FROM workbooks WHERE path = ?", (os.path.abspath(path),))
+        return cursor.rowcount > 0
+
+    def get_workbooks(self) -> pd.DataFrame:
+        """:return: the ingested workbooks with their experiment and number of sheets and rows."""
+        return pd.read_sql_query(
+            "SELECT w.experiment, w.path, w.ingested_at, COUNT(s.sheet_id) AS sheets, SUM(s.rows) AS rows, "
+            "SUM(s.error IS NOT NULL) AS failed_sheets FROM workbooks w LEFT JOIN sheets s USING (workbook_id) "
+            "GROUP BY w.workbook_id ORDER BY w.experiment", self.connection)
+
+    def get_constants(self, experiments: List[str] = None) -> pd.DataFrame:
+        """:return: a data frame with a row for every sheet and a column for every constant."""
+        query = "SELECT w.experiment, s.sheet_name, c.name, COALESCE(c.value, c.text_value) AS value " \
+                "FROM constants c JOIN sheets s USING (sheet_id) JOIN workbooks w USING (workbook_id)"
+        parameters = []
+        if experiments is not None:
+            query += f" WHERE w.experiment IN ({', '.join('?' * len(experiments))})"
+            parameters = list(experiments)
+        data_frame = pd.read_sql_query(query, self.connection, params=parameters)
+        return data_frame.pivot(index=["experiment", "sheet_name"], columns="name", values="value")
+
+    @staticmethod
+    def _get_filters(column_names: List[str] = None, experiments: List[str] = None, sample_ids: List[str] = None,
+                     parallels: List[int] = None, day_min: float = None, day_max: float = None) -> (str, list):
+        conditions = []
+        parameters = []
+        for sql_column, values in (("m.column_name", column_names), ("m.experiment", experiments),
+                                   ("m.sample_id", sample_ids), ("m.parallel", parallels)):
+            if values is not None:
+                conditions.append(f"{sql_column} IN ({', '.join('?' * len(values))})")
+                parameters.extend(values)
+        if day_min is not None:
+            conditions.append("m.day >= ?")
+            parameters.append(day_min)
+        if day_max is not None:
+            conditions.append("m.day <= ?")
+            parameters.append(day_max)
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", parameters
+
+    def select(self, column_names: List[str] = None, experiments: List[str] = None, sample_ids: List[str] = None,
+               parallels: List[int] = None, day_min: float = None, day_max: float = None,
+               wide: bool = True) -> pd.DataFrame:
+        """
+        Select the values of all the experiments with the filters.
+
+        :param column_names: the columns, for example ["CO2 [%]", "Ctot_DM [mg C/gDW]"]. All the columns when None.
+        :param experiments: the experiments, all when None.
+        :param sample_ids: the sample IDs, all when None.
+        :param parallels: the parallels, all when None.
+        :param day_min: the minimum Day.
+        :param day_max: the maximum Day.
+        :param wide: a column for every selected column and a row for every measurement, indexed with experiment,
+        sheet_name, sample_id, parallel, row_number and day. Otherwise the long format of the database.
+        :return: the data frame with the values.
+        """
+        where, parameters = self._get_filters(column_names=column_names, experiments=experiments,
+                                              sample_ids=sample_ids, parallels=parallels, day_min=day_min,
+                                              day_max=day_max)
+        data_frame = pd.read_sql_query(
+            "SELECT m.experiment, s.sheet_name, m.sample_id, m.parallel, m.row_number, m.day, m.column_name, "
+            f"COALESCE(m.value, m.text_value) AS value FROM measurements m JOIN sheets s USING (sheet_id){where} "
+            "ORDER BY m.experiment, s.sheet_name, m.row_number", self.connection, params=parameters)
+        if not wide:
+            return data_frame
+        index = ["experiment", "sheet_name", "sample_id", "parallel", "row_number", "day"]
+        # the pivot does not keep rows with an empty index value
+        data_frame[index] = data_frame[index].astype(object).where(data_frame[index].notna(), "")
+        wide_data_frame = data_frame.pivot(index=index, columns="column_name", values="value")
+        if column_names is not None:
+            wide_data_frame = wide_data_frame[[name for name in column_names if name in wide_data_frame.columns]]
+        wide_data_frame.columns.name = None
+        return wide_data_frame
+
+    def aggregate(self, column_name: str, by: List[str] = ("experiment", "sample_id"),
+                  functions: List[str] = ("count", "mean", "min", "max"), experiments: List[str] = None,
+                  sample_ids: List[str] = None, parallels: List[int] = None, day_min: float = None,
+                  day_max: float = None) -> pd.DataFrame:
+        """
+        Aggregate the numbers of a column in the database.
+
+        :param column_name: the column, for example "Ctot_DM [mg C/gDW]".
+        :param by: the groups, of experiment, sheet_name, sample_id, parallel, row_number and day.
+        :param functions: of count, mean, min, max and sum.
+        :return: a data frame with a row for every group and a column for every function.
+        """
+        for name in by:
+            if name not in DIMENSION_COLUMNS:
+                raise ValueError(f"Can not group by {name}, use one of {list(DIMENSION_COLUMNS)}.")
+        for function in functions:
+            if function not in AGGREGATE_FUNCTIONS:
+                raise ValueError(f"Unknown function {function}, use one of {list(AGGREGATE_FUNCTIONS)}.")
+
+        where, parameters = self._get_filters(column_names=[column_name], experiments=experiments,
+                                              sample_ids=sample_ids, parallels=parallels, day_min=day_min,
+                                              day_max=day_max)
+        groups = ", ".join(f"{DIMENSION_COLUMNS[name]} AS {name}" for name in by)
+        aggregates = ", ".join(f"{AGGREGATE_FUNCTIONS[function]}(m.value) AS {function}" for function in functions)
+        query = f"SELECT {groups + ', ' if groups else ''}{aggregates} FROM measurements m " \
+                f"JOIN sheets s USING (sheet_id){where} AND m.value IS NOT NULL"
+        if by:
+            query += f" GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}"
+        data_frame = pd.read_sql_query(query, self.connection, params=parameters)
+        return data_frame.set_index(list(by)) if by else data_frame
+
+
+def main(arguments: List[str] = None) -> List[dict]:
+    from batch_run import find_workbooks
+
+    parser = argparse.ArgumentParser(description="Store the measurements and results of workbooks in a database.")
+    parser.add_argument("database", help="the SQLite file")
+    parser.add_argument("inputs", nargs="+", help="directories or glob patterns of the workbooks")
+    parser.add_argument("--no-calculate", action="store_true", help="store only the measurements and constants")
+    parsed_arguments = parser.parse_args(arguments)
+
+    with ExperimentStore(parsed_arguments.database) as store:
+        return store.ingest_workbooks(find_workbooks(parsed_arguments.inputs),
+                                      calculate=not parsed_arguments.no_calculate, show_process=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,431 @@
+from __future__ import annotations
+
+import functools
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# the recorders that record the stages, empty when the instrumentation is disabled
+_active_recorders: list = []
+
+
+@dataclass
+class StageRecord:
+    """The measurement of one stage of the calculations for one sheet."""
+    stage: str
+    sheet_name: Optional[str]
+    start: float
+    wall_time: float
+    rows: int
+    columns_created: List[str] = field(default_factory=list)
+
+
+class StageReport:
+    """
+    The records of the stages, aggregated per stage and per sheet, with exports as JSON and as trace for a flame
+    graph (the Chrome trace format, which can be opened in chrome://tracing, Perfetto or speedscope).
+    """
+
+    def __init__(self, records: List[StageRecord]):
+        self.records = records
+
+    def per_stage(self) -> Dict[str, dict]:
+        """
+        :return: {stage: {"calls", "wall_time", "rows", "columns_created"}} in the order of the first call.
+        """
+        dict_stages = {}
+        for record in self.records:
+            stage = dict_stages.setdefault(record.stage, {"calls": 0, "wall_time": 0.0, "rows": 0,
+                                                          "columns_created": 0})
+            stage["calls"] += 1
+            stage["wall_time"] += record.wall_time
+            stage["rows"] += record.rows
+            stage["columns_created"] += len(record.columns_created)
+        return dict_stages
+
+    def per_sheet(self) -> Dict[str, Dict[str, float]]:
+        """
+        :return: {sheet_name: {stage: wall_time}}
+        """
+        dict_sheets = {}
+        for record in self.records:
+            dict_stages = dict_sheets.setdefault(str(record.sheet_name), {})
+            dict_stages[record.stage] = dict_stages.get(record.stage, 0.0) + record.wall_time
+        return dict_sheets
+
+    def to_dict(self) -> dict:
+        return {"per_stage": self.per_stage(), "per_sheet": self.per_sheet(),
+                "records": [asdict(record) for record in self.records]}
+
+    def to_json(self, path: str = None) -> str:
+        """
+        :param path: when given the JSON is also saved in this file.
+        :return: the report as JSON string.
+        """
+        json_string = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, "w") as file:
+                file.write(json_string)
+        return json_string
+
+    def to_chrome_trace(self, path: str = None) -> dict:
+        """
+        Export the records as complete events of the Chrome trace format. Every sheet is a thread, so the stages of
+        one sheet are on one row of the flame graph.
+
+        :param path: when given the trace is also saved in this JSON file.
+        :return: {"traceEvents": [...]}
+        """
+        sheet_names = list(dict.fromkeys(str(record.sheet_name) for record in self.records))
+        trace_events = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread_id,
+                         "args": {"name": sheet_name}}
+                        for thread_id, sheet_name in enumerate(sheet_names)]
+        trace_events += [{"name": record.stage, "cat": "calculations", "ph": "X",
+                          "ts": record.start * 1e6, "dur": record.wall_time * 1e6,
+                          "pid": os.getpid(), "tid": sheet_names.index(str(record.sheet_name)),
+                          "args": {"rows": record.rows, "columns_created": record.columns_created}}
+                         for record in self.records]
+        trace = {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+        if path is not None:
+            with open(path, "w") as file:
+                json.dump(trace, file)
+        return trace
+
+
+class Recorder:
+    """
+    The base class of the recorders. While a recorder is active (in the with block) every instrumented stage calls
+    start_stage before and end_stage after the stage.
+    """
+
+    def __enter__(self):
+        _active_recorders.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        _active_recorders.remove(self)
+
+    def start_stage(self, stage: str, sheet_name: Optional[str], data_frame: Optional[pd.DataFrame]):
+        """:return: a token which is given to end_stage."""
+        raise NotImplementedError
+
+    def end_stage(self, token) -> None:
+        raise NotImplementedError
+
+
+class StageRecorder(Recorder):
+    """
+    Records the wall time, the rows and the created columns of the stages while it is active. Without an active
+    recorder the instrumented stages only check one global list, so the instrumentation costs nothing when it is
+    disabled.
+
+    Example:
+        with StageRecorder() as recorder:
+            RunDataFrameCalculationsForOneDataFrame(data_frame=data_frame, sheet_name="GT1.1").run_moles_produced()
+        recorder.report().to_json("timings.json")
+    """
+
+    def __init__(self):
+        self.records: List[StageRecord] = []
+        self._start = time.perf_counter()
+
+    def elapsed(self) -> float:
+        """The seconds since the recorder is made."""
+        return time.perf_counter() - self._start
+
+    def start_stage(self, stage: str, sheet_name: Optional[str], data_frame: Optional[pd.DataFrame]):
+        columns_before = set(data_frame.columns) if data_frame is not None else set()
+        return stage, sheet_name, data_frame, columns_before, self.elapsed()
+
+    def end_stage(self, token) -> None:
+        stage, sheet_name, data_frame, columns_before, start = token
+        self.add_record(StageRecord(
+            stage=stage, sheet_name=sheet_name, start=start, wall_time=self.elapsed() - start,
+            rows=len(data_frame) if data_frame is not None else 0,
+            columns_created=[column for column in data_frame.columns if column not in columns_before]
+            if data_frame is not None else []))
+
+    def add_record(self, record: StageRecord) -> None:
+        self.records.append(record)
+
+    def report(self) -> StageReport:
+        return StageReport(records=list(self.records))
+
+
+def get_current_rss() -> Optional[int]:
+    """The resident set size (RSS) of the process in bytes, None when it can not be measured."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def get_peak_rss() -> Optional[int]:
+    """The peak resident set size of the process in bytes, None when it can not be measured."""
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return max_rss if os.uname().sysname == "Darwin" else max_rss * 1024
+    if psutil is not None:
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, "peak_wset", memory_info.rss)
+    return None
+
+
+def get_data_frames_memory_usage(dict_data_frames: Dict[str, pd.DataFrame]) -> Dict[str, int]:
+    """
+    :param dict_data_frames: {sheet_name: pd.DataFrame}, for example ExcelManager.dict_panda_data_frames
+    :return: {sheet_name: bytes of the data frame with DataFrame.memory_usage(deep=True)}
+    """
+    return {sheet_name: int(data_frame.memory_usage(deep=True).sum())
+            for sheet_name, data_frame in dict_data_frames.items()}
+
+
+@dataclass
+class MemoryRecord:
+    """The memory measurement of one stage for one sheet. All the memory is in bytes."""
+    stage: str
+    sheet_name: Optional[str]
+    rss_before: Optional[int]
+    rss_after: Optional[int]
+    rss_delta: Optional[int]
+    peak_rss: Optional[int]
+    traced_peak: Optional[int]
+    data_frame_memory: Optional[int]
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when the RSS after a stage is above the memory budget. The report is in the attribute report."""
+
+    def __init__(self, message: str, report: dict):
+        super().__init__(message)
+        self.report = report
+
+
+class MemoryRecorder(Recorder):
+    """
+    Records the memory of the stages while it is active: the RSS before and after the stage, the peak RSS of the
+    process, the peak of the Python allocations during the stage (tracemalloc) and the memory of the data frame of
+    the stage (DataFrame.memory_usage(deep=True)).
+
+    With a memory budget the run is stopped with MemoryBudgetExceeded after the first stage which ends with an RSS
+    above the budget, with the report of all the stages until then.
+
+    Example:
+        with MemoryRecorder(memory_budget=4 * 1024 ** 3) as memory_recorder:
+            manager.load_workbook()
+            ...
+            memory_recorder.record_data_frames(manager.get_dict_panda_data_frames())
+        memory_recorder.report_to_json("memory.json")
+    """
+
+    def __init__(self, memory_budget: int = None, trace_python_allocations: bool = True,
+                 number_of_top_allocators: int = 10, deep_data_frame_memory: bool = True):
+        """
+        :param memory_budget: the maximum RSS in bytes, None for no budget.
+        :param trace_python_allocations: trace the Python allocations with tracemalloc. This makes the run slower.
+        :param number_of_top_allocators: the number of lines with the most allocated memory in the report.
+        :param deep_data_frame_memory: measure the memory of the data frame of every stage, including the objects.
+        """
+        self.memory_budget = memory_budget
+        self.trace_python_allocations = trace_python_allocations
+        self.number_of_top_allocators = number_of_top_allocators
+        self.deep_data_frame_memory = deep_data_frame_memory
+
+        self.records: List[MemoryRecord] = []
+        self.dict_data_frames_memory: Dict[str, int] = {}
+        self._started_tracemalloc = False
+
+    def __enter__(self) -> "MemoryRecorder":
+        if self.trace_python_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        super().__exit__(exc_type, exc_value, traceback)
+        if self._started_tracemalloc:
+            self.top_allocators = self.get_top_allocators()
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def start_stage(self, stage: str, sheet_name: Optional[str], data_frame: Optional[pd.DataFrame]):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        return stage, sheet_name, data_frame, get_current_rss()
+
+    def end_stage(self, token) -> None:
+        stage, sheet_name, data_frame, rss_before = token
+        rss_after = get_current_rss()
+        data_frame_memory = None
+        if data_frame is not None:
+            data_frame_memory = int(data_frame.memory_usage(deep=self.deep_data_frame_memory).sum())
+
+        self.records.append(MemoryRecord(
+            stage=stage, sheet_name=sheet_name, rss_before=rss_before, rss_after=rss_after,
+            rss_delta=rss_after - rss_before if rss_after is not None and rss_before is not None else None,
+            peak_rss=get_peak_rss(),
+            traced_peak=tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None,
+            data_frame_memory=data_frame_memory))
+
+        if self.memory_budget is not None and rss_after is not None and rss_after > self.memory_budget:
+            report = self.report()
+            raise MemoryBudgetExceeded(
+                f"The memory budget of {self.memory_budget / 1024 ** 2:.1f} MB is exceeded after stage {stage} "
+                f"(sheet {sheet_name}): RSS is {rss_after / 1024 ** 2:.1f} MB.\n{self.format_report(report)}",
+                report=report)
+
+    def record_data_frames(self, dict_data_frames: Dict[str, pd.DataFrame]) -> Dict[str, int]:
+        """
+        Record the memory of the data frames of all the sheets, for example ExcelManager.dict_panda_data_frames.
+
+        :return: {sheet_name: bytes}
+        """
+        self.dict_data_frames_memory.update(get_data_frames_memory_usage(dict_data_frames))
+        return self.dict_data_frames_memory
+
+    def get_top_allocators(self) -> List[dict]:
+        """
+        :return: [{"location": "file:line", "size": bytes, "count": number of blocks}] of the lines with the most
+        allocated memory that is still in use, empty when tracemalloc is not tracing.
+        """
+        if getattr(self, "top_allocators", None) is not None and not tracemalloc.is_tracing():
+            return self.top_allocators
+        if not tracemalloc.is_tracing():
+            return []
+        statistics = tracemalloc.take_snapshot().statistics("lineno")[:self.number_of_top_allocators]
+        return [{"location": f"{statistic.traceback[0].filename}:{statistic.traceback[0].lineno}",
+                 "size": statistic.size, "count": statistic.count} for statistic in statistics]
+
+    def report(self) -> dict:
+        """
+        :return: {"stages": [...], "per_stage": {stage: {"max_rss_after", "max_rss_delta", "max_traced_peak"}},
+        "data_frames": {sheet_name: bytes}, "peak_rss", "top_allocators": [...]}
+        """
+        per_stage = {}
+        for record in self.records:
+            stage = per_stage.setdefault(record.stage, {"max_rss_after": None, "max_rss_delta": None,
+                                                        "max_traced_peak": None})
+            for key, value in [("max_rss_after", record.rss_after), ("max_rss_delta", record.rss_delta),
+                               ("max_traced_peak", record.traced_peak)]:
+                if value is not None and (stage[key] is None or value > stage[key]):
+                    stage[key] = value
+
+        return {"stages": [asdict(record) for record in self.records], "per_stage": per_stage,
+                "data_frames": dict(self.dict_data_frames_memory), "peak_rss": get_peak_rss(),
+                "memory_budget": self.memory_budget, "top_allocators": self.get_top_allocators()}
+
+    @staticmethod
+    def format_report(report: dict) -> str:
+        """A readable text of the report, with the stages with the largest RSS increase first."""
+        def megabytes(value) -> str:
+            return "-" if value is None else f"{value / 1024 ** 2:.1f} MB"
+
+        lines = ["stages (largest RSS increase first):"]
+        for record in sorted(report["stages"], key=lambda record: record["rss_delta"] or 0, reverse=True)[:10]:
+            lines.append(f"  {record['stage']} ({record['sheet_name']}): delta {megabytes(record['rss_delta'])}, "
+                         f"after {megabytes(record['rss_after'])}, traced peak {megabytes(record['traced_peak'])}")
+        if report["data_frames"]:
+            lines.append("data frames:")
+            for sheet_name, size in sorted(report["data_frames"].items(), key=lambda item: -item[1]):
+                lines.append(f"  {sheet_name}: {megabytes(size)}")
+        if report["top_allocators"]:
+            lines.append("top allocators:")
+            for allocator in report["top_allocators"]:
+                lines.append(f"  {allocator['location']}: {megabytes(allocator['size'])}")
+        return "\n".join(lines)
+
+    def report_to_json(self, path: str = None) -> str:
+        """
+        :param path: when given the JSON is also saved in this file.
+        :return: the report as JSON string.
+        """
+        json_string = json.dumps(self.report(), indent=2)
+        if path is not None:
+            with open(path, "w") as file:
+                file.write(json_string)
+        return json_string
+
+
+def get_active_recorder() -> Optional[Recorder]:
+    """The innermost active recorder, None when the instrumentation is disabled."""
+    return _active_recorders[-1] if _active_recorders else None
+
+
+def get_active_recorders() -> list:
+    return list(_active_recorders)
+
+
+@contextmanager
+def record_block(stage: str, sheet_name: str = None, data_frame: pd.DataFrame = None):
+    """
+    Record a block of code as stage with the active recorders, for example the load of a workbook.
+
+    Example:
+        with record_block("load_workbook_values"):
+            workbook = load_workbook(filename=file_path, data_only=True)
+    """
+    if not _active_recorders:
+        yield
+        return
+
+    tokens = [(recorder, recorder.start_stage(stage, sheet_name, data_frame)) for recorder in list(_active_recorders)]
+    try:
+        yield
+    finally:
+        for recorder, token in reversed(tokens):
+            recorder.end_stage(token)
+
+
+def instrumented_stage(function):
+    """
+    Decorator for the stages of RunDataFrameCalculationsForOneDataFrame. When a recorder is active the stage is
+    recorded with self.data_frame and self.sheet_name.
+    """
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        if not _active_recorders:
+            return function(self, *args, **kwargs)
+
+        with record_block(function.__name__, sheet_name=getattr(self, "sheet_name", None),
+                          data_frame=self.data_frame):
+            return function(self, *args, **kwargs)
+
+    return wrapper
+
+
+def instrumented_pass(function):
+    """
+    Decorator for the passes of the validation classes. When a recorder is active the pass is recorded with the
+    name of the method, over all the sheets.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _active_recorders:
+            return function(*args, **kwargs)
+
+        with record_block(function.__qualname__):
+            return function(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,88 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+import types
+from typing import List
+
+
+class LazyModule(types.ModuleType):
+    """
+    A module which is imported at the first use of one of its attributes.
+
+    The heavy dependencies (pandas, numpy, openpyxl) take most of the start-up time of the package, while a command
+    like the check of a single workbook does not need all of them. After the first use the attributes of the real
+    module are copied to this module, so the later uses are as fast as with a normal import.
+
+    Example:
+        pd = lazy_import("pandas")
+
+        def load(path):
+            return pd.read_csv(path)  # pandas is imported here
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_lazy_module"] = module
+            self.__dict__.update(module.__dict__)
+        return module
+
+    def __getattr__(self, name: str):
+        # only called for the attributes which are not in __dict__, so before the module is loaded
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    :param name: the name of the module, for example "pandas" or "openpyxl.utils.dataframe".
+    :return: the module when it is imported already, otherwise a LazyModule which imports it at the first use.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
+# the modules of which the import must stay fast, for the command line and the quick checks of a workbook
+CORE_MODULES = ["excel_manager", "run_data_frame_calculations", "validation_input_data.validate_input_data",
+                "workbook_pipeline", "batch_run"]
+HEAVY_MODULES = ["pandas", "numpy", "openpyxl"]
+
+
+def measure_import_time(module_names: List[str] = None, repeat: int = 3) -> dict:
+    """
+    Measure the import time of modules in a new Python process, so the modules which are imported already in this
+    process do not count.
+
+    :param module_names: the modules to import, by default CORE_MODULES.
+    :param repeat: the number of new processes, the fastest import is returned.
+    :return: {"seconds": the fastest import time, "heavy_modules_loaded": [the HEAVY_MODULES which were imported]}
+    """
+    if module_names is None:
+        module_names = CORE_MODULES
+    code = ("import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            + "".join(f"import {module_name}\n" for module_name in module_names)
+            + "seconds = time.perf_counter() - start\n"
+            f"print(json.dumps({{'seconds': seconds, 'heavy_modules_loaded': "
+            f"[name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))\n")
+
+    measurements = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        measurements.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return min(measurements, key=lambda measurement: measurement["seconds"])
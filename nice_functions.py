@@ -1,9 +1,16 @@
-from typing import Tuple, Optional
+from __future__ import annotations
 
-import openpyxl
-import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.utils import get_column_letter
+import bisect
+import os
+import weakref
+from collections import OrderedDict
+from typing import Tuple, Optional, Dict, List, Iterable
+
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+openpyxl = lazy_import("openpyxl")
+openpyxl_utils = lazy_import("openpyxl.utils")
 
 
 class NiceExcelFunction:
@@ -57,6 +64,9 @@ class NiceExcelFunction:
         """
         Finds the index (row and column) in a sheet of an Excel file or workbook for a specific string.
 
+        The cells are looked up in the cached WorkbookValueIndex of the file, so only the first call for a file reads
+        the workbook. Like a scan over the rows of the sheet, only the first max_iterations cells are searched.
+
         Args:
             excel_file_path (str): Path to the Excel file.
             sheet_name (str): Name of the sheet to search in.
@@ -66,23 +76,18 @@ class NiceExcelFunction:
         Returns:
             Tuple[int, int]: Row and column indices of the found cell, or (None, None) if the search string is not found.
         """
-        workbook = load_workbook(excel_file_path)
-        sheet = workbook[sheet_name]
+        value_index = WorkbookValueIndex.for_file(excel_file_path)
+        max_column = value_index.dict_sheet_name_max_column[sheet_name]
 
-        iteration_count = 0
+        for found_sheet_name, row, column in value_index.find(search_string):
+            if found_sheet_name != sheet_name:
+                continue
+            # the number of cells that the scan over the rows of the sheet has checked before this cell
+            if (row - 1) * max_column + (column - 1) < max_iterations:
+                return row, column
+            break
 
-        # Iterate over all cells in the sheet
-        for row in sheet.iter_rows():
-            for cell in row:
-                if cell.value == search_string:
-                    # Return the row and column indices of the found cell
-                    return cell.row, cell.column
-
-                iteration_count += 1
-
-                if iteration_count >= max_iterations:
-                    # Reached the maximum number of iterations
-                    return None, None
+        return None, None
 
     @staticmethod
     def find_column_name_excel_index_based_on_column_name_string_in_given_row(workbook,
@@ -106,28 +111,14 @@ class NiceExcelFunction:
                 ValueError: If the search string is not found in the header row.
             """
 
-        # Load the workbook and select the sheet
-        sheet = workbook[sheet_name]
-
-        # Get the maximum column index
-        max_column = sheet.max_column
-
-        # Iterate over the cells in the header row
-        for column in range(1, max_column + 1):
-            cell = sheet.cell(row=header_row, column=column)
-            cell_value = str(cell.value)
-
-            # Check if the search string is found in the cell value
-            if search_string == cell_value:
-                return get_column_letter(cell.column)
-
-        # If the search string is not found, raise an exception
-        raise ValueError(f"Search string '{search_string}' not found in the header row.")
+        return HeaderIndex.for_sheet(workbook=workbook, sheet_name=sheet_name,
+                                     header_row=header_row).get_column_letter(search_string)
 
     @staticmethod
     def get_cell_value_pandas(file_path, sheet_name, cell) -> float | int:
         """
-            Get the value of a specific cell in an Excel file using pandas.
+            Get the value of a specific cell in an Excel file, the value of a formula instead of the formula. The file
+            is opened in read-only mode and only the rows until the cell are read, see get_cell_values.
 
             Parameters:
                 - file_path (str): The path to the Excel file.
@@ -143,9 +134,9 @@ class NiceExcelFunction:
                                                                  cell='A1')
                 # The cell_value variable will contain the value of cell A1 in Sheet1.
             """
-        df = pd.read_excel(file_path, sheet_name=sheet_name)
-        value = df.loc[cell].values[0]
-        return value
+        # like pandas, the values of the formulas are read instead of the formulas
+        return NiceExcelFunction.get_cell_values(file_path=file_path, references=[(sheet_name, cell)],
+                                                 data_only=True)[(sheet_name, cell)]
 
     @staticmethod
     def get_cell_value_openpyxl(file_path, sheet_name, cell) -> float | int:
@@ -166,10 +157,389 @@ class NiceExcelFunction:
                                                                     cell='A1')
                 # The cell_value variable will contain the value of cell A1 in Sheet1.
             """
-        wb = load_workbook(filename=file_path)
-        sheet = wb[sheet_name]
-        value = sheet[cell].value
-        return value
+        return NiceExcelFunction.get_cell_values(file_path=file_path, references=[(sheet_name, cell)])[(sheet_name, cell)]
+
+    @staticmethod
+    def get_cell_values(file_path, references: Iterable[Tuple[str, str]], data_only: bool = False) -> dict:
+        """
+            Get the values of many cells and ranges of an Excel file at once. The file is opened once in read-only
+            mode and only the sheets with references are read.
+
+            Parameters:
+                - file_path (str): The path to the Excel file.
+                - references (iterable of tuples): [(sheet_name, cell or range)], e.g. [('GT1.1', 'D1'),
+                  ('GT1.1', 'C1:D7')].
+                - data_only (bool, optional): Get the values of the formulas instead of the formulas.
+
+            Returns:
+                dict: {(sheet_name, reference): value}. The value of a range is a tuple with a tuple of values for
+                every row.
+
+            Example:
+                values = NiceExcelFunction.get_cell_values(file_path='path/to/excel_file.xlsx',
+                                                           references=[('GT1.1', 'D1'), ('GT1.1', 'D2')])
+                # values[('GT1.1', 'D1')] will contain the value of cell D1 in sheet GT1.1.
+            """
+        with WorkbookReader(file_path=file_path, data_only=data_only) as workbook_reader:
+            return workbook_reader.get_cell_values(references=references)
+
+
+class WorkbookReader:
+    """
+    Keeps an Excel file open in read-only mode to get the values of many cells and ranges with few reads.
+
+    Use it as context manager to reuse the opened file for many batches:
+        with WorkbookReader(file_path) as workbook_reader:
+            constants = workbook_reader.get_cell_values([("GT1.1", "D1:D7"), ("GT1.2", "D1:D7")])
+    """
+
+    def __init__(self, file_path, data_only: bool = False):
+        """
+        :param file_path: the path to the Excel file.
+        :param data_only: when True the values of the formulas are read instead of the formulas.
+        """
+        self.file_path = file_path
+        self.workbook = openpyxl.load_workbook(filename=file_path, read_only=True, data_only=data_only)
+
+    def __enter__(self) -> "WorkbookReader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.workbook.close()
+
+    def get_cell_values(self, references: Iterable[Tuple[str, str]]) -> dict:
+        """
+        Get the values of many cells and ranges. Every sheet is read once, in one pass over the rows that contain
+        the references of the sheet.
+
+        :param references: [(sheet_name, cell or range)], e.g. [('GT1.1', 'D1'), ('GT1.1', 'C1:D7')].
+        :return: {(sheet_name, reference): value}. The value of a range is a tuple with a tuple of values for every
+        row.
+        """
+        dict_sheet_name_references: Dict[str, Dict[str, Tuple[int, int, int, int]]] = {}
+        for sheet_name, reference in references:
+            min_column, min_row, max_column, max_row = openpyxl_utils.range_boundaries(reference)
+            dict_sheet_name_references.setdefault(sheet_name, {})[reference] = \
+                (min_column, min_row, max_column, max_row)
+
+        dict_values = {}
+        for sheet_name, dict_references in dict_sheet_name_references.items():
+            sheet = self.workbook[sheet_name]
+            # the bounding box of all the references of the sheet
+            box_min_column = min(boundaries[0] for boundaries in dict_references.values())
+            box_min_row = min(boundaries[1] for boundaries in dict_references.values())
+            box_max_column = max(boundaries[2] for boundaries in dict_references.values())
+            box_max_row = max(boundaries[3] for boundaries in dict_references.values())
+
+            rows = list(sheet.iter_rows(min_row=box_min_row, max_row=box_max_row, min_col=box_min_column,
+                                        max_col=box_max_column, values_only=True))
+            # rows after the last filled row of the sheet are not returned in read-only mode
+            empty_row = (None,) * (box_max_column - box_min_column + 1)
+            rows += [empty_row] * (box_max_row - box_min_row + 1 - len(rows))
+
+            for reference, (min_column, min_row, max_column, max_row) in dict_references.items():
+                block = tuple(tuple(rows[row - box_min_row][min_column - box_min_column:
+                                                            max_column - box_min_column + 1])
+                              for row in range(min_row, max_row + 1))
+                if ":" in reference:
+                    dict_values[(sheet_name, reference)] = block
+                else:
+                    dict_values[(sheet_name, reference)] = block[0][0]
+
+        return dict_values
+
+
+class HeaderIndex:
+    """
+    An index of the column names in the header row of a sheet, to look up the column letter or index of a column name
+    without scanning the header row again.
+
+    The index is built once for every (workbook, sheet, header_row) with HeaderIndex.for_sheet, after that a lookup
+    does not read the header row. It is built again when the sheet is replaced or when columns are added, which is
+    checked with the id and the max_column of the sheet. Code which changes a name in the header row in place must
+    call HeaderIndex.invalidate for the sheet.
+    """
+    _cache: "weakref.WeakKeyDictionary[object, Dict[Tuple[str, int], HeaderIndex]]" = weakref.WeakKeyDictionary()
+
+    def __init__(self, sheet, header_row: int):
+        """
+        :param sheet: the worksheet of openpyxl.
+        :param header_row: the row index of the header row.
+        """
+        self.header_row = header_row
+        self._sheet_id = id(sheet)
+        self._max_column = sheet.max_column
+
+        self.dict_column_name_index: Dict[str, int] = {}
+        for column_index, value in enumerate(self._read_header(sheet), start=1):
+            # the first column with the name is used, like the scan over the header row did.
+            self.dict_column_name_index.setdefault(str(value), column_index)
+
+        self.dict_column_name_letter: Dict[str, str] = {column_name: openpyxl_utils.get_column_letter(column_index)
+                                                        for column_name, column_index
+                                                        in self.dict_column_name_index.items()}
+
+    @classmethod
+    def for_sheet(cls, workbook, sheet_name: str, header_row: int) -> "HeaderIndex":
+        """
+        Get the cached header index of a sheet, or build it when there is none or when the sheet is modified.
+
+        Parameters:
+            - workbook (Workbook): The workbook containing the sheet.
+            - sheet_name (str): The name of the sheet.
+            - header_row (int): The row index of the header row.
+
+        Returns:
+            HeaderIndex: The header index of the sheet.
+        """
+        sheet = workbook[sheet_name]
+        dict_header_indexes = cls._cache.setdefault(workbook, {})
+        header_index = dict_header_indexes.get((sheet_name, header_row))
+
+        if header_index is None or header_index.is_outdated(sheet):
+            header_index = cls(sheet=sheet, header_row=header_row)
+            dict_header_indexes[(sheet_name, header_row)] = header_index
+
+        return header_index
+
+    @classmethod
+    def invalidate(cls, workbook, sheet_name: str = None) -> None:
+        """
+        Remove the cached header indexes of a workbook, or only of one sheet of the workbook.
+
+        Parameters:
+            - workbook (Workbook): The workbook.
+            - sheet_name (str, optional): The name of the sheet. When None, all sheets of the workbook are removed.
+        """
+        if sheet_name is None:
+            cls._cache.pop(workbook, None)
+            return
+
+        dict_header_indexes = cls._cache.get(workbook, {})
+        for key in [key for key in dict_header_indexes if key[0] == sheet_name]:
+            del dict_header_indexes[key]
+
+    def _read_header(self, sheet) -> tuple:
+        return next(sheet.iter_rows(min_row=self.header_row, max_row=self.header_row, min_col=1,
+                                    max_col=sheet.max_column, values_only=True), ())
+
+    def is_outdated(self, sheet) -> bool:
+        return id(sheet) != self._sheet_id or sheet.max_column != self._max_column
+
+    def get_column_letter(self, column_name: str) -> str:
+        """
+        Get the Excel column letter of a column name.
+
+        Raises:
+            ValueError: If the column name is not found in the header row.
+        """
+        try:
+            return self.dict_column_name_letter[column_name]
+        except KeyError:
+            raise ValueError(f"Search string '{column_name}' not found in the header row.") from None
+
+    def get_column_index(self, column_name: str) -> int:
+        """
+        Get the Excel column index (starting with 1) of a column name.
+
+        Raises:
+            ValueError: If the column name is not found in the header row.
+        """
+        try:
+            return self.dict_column_name_index[column_name]
+        except KeyError:
+            raise ValueError(f"Search string '{column_name}' not found in the header row.") from None
+
+    def get_column_letters(self, column_names: List[str]) -> Dict[str, str]:
+        """
+        Get the Excel column letters of many column names at once.
+
+        Returns:
+            dict[str, str]: {column_name: column letter}
+
+        Raises:
+            ValueError: If one or more column names are not found in the header row.
+        """
+        missing_column_names = [column_name for column_name in column_names
+                                if column_name not in self.dict_column_name_letter]
+        if missing_column_names:
+            raise ValueError(f"Search strings {missing_column_names} not found in the header row.")
+
+        return {column_name: self.dict_column_name_letter[column_name] for column_name in column_names}
+
+    def get_column_indexes(self, column_names: List[str]) -> Dict[str, int]:
+        """
+        Get the Excel column indexes of many column names at once.
+
+        Returns:
+            dict[str, int]: {column_name: column index}
+
+        Raises:
+            ValueError: If one or more column names are not found in the header row.
+        """
+        missing_column_names = [column_name for column_name in column_names
+                                if column_name not in self.dict_column_name_index]
+        if missing_column_names:
+            raise ValueError(f"Search strings {missing_column_names} not found in the header row.")
+
+        return {column_name: self.dict_column_name_index[column_name] for column_name in column_names}
+
+
+class WorkbookValueIndex:
+    """
+    An index of all the cell values of a workbook file, to locate anchors (like the table header and the names of the
+    constants) with a dictionary lookup instead of scanning the sheets again.
+
+    The index is built in one streaming (read-only) pass over the workbook and maps every value to the positions
+    (sheet_name, row, column) where it is, in the order of the sheets and of the rows. By default only the strings are
+    indexed, because the anchors are texts and the measurements would make the index as large as the workbook. The
+    indexes are cached per file with WorkbookValueIndex.for_file and built again when the file is changed on disk.
+    """
+    # the number of workbook files of which the index is kept in the cache
+    max_cached_files: int = 8
+    _cache: "OrderedDict[str, WorkbookValueIndex]" = OrderedDict()
+
+    def __init__(self, excel_file_path: str, data_only: bool = False, value_types: Tuple[type, ...] = (str,)):
+        """
+        :param excel_file_path: the path to the Excel file.
+        :param data_only: when True the values of the formulas are indexed, otherwise the formulas themselves.
+        :param value_types: the types of the values which are indexed, for example (str, float) to find numbers too.
+        """
+        self.excel_file_path = excel_file_path
+        self.data_only = data_only
+        self.value_types = tuple(value_types)
+        self.file_signature = self.get_file_signature(excel_file_path)
+
+        self.dict_value_positions: Dict[object, List[Tuple[str, int, int]]] = {}
+        self.dict_sheet_name_max_column: Dict[str, int] = {}
+
+        workbook = openpyxl.load_workbook(excel_file_path, read_only=True, data_only=data_only)
+        try:
+            for sheet in workbook.worksheets:
+                max_column = 0
+                for row in sheet.iter_rows():
+                    for cell in row:
+                        value = getattr(cell, "value", None)
+                        if value is None:
+                            continue
+                        max_column = max(max_column, cell.column)
+                        if isinstance(value, self.value_types):
+                            self.dict_value_positions.setdefault(value, []).append(
+                                (sheet.title, cell.row, cell.column))
+                # the dimension of the sheet, like the scan over the rows of a loaded sheet uses
+                self.dict_sheet_name_max_column[sheet.title] = max(sheet.max_column or 0, max_column, 1)
+        finally:
+            workbook.close()
+
+        self._sorted_string_values = sorted(value for value in self.dict_value_positions if isinstance(value, str))
+
+    @staticmethod
+    def get_file_signature(excel_file_path: str) -> Tuple[int, int]:
+        status = os.stat(excel_file_path)
+        return status.st_mtime_ns, status.st_size
+
+    @classmethod
+    def for_file(cls, excel_file_path: str, data_only: bool = False,
+                 value_types: Tuple[type, ...] = (str,)) -> "WorkbookValueIndex":
+        """
+        Get the cached value index of a workbook file, or build it when there is none or when the file is changed.
+
+        Parameters:
+            - excel_file_path (str): The path to the Excel file.
+            - data_only (bool, optional): Index the values of the formulas instead of the formulas. Defaults to False.
+            - value_types (tuple, optional): The types of the values which are indexed. Defaults to (str,).
+
+        Returns:
+            WorkbookValueIndex: The value index of the file.
+        """
+        key = f"{os.path.abspath(excel_file_path)}|{data_only}|{[value_type.__name__ for value_type in value_types]}"
+        value_index = cls._cache.get(key)
+
+        if value_index is None or value_index.file_signature != cls.get_file_signature(excel_file_path):
+            value_index = cls(excel_file_path=excel_file_path, data_only=data_only, value_types=value_types)
+            cls._cache[key] = value_index
+            while len(cls._cache) > cls.max_cached_files:
+                cls._cache.popitem(last=False)
+
+        cls._cache.move_to_end(key)
+        return value_index
+
+    @classmethod
+    def invalidate(cls, excel_file_path: str = None) -> None:
+        """
+        Remove the cached value index of a file, or of all the files when excel_file_path is None.
+        """
+        if excel_file_path is None:
+            cls._cache.clear()
+            return
+
+        prefix = f"{os.path.abspath(excel_file_path)}|"
+        for key in [key for key in cls._cache if key.startswith(prefix)]:
+            del cls._cache[key]
+
+    def find(self, value, sheet_name: str = None) -> List[Tuple[str, int, int]]:
+        """
+        Get all the positions of a value.
+
+        Returns:
+            list[tuple[str, int, int]]: [(sheet_name, row, column)], an empty list when the value is not found.
+        """
+        positions = self.dict_value_positions.get(value, [])
+        if sheet_name is None:
+            return list(positions)
+        return [position for position in positions if position[0] == sheet_name]
+
+    def find_first(self, value, sheet_name: str) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Get the first position (in the order of the rows) of a value in a sheet.
+
+        Returns:
+            Tuple[int, int]: Row and column of the cell, or (None, None) if the value is not found.
+        """
+        for found_sheet_name, row, column in self.dict_value_positions.get(value, []):
+            if found_sheet_name == sheet_name:
+                return row, column
+        return None, None
+
+    def find_many(self, values: Iterable, sheet_name: str = None) -> Dict[object, List[Tuple[str, int, int]]]:
+        """
+        Get the positions of many values at once.
+
+        Returns:
+            dict: {value: [(sheet_name, row, column)]}
+        """
+        return {value: self.find(value, sheet_name=sheet_name) for value in values}
+
+    def find_prefix(self, prefix: str, sheet_name: str = None) -> Dict[str, List[Tuple[str, int, int]]]:
+        """
+        Get the positions of all the strings that start with the prefix, for example "P sample" for the two pressure
+        columns.
+
+        Returns:
+            dict: {string: [(sheet_name, row, column)]}
+        """
+        start = bisect.bisect_left(self._sorted_string_values, prefix)
+        dict_positions = {}
+        for value in self._sorted_string_values[start:]:
+            if not value.startswith(prefix):
+                break
+            positions = self.find(value, sheet_name=sheet_name)
+            if positions:
+                dict_positions[value] = positions
+        return dict_positions
+
+    def find_prefixes(self, prefixes: Iterable[str], sheet_name: str = None) \
+            -> Dict[str, Dict[str, List[Tuple[str, int, int]]]]:
+        """
+        Get the positions of the strings for many prefixes at once.
+
+        Returns:
+            dict: {prefix: {string: [(sheet_name, row, column)]}}
+        """
+        return {prefix: self.find_prefix(prefix, sheet_name=sheet_name) for prefix in prefixes}
 
 
 class NicePandaFrameFunctions:
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Optional
+
+from instrumentation import Recorder
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+# the sinks which receive the events, empty when nobody listens
+_sinks: list = []
+
+
+@dataclass
+class ProgressEvent:
+    """
+    One step of the processing of the workbooks.
+
+    kind is "load", "validate", "compute" or "write", step is the name of the method (or the stage) and message is
+    the text which was printed with show_process / print_process before.
+    """
+    kind: str
+    step: str
+    sheet_name: Optional[str] = None
+    rows: Optional[int] = None
+    duration: Optional[float] = None
+    message: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+    details: dict = field(default_factory=dict)
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if self.rows is None or not self.duration:
+            return None
+        return self.rows / self.duration
+
+    def describe(self) -> str:
+        """A readable text of the event, the message when there is one."""
+        if self.message is not None:
+            return self.message
+        text = f"{self.kind} {self.step}"
+        if self.sheet_name is not None:
+            text += f" {self.sheet_name}"
+        if self.rows is not None:
+            text += f": {self.rows} rows"
+        if self.duration is not None:
+            text += f" in {self.duration:.3f}s"
+        if self.rows_per_second is not None:
+            text += f" ({self.rows_per_second:.0f} rows/s)"
+        return text
+
+    def to_dict(self) -> dict:
+        dict_event = asdict(self)
+        dict_event["rows_per_second"] = self.rows_per_second
+        return dict_event
+
+
+class ProgressSink:
+    """The base class of the sinks. A sink gets every emitted event in handle."""
+
+    def handle(self, event: ProgressEvent) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class PrintSink(ProgressSink):
+    """Prints the events, like show_process=True did. This sink is used for the events with show_process=True."""
+
+    def handle(self, event: ProgressEvent) -> None:
+        print(event.describe())
+
+
+class LoggingSink(ProgressSink):
+    """Logs the events with the logging module, with the fields of the event in the extra of the log record."""
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger if logger is not None else logging.getLogger("gas_respiration.progress")
+        self.level = level
+
+    def handle(self, event: ProgressEvent) -> None:
+        self.logger.log(self.level, event.describe(), extra={"progress_event": event.to_dict()})
+
+
+class JsonlSink(ProgressSink):
+    """Writes every event as one JSON line, so a run can be analysed afterwards."""
+
+    def __init__(self, path: str, mode: str = "a"):
+        """
+        :param path: the path of the JSONL file.
+        :param mode: "a" to append to the file, "w" to start a new file.
+        """
+        self.path = path
+        self._file = open(path, mode)
+
+    def handle(self, event: ProgressEvent) -> None:
+        self._file.write(json.dumps(event.to_dict(), default=str) + "\n")
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+
+class MemorySink(ProgressSink):
+    """Collects the events in a list, with a summary of the throughput per step."""
+
+    def __init__(self):
+        self.events: List[ProgressEvent] = []
+
+    def handle(self, event: ProgressEvent) -> None:
+        self.events.append(event)
+
+    def to_data_frame(self) -> pd.DataFrame:
+        return pd.DataFrame([event.to_dict() for event in self.events])
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        :return: {step: {"kind", "events", "rows", "duration", "rows_per_second"}} in the order of the first event.
+        """
+        dict_summary = {}
+        for event in self.events:
+            step = dict_summary.setdefault(event.step, {"kind": event.kind, "events": 0, "rows": 0,
+                                                        "duration": 0.0, "rows_per_second": None})
+            step["events"] += 1
+            step["rows"] += event.rows or 0
+            step["duration"] += event.duration or 0.0
+        for step in dict_summary.values():
+            if step["duration"] > 0:
+                step["rows_per_second"] = step["rows"] / step["duration"]
+        return dict_summary
+
+
+_print_sink = PrintSink()
+
+
+def add_sink(sink: ProgressSink) -> ProgressSink:
+    _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink: ProgressSink) -> None:
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def get_sinks() -> list:
+    return list(_sinks)
+
+
+def emit_progress(kind: str, step: str, sheet_name: str = None, rows: int = None, duration: float = None,
+                  message: str = None, show_process: bool = False, **details) -> Optional[ProgressEvent]:
+    """
+    Send an event to all the sinks. With show_process=True the event is also printed, like before.
+
+    Without sinks and without show_process nothing is made, so the events cost nothing when nobody listens.
+
+    :param kind: "load", "validate", "compute" or "write".
+    :param step: the name of the step, for example the name of the method.
+    :param sheet_name: the sheet of the step.
+    :param rows: the number of rows of the step, for the throughput.
+    :param duration: the seconds of the step.
+    :param message: the text for the print.
+    :param show_process: print the event.
+    :return: the event, None when nobody listens.
+    """
+    if not _sinks and not show_process:
+        return None
+
+    event = ProgressEvent(kind=kind, step=step, sheet_name=sheet_name, rows=rows, duration=duration, message=message,
+                          details=details)
+    for sink in list(_sinks):
+        sink.handle(event)
+    if show_process and _print_sink not in _sinks:
+        _print_sink.handle(event)
+    return event
+
+
+def emit_sheet_progress(kind: str, step: str, sheet_name: str, data_frame: pd.DataFrame, start: float,
+                        message: str = None, show_process: bool = False, **details) -> Optional[ProgressEvent]:
+    """
+    Send the event of one sheet, with the rows of the data frame of the sheet and the seconds since start.
+
+    :param start: the time.perf_counter() at the start of the step.
+    """
+    if not _sinks and not show_process:
+        return None
+    return emit_progress(kind=kind, step=step, sheet_name=sheet_name,
+                         rows=len(data_frame) if data_frame is not None else None,
+                         duration=time.perf_counter() - start, message=message, show_process=show_process, **details)
+
+
+def is_listening() -> bool:
+    """True when there is a sink, to skip the preparation of an event when nobody listens."""
+    return bool(_sinks)
+
+
+class StageEventRecorder(Recorder):
+    """
+    Emits a "compute" event for every instrumented stage of the calculations (see instrumentation.instrumented_stage).
+    The load, validate and write steps emit their events themselves.
+    """
+
+    def start_stage(self, stage: str, sheet_name: Optional[str], data_frame: Optional[pd.DataFrame]):
+        return stage, sheet_name, data_frame, time.perf_counter()
+
+    def end_stage(self, token) -> None:
+        stage, sheet_name, data_frame, start = token
+        if data_frame is None:
+            return
+        emit_progress(kind="compute", step=stage, sheet_name=sheet_name, rows=len(data_frame),
+                      duration=time.perf_counter() - start)
+
+
+@contextmanager
+def progress_sinks(*sinks: ProgressSink, close: bool = True):
+    """
+    Send the events to the sinks in the with block, including the events of the calculation stages.
+
+    Example:
+        collector = MemorySink()
+        with progress_sinks(collector, JsonlSink("progress.jsonl")):
+            manager.load_workbook()
+            ...
+        print(collector.summary())
+
+    :param close: close the sinks at the end, for example the JSONL file.
+    """
+    for sink in sinks:
+        add_sink(sink)
+    try:
+        with StageEventRecorder():
+            yield sinks
+    finally:
+        for sink in sinks:
+            remove_sink(sink)
+            if close:
+                sink.close()
@@ -1,18 +1,31 @@
-import pandas as pd
+from __future__ import annotations
 
 from data_frame_processor import DataFrameProcessor
 from data_frame_calculations import PercentageO2ConsumedAndCO2ProducedAndRatio, \
     MolesProduced, CumulativeProductionGasPhase, CarbonInAqueousPhase, \
     ResultsInterpretations
 from data_frame_calculations_standard_for_gas_respiration_tests import GasComposition, MolGasCompositionCalculations
+from instrumentation import instrumented_stage
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
 
 
 class RunDataFrameCalculationsForOneDataFrame:
     """"Combine all the calculations to do it for one data frame."""
     data_frame: object
 
-    def __init__(self, data_frame: pd.DataFrame):
+    def __init__(self, data_frame: pd.DataFrame, sheet_name: str = None):
+        """
+        :param data_frame: the data frame of the sheet.
+        :param sheet_name: the name of the sheet, used when the stages are recorded with instrumentation.StageRecorder
+        """
         self.data_frame = data_frame
+        self.sheet_name = sheet_name
+        # the output of run_mol_gas_composition_calculation: the moles (rows x before/after sampling x CO2, CH4, O2,
+        # N2) and the total moles of carbon (rows x before/after sampling)
+        self.moles = None
+        self.carbon_total = None
 
         self.get_column_name_date: str = "Date"
         self.get_name_column_time: str = "Time"
@@ -65,10 +78,12 @@ class RunDataFrameCalculationsForOneDataFrame:
         self.create_name_column_Ctot_DM: str = "Ctot_DM [mg C/gDW]"
         self.create_name_column_ratio_O2_CO2: str = "Ratio O2/CO2"
 
+    @instrumented_stage
     def run_data_frame_processor_calculations(self, dayfirst: bool = False):
         DataFrameProcessor.add_day_column(data_frame=self.data_frame, date_column_name=self.get_column_name_date,
                                           time_column_name=self.get_name_column_time, dayfirst=dayfirst)
 
+    @instrumented_stage
     def run_gas_composition_calculations(self,
                                          set_values_gas_composition_first_row: bool = False,
                                          ch4: float = 0, co2: float = 0, o2: float = 0, n2: float = 0,
@@ -96,6 +111,7 @@ class RunDataFrameCalculationsForOneDataFrame:
                                        name_correction_n2=self.create_name_correction_n2
                                        )
 
+    @instrumented_stage
     def run_mol_gases_before_and_after_sampling(self,
                                                 Rgas: float,
                                                 exp_temperature: float,
@@ -119,81 +135,60 @@ class RunDataFrameCalculationsForOneDataFrame:
                                                        name_column=self.create_name_column_mg_as
                                                        )
 
-    def run_mol_gas_composition_calculation(self):
-        # CO2 before
-        MolGasCompositionCalculations.specific_gas_in_moles_before_sampling(data_frame=self.data_frame,
-                                                                            name_column=self.create_name_column_mCO2_b,
-                                                                            name_column_mg_before_or_after=
-                                                                            self.create_name_column_mg_bs,
-                                                                            name_column_specific_gas_corrected=
-                                                                            self.create_name_correction_co2)
-        # CH4 before
-        MolGasCompositionCalculations.specific_gas_in_moles_before_sampling(data_frame=self.data_frame,
-                                                                            name_column=self.create_name_column_mCH4_b,
-                                                                            name_column_mg_before_or_after=
-                                                                            self.create_name_column_mg_bs,
-                                                                            name_column_specific_gas_corrected=
-                                                                            self.create_name_correction_ch4)
-        # O2 before
-        MolGasCompositionCalculations.specific_gas_in_moles_before_sampling(data_frame=self.data_frame,
-                                                                            name_column=self.create_name_column_mO2_b,
-                                                                            name_column_mg_before_or_after=
-                                                                            self.create_name_column_mg_bs,
-                                                                            name_column_specific_gas_corrected=
-                                                                            self.create_name_correction_o2)
-        # N2 before
-        MolGasCompositionCalculations.specific_gas_in_moles_before_sampling(data_frame=self.data_frame,
-                                                                            name_column=self.create_name_column_mN2_b,
-                                                                            name_column_mg_before_or_after=
-                                                                            self.create_name_column_mg_bs,
-                                                                            name_column_specific_gas_corrected=
-                                                                            self.create_name_correction_n2)
-        # total carbon before
-        MolGasCompositionCalculations.carbon_total_moles(data_frame=self.data_frame,
-                                                         name_column=self.create_name_column_CTot_b,
-                                                         name_column_CO2=self.create_name_column_mCO2_b,
-                                                         name_column_CH4=self.create_name_column_mCH4_b)
-
-        # CO2 after
-        MolGasCompositionCalculations.specific_gas_in_moles_before_sampling(data_frame=self.data_frame,
-                                                                            name_column=self.create_name_column_mCO2_a,
-                                                                            name_column_mg_before_or_after=
-                                                                            self.create_name_column_mg_as,
-                                                                            name_column_specific_gas_corrected=
-                                                                            self.create_name_correction_co2)
-        # CH4 after
-        MolGasCompositionCalculations.specific_gas_in_moles_before_sampling(data_frame=self.data_frame,
-                                                                            name_column=self.create_name_column_mCH4_a,
-                                                                            name_column_mg_before_or_after=
-                                                                            self.create_name_column_mg_as,
-                                                                            name_column_specific_gas_corrected=
-                                                                            self.create_name_correction_ch4)
-        # O2 after
-        MolGasCompositionCalculations.specific_gas_in_moles_before_sampling(data_frame=self.data_frame,
-                                                                            name_column=self.create_name_column_mO2_a,
-                                                                            name_column_mg_before_or_after=
-                                                                            self.create_name_column_mg_as,
-                                                                            name_column_specific_gas_corrected=
-                                                                            self.create_name_correction_o2)
-        # N2 after
-        MolGasCompositionCalculations.specific_gas_in_moles_before_sampling(data_frame=self.data_frame,
-                                                                            name_column=self.create_name_column_mN2_a,
-                                                                            name_column_mg_before_or_after=
-                                                                            self.create_name_column_mg_as,
-                                                                            name_column_specific_gas_corrected=
-                                                                            self.create_name_correction_n2)
-        # total carbon before
-        MolGasCompositionCalculations.carbon_total_moles(data_frame=self.data_frame,
-                                                         name_column=self.create_name_column_cTot_a,
-                                                         name_column_CO2=self.create_name_column_mCO2_a,
-                                                         name_column_CH4=self.create_name_column_mCH4_a)
-
-        # reposition the column
-        DataFrameProcessor.replace_position_column(data_frame=self.data_frame,
-                                                   name_replaced_column=self.create_name_column_mg_as,
-                                                   name_column_of_position=self.create_name_column_mCO2_a)
+    @instrumented_stage
+    def run_mol_gas_composition_calculation(self, write_columns: bool = False):
+        """
+        Calculate the moles of CO2, CH4, O2 and N2 and the total carbon, before and after sampling, as one array in
+        self.moles and self.carbon_total, which run_moles_produced uses.
+
+        :param write_columns: also add the ten columns of the moles (mCO2_b ... mCTot_a) to the data frame, for the
+        export to the layout of the workbook which has these columns.
+        """
+        name_columns_moles, name_columns_carbon_total = None, None
+        if write_columns:
+            name_columns_moles = [[self.create_name_column_mCO2_b, self.create_name_column_mCH4_b,
+                                   self.create_name_column_mO2_b, self.create_name_column_mN2_b],
+                                  [self.create_name_column_mCO2_a, self.create_name_column_mCH4_a,
+                                   self.create_name_column_mO2_a, self.create_name_column_mN2_a]]
+            name_columns_carbon_total = [self.create_name_column_CTot_b, self.create_name_column_cTot_a]
+
+        self.moles, self.carbon_total = MolGasCompositionCalculations.gas_moles_before_and_after_sampling(
+            data_frame=self.data_frame,
+            name_columns_mg=[self.create_name_column_mg_bs, self.create_name_column_mg_as],
+            name_columns_specific_gas_corrected=[self.create_name_correction_co2, self.create_name_correction_ch4,
+                                                 self.create_name_correction_o2, self.create_name_correction_n2],
+            name_columns_carbon_gas_corrected=[self.create_name_correction_co2, self.create_name_correction_ch4],
+            name_columns_moles=name_columns_moles, name_columns_carbon_total=name_columns_carbon_total)
+
+        if write_columns:
+            # reposition the column
+            DataFrameProcessor.replace_position_column(data_frame=self.data_frame,
+                                                       name_replaced_column=self.create_name_column_mg_as,
+                                                       name_column_of_position=self.create_name_column_mCO2_a)
 
+    @instrumented_stage
     def run_moles_produced(self):
+        """
+        The moles produced or consumed between two samplings. When run_mol_gas_composition_calculation wrote the
+        columns of the moles, these columns are used (the chunked calculations restore values in them), otherwise
+        its arrays.
+        """
+        if self.moles is not None and self.create_name_column_CTot_b not in self.data_frame.columns:
+            # positions in self.moles: sampling 0 before and 1 after, gas 0 CO2 and 2 O2
+            MolesProduced.moles_produced_between_samplings(
+                data_frame=self.data_frame, name_column=self.create_name_column_mCTot_produced,
+                moles_before=self.carbon_total[:, 0], moles_after=self.carbon_total[:, 1],
+                name_column_flush=self.get_name_column_flush)
+            MolesProduced.moles_produced_between_samplings(
+                data_frame=self.data_frame, name_column=self.create_name_column_oxygen_consumed,
+                moles_before=self.moles[:, 0, 2], moles_after=self.moles[:, 1, 2],
+                name_column_flush=self.get_name_column_flush, sign=-1)
+            MolesProduced.moles_produced_between_samplings(
+                data_frame=self.data_frame, name_column=self.create_name_name_column_carbon_dioxide_produced,
+                moles_before=self.moles[:, 0, 0], moles_after=self.moles[:, 1, 0],
+                name_column_flush=self.get_name_column_flush)
+            return
+
         MolesProduced.total_carbon_produced_moles(data_frame=self.data_frame,
                                                   name_column=self.create_name_column_mCTot_produced,
                                                   name_column_mCTot_b=self.create_name_column_CTot_b,
@@ -213,28 +208,39 @@ class RunDataFrameCalculationsForOneDataFrame:
                                                     name_column_flush=self.get_name_column_flush
                                                     )
 
+    @instrumented_stage
     def run_cumulative_production_in_the_gas_phase(self,
                                                    molar_mass_carbon: float,
                                                    dry_mass_sample: float,
+                                                   first_row_values: dict = None,
                                                    ):
+        """
+        :param first_row_values: {name cumulative column: value of the first row}, 0 for the columns which are not
+        in it. Used in the chunked calculations to continue from the last cumulative value of the previous chunk.
+        """
+        if first_row_values is None:
+            first_row_values = {}
         # oxygen cumulative consumed
         CumulativeProductionGasPhase.cumulative_operation(
             data_frame=self.data_frame,
             name_column_cum=self.create_name_column_oxygen_consumed_cumulative,
             name_column_produced_or_consumed=self.create_name_column_oxygen_consumed,
-            name_column_flush=self.get_name_column_flush)
+            name_column_flush=self.get_name_column_flush,
+            first_row_value=first_row_values.get(self.create_name_column_oxygen_consumed_cumulative, 0))
         # carbon dioxide cumulative consumed
         CumulativeProductionGasPhase.cumulative_operation(
             data_frame=self.data_frame,
             name_column_cum=self.create_name_column_C_dioxide_produced_cumulative,
             name_column_produced_or_consumed=self.create_name_name_column_carbon_dioxide_produced,
-            name_column_flush=self.get_name_column_flush)
+            name_column_flush=self.get_name_column_flush,
+            first_row_value=first_row_values.get(self.create_name_column_C_dioxide_produced_cumulative, 0))
         # total carbon cumulative consumed
         CumulativeProductionGasPhase.cumulative_operation(
             data_frame=self.data_frame,
             name_column_cum=self.create_name_column_C_total_produced_cumulative,
             name_column_produced_or_consumed=self.create_name_column_mCTot_produced,
-            name_column_flush=self.get_name_column_flush)
+            name_column_flush=self.get_name_column_flush,
+            first_row_value=first_row_values.get(self.create_name_column_C_total_produced_cumulative, 0))
 
         # total carbon gas dry mass cumulative
         CumulativeProductionGasPhase.carbon_gas_dry_mass_cumulative(
@@ -245,6 +251,7 @@ class RunDataFrameCalculationsForOneDataFrame:
             dry_mass_sample=dry_mass_sample,
             name_column_flush=self.get_name_column_flush)
 
+    @instrumented_stage
     def run_carbon_in_aqueous_phase(self,
                                     water_volume_in_liters: float,
                                     dry_mass_sample: float
@@ -308,6 +315,7 @@ class RunDataFrameCalculationsForOneDataFrame:
             dry_mass_sample=dry_mass_sample,
         )
 
+    @instrumented_stage
     def run_results_Interpretations(self):
         ResultsInterpretations.total_carbon_dry_matter(
             data_frame=self.data_frame,
@@ -327,3 +335,184 @@ class RunDataFrameCalculationsForOneDataFrame:
             self.create_name_column_CO2_dissolved_between_time_steps_aq,
             name_column_flush=self.get_name_column_flush
         )
+
+
+class RunDataFrameCalculationsInChunks:
+    """
+    Run the calculations of RunDataFrameCalculationsForOneDataFrame on a long sheet in blocks of rows, so only one
+    block is in memory at the same time.
+
+    The calculations which use the previous row (shift(1)), the cumulative values and the Day need values of the rows
+    before the block. These are carried from block to block:
+        - the last calculated row of the previous block, which is put before the next block as row 0 and removed from
+          the result again. Row 0 gets the first row values of the calculations, so the real rows are not changed.
+        - the Day + Time of the first row of the sheet, the reference of Day.
+        - the last cumulative values of the rows without flush (O2 consumed_cum, CO2 produced_cum,
+          mCTot_produced_cum), the start values of the cumulative operations of the next block.
+        - the last value of CO2_produced_aq_cum, the start of the cumulative sum of the next block.
+    The results are equal to the results of the calculations on the whole sheet.
+
+    Example:
+        run = RunDataFrameCalculationsInChunks(Rgas=8314.5, exp_temperature=293.15, volume_headspace=0.961, ...)
+        for data_frame in manager.iter_sheet_table_chunks(...):
+            write(run.calculate_chunk(data_frame))
+    """
+
+    def __init__(self,
+                 Rgas: float,
+                 exp_temperature: float,
+                 volume_headspace: float,
+                 molar_mass_carbon: float,
+                 dry_mass_sample: float,
+                 water_volume_in_liters: float,
+                 first_row_gas_composition: dict = None,
+                 dayfirst: bool = False,
+                 sheet_name: str = None):
+        """
+        :param first_row_gas_composition: the values of set_gas_composition for the first row of the sheet,
+        {"ch4": 0, "co2": 0.03, "o2": 21.90, "n2": 78.07}. The measured values are used when None.
+        :param sheet_name: the name of the sheet, used when the stages are recorded with instrumentation.
+        """
+        self.Rgas = Rgas
+        self.exp_temperature = exp_temperature
+        self.volume_headspace = volume_headspace
+        self.molar_mass_carbon = molar_mass_carbon
+        self.dry_mass_sample = dry_mass_sample
+        self.water_volume_in_liters = water_volume_in_liters
+        self.first_row_gas_composition = first_row_gas_composition
+        self.dayfirst = dayfirst
+        self.sheet_name = sheet_name
+
+        # the state carried from block to block
+        self.number_of_rows_done = 0
+        self.input_dtypes = None
+        self.previous_row = None
+        self.previous_input_row = None
+        self.reference_day_plus_time = None
+        self.dict_last_cumulative_values = {}
+        self.last_aqueous_cumulative_value = None
+
+    def calculate_chunk(self, data_frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Calculate the next block of rows of the sheet.
+
+        :param data_frame: the next rows of the sheet, with the input columns.
+        :return: the calculated rows, with the row numbers in the sheet (starting at 0) as index.
+        """
+        first_chunk = self.previous_row is None
+        number_of_rows = len(data_frame)
+        if number_of_rows == 0:
+            return data_frame
+
+        data_frame = data_frame.reset_index(drop=True)
+        if first_chunk:
+            self.input_dtypes = data_frame.dtypes.to_dict()
+        else:
+            # a block with only empty cells in a column would get other types than the whole sheet
+            data_frame = data_frame.astype(self.input_dtypes, errors="ignore")
+        # before the calculations, which change some input columns (Date and Time become strings)
+        last_input_row = data_frame.iloc[[-1]].copy()
+        if not first_chunk:
+            # row 0 is the last input row of the previous block, its calculated values are restored after every stage
+            data_frame = pd.concat([self.previous_input_row, data_frame], ignore_index=True)
+
+        run = RunDataFrameCalculationsForOneDataFrame(data_frame=data_frame, sheet_name=self.sheet_name)
+
+        run.run_data_frame_processor_calculations(dayfirst=self.dayfirst)
+        if first_chunk:
+            self.reference_day_plus_time = data_frame["Day + Time"].iloc[0]
+        else:
+            data_frame["Day"] = (data_frame["Day + Time"] - self.reference_day_plus_time) / pd.Timedelta(days=1)
+        self._restore_previous_row(data_frame)
+
+        if self.first_row_gas_composition is not None:
+            run.run_gas_composition_calculations(set_values_gas_composition_first_row=first_chunk,
+                                                 **self.first_row_gas_composition)
+        else:
+            run.run_gas_composition_calculations()
+        self._restore_previous_row(data_frame)
+
+        run.run_mol_gases_before_and_after_sampling(Rgas=self.Rgas, exp_temperature=self.exp_temperature,
+                                                    volume_headspace=self.volume_headspace)
+        if first_chunk:
+            # correcting the mg_as for the first measurement
+            data_frame.loc[0, run.create_name_column_mg_as] = data_frame.loc[0, run.create_name_column_mg_bs]
+        self._restore_previous_row(data_frame)
+
+        # the exported rows have the columns of the moles, and the values of row 0 are restored in these columns
+        run.run_mol_gas_composition_calculation(write_columns=True)
+        self._restore_previous_row(data_frame)
+
+        run.run_moles_produced()
+        self._restore_previous_row(data_frame)
+
+        run.run_cumulative_production_in_the_gas_phase(molar_mass_carbon=self.molar_mass_carbon,
+                                                       dry_mass_sample=self.dry_mass_sample,
+                                                       first_row_values=self.dict_last_cumulative_values)
+        self._restore_previous_row(data_frame)
+
+        run.run_carbon_in_aqueous_phase(water_volume_in_liters=self.water_volume_in_liters,
+                                        dry_mass_sample=self.dry_mass_sample)
+        if not first_chunk:
+            self._continue_aqueous_phase(run)
+        self._restore_previous_row(data_frame)
+
+        run.run_results_Interpretations()
+
+        if not first_chunk:
+            data_frame = data_frame.iloc[1:]
+        data_frame.index = pd.RangeIndex(self.number_of_rows_done, self.number_of_rows_done + number_of_rows)
+        self.previous_input_row = last_input_row
+        self._update_state(data_frame=data_frame, run=run, first_chunk=first_chunk)
+        return data_frame
+
+    def _restore_previous_row(self, data_frame: pd.DataFrame) -> None:
+        """Give row 0 again the calculated values of the last row of the previous block."""
+        if self.previous_row is None:
+            return
+        column_names = [column_name for column_name in self.previous_row.index if column_name in data_frame.columns]
+        for column_name in column_names:
+            data_frame.at[0, column_name] = self.previous_row[column_name]
+
+    def _continue_aqueous_phase(self, run: RunDataFrameCalculationsForOneDataFrame) -> None:
+        """The CO2 dissolved of the first row and the cumulative sum continue from the previous block."""
+        data_frame = run.data_frame
+        name_dissolved = run.create_name_column_CO2_dissolved_between_time_steps_aq
+        # row 0 has the changed pressure of partial_pressure_carbon_dioxide, so use the value of the previous block
+        data_frame.loc[1, name_dissolved] = data_frame.loc[1, run.create_name_column_CO2_before_aq_mol] - \
+            self.previous_row[run.create_name_column_CO2_after_aq_mol]
+
+        # the cumulative sum of the previous value and the new values, in the same order as on the whole sheet
+        values = data_frame[name_dissolved].copy()
+        values.iloc[0] = self.last_aqueous_cumulative_value
+        data_frame[run.create_name_column_CO2_produced_aq_cum] = values.cumsum()
+        CarbonInAqueousPhase.dissolved_inorganic_carbon_cumulative(
+            data_frame=data_frame,
+            name_column=run.create_name_column_DIC_cum,
+            column_name_CO2_aq_in_mol_per_m3=run.create_name_column_CO2_produced_aq_cum,
+            dry_mass_sample=self.dry_mass_sample,
+        )
+
+    def _update_state(self, data_frame: pd.DataFrame, run: RunDataFrameCalculationsForOneDataFrame,
+                      first_chunk: bool) -> None:
+        self.number_of_rows_done += len(data_frame)
+        self.previous_row = data_frame.iloc[-1].copy()
+
+        # the cumulative operations continue from the last row without flush, row 0 of the sheet is always the start
+        rows_without_flush = data_frame[data_frame[run.get_name_column_flush] == 0]
+        if first_chunk:
+            rows_without_flush = rows_without_flush[rows_without_flush.index > 0]
+        for column_name in (run.create_name_column_oxygen_consumed_cumulative,
+                            run.create_name_column_C_dioxide_produced_cumulative,
+                            run.create_name_column_C_total_produced_cumulative):
+            if len(rows_without_flush) > 0:
+                self.dict_last_cumulative_values[column_name] = rows_without_flush[column_name].iloc[-1]
+            elif first_chunk:
+                self.dict_last_cumulative_values[column_name] = data_frame[column_name].iloc[0]
+
+        # cumsum skips the empty values, so continue from the last value which is not empty
+        aqueous_cumulative_values = data_frame[run.create_name_column_CO2_produced_aq_cum].dropna()
+        if len(aqueous_cumulative_values) > 0:
+            self.last_aqueous_cumulative_value = aqueous_cumulative_values.iloc[-1]
+        elif first_chunk:
+            self.last_aqueous_cumulative_value = float("nan")
@@ -0,0 +1,291 @@
+"""
+Exchange data frames between processes through shared memory instead of pickling them.
+
+A data frame is written once in a shared memory segment: the numeric and datetime columns as blocks of columns, the
+other columns (the texts like Sample ID and Comments) and the index stay in the small SharedFrame description. Only
+the SharedFrame is pickled when it is sent to a worker, the worker gets a data frame of which the numeric columns are
+views on the segment (attach), so without copying.
+
+The results of a worker are written in a new segment with a name chosen by the parent process (reserve_name), so the
+parent can always free it, also when the worker crashed before it returned:
+
+    with SharedFrameManager() as manager:
+        shared = manager.share(data_frame)
+        future = executor.submit(calculate, shared, manager.reserve_name())
+        result = manager.collect(future.result())
+    # all the segments of the manager are freed here, also after an error
+"""
+from __future__ import annotations
+
+import secrets
+import traceback
+from concurrent.futures import Executor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+from lazy_imports import lazy_import
+from workbook_pipeline import WorkbookLayout, calculate_sheet
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# the dtypes of the columns which are placed in shared memory, the other columns are pickled with the SharedFrame
+SHARED_DTYPES = ("float64", "int64", "datetime64[ns]", "bool")
+# the start of every block in the segment is a multiple of this
+ALIGNMENT = 64
+NAME_PREFIX = "gas_frame_"
+
+
+def get_new_segment_name() -> str:
+    # short enough for the limit on the names of shared memory on macOS (31 characters)
+    return NAME_PREFIX + secrets.token_hex(8)
+
+
+class SharedFrame:
+    """
+    The description of a data frame in shared memory, see the module docstring. Pickling it does not pickle the
+    shared columns.
+    """
+
+    def __init__(self, name: str, size: int, column_names: List[str], blocks: List[Tuple[str, int, List[str]]],
+                 number_of_rows: int, index: Optional[pd.Index], dict_object_columns: Dict[str, list]):
+        """
+        :param name: the name of the shared memory segment.
+        :param size: the size of the segment in bytes.
+        :param column_names: all the columns, in the order of the data frame.
+        :param blocks: [(dtype, offset in the segment, [column names])] of the shared columns. A block has the
+        consecutive columns of the data frame with the same dtype.
+        :param number_of_rows: the number of rows.
+        :param index: the index, None for the default RangeIndex.
+        :param dict_object_columns: {column name: values} of the columns which are not shared.
+        """
+        self.name = name
+        self.size = size
+        self.column_names = column_names
+        self.blocks = blocks
+        self.number_of_rows = number_of_rows
+        self.index = index
+        self.dict_object_columns = dict_object_columns
+        self._shared_memory: Optional[shared_memory.SharedMemory] = None
+
+    @classmethod
+    def create(cls, data_frame: pd.DataFrame, name: str = None) -> "SharedFrame":
+        """
+        Write a data frame in a new shared memory segment.
+
+        :param data_frame: the data frame, the column names must be unique.
+        :param name: the name of the segment, a new name when None.
+        :return: the SharedFrame, which keeps the segment open in this process.
+        """
+        if not data_frame.columns.is_unique:
+            raise ValueError("The column names of a shared data frame must be unique.")
+        number_of_rows = len(data_frame)
+
+        # the consecutive shared columns with the same dtype are one block, so the data frame keeps its column order
+        blocks = []
+        dict_object_columns = {}
+        offset = 0
+        previous_dtype = None
+        for column_name, dtype in data_frame.dtypes.items():
+            dtype = str(dtype)
+            if dtype not in SHARED_DTYPES:
+                dict_object_columns[column_name] = data_frame[column_name].tolist()
+                previous_dtype = None
+                continue
+            if dtype != previous_dtype:
+                if blocks:
+                    offset += len(blocks[-1][2]) * number_of_rows * np.dtype(blocks[-1][0]).itemsize
+                    offset = -(-offset // ALIGNMENT) * ALIGNMENT
+                blocks.append((dtype, offset, []))
+                previous_dtype = dtype
+            blocks[-1][2].append(column_name)
+        size = offset + (len(blocks[-1][2]) * number_of_rows * np.dtype(blocks[-1][0]).itemsize if blocks else 0)
+
+        index = None if data_frame.index.equals(pd.RangeIndex(number_of_rows)) else data_frame.index
+        shared_frame = cls(name=name if name is not None else get_new_segment_name(), size=size,
+                           column_names=list(data_frame.columns), blocks=blocks, number_of_rows=number_of_rows,
+                           index=index, dict_object_columns=dict_object_columns)
+
+        # a segment can not have size 0
+        shared_frame._shared_memory = shared_memory.SharedMemory(name=shared_frame.name, create=True,
+                                                                 size=max(size, 1))
+        for dtype, offset, column_names in blocks:
+            block = shared_frame._get_block(dtype, offset, len(column_names))
+            for position, column_name in enumerate(column_names):
+                block[position] = data_frame[column_name].to_numpy(dtype=dtype)
+        return shared_frame
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_shared_memory"] = None
+        return state
+
+    def _get_block(self, dtype: str, offset: int, number_of_columns: int) -> np.ndarray:
+        return np.ndarray(shape=(number_of_columns, self.number_of_rows), dtype=dtype,
+                          buffer=self._shared_memory.buf, offset=offset)
+
+    def attach(self) -> pd.DataFrame:
+        """
+        :return: the data frame, of which the shared columns are views on the segment. Changing a value in place
+        (data_frame.loc[0, column] = value) changes the segment, assigning a whole column (data_frame[column] = ...)
+        does not.
+        """
+        if self._shared_memory is None:
+            self._shared_memory = shared_memory.SharedMemory(name=self.name)
+
+        index = self.index if self.index is not None else pd.RangeIndex(self.number_of_rows)
+        # a 2D block gives a data frame without copying, concat without copy keeps these blocks
+        data_frames = [pd.DataFrame(self._get_block(dtype, offset, len(column_names)).T, columns=column_names,
+                                    index=index, copy=False)
+                       for dtype, offset, column_names in self.blocks]
+        if data_frames:
+            data_frame = pd.concat(data_frames, axis=1, copy=False)
+        else:
+            data_frame = pd.DataFrame(index=index)
+        # insert does not copy the other columns, in the order of the positions so every position is already right
+        for position, column_name in enumerate(self.column_names):
+            if column_name in self.dict_object_columns:
+                data_frame.insert(loc=position, column=column_name,
+                                  value=pd.Series(self.dict_object_columns[column_name], index=index, dtype=object))
+        return data_frame
+
+    def to_data_frame(self) -> pd.DataFrame:
+        """:return: a copy of the data frame, which stays valid after the segment is freed."""
+        return self.attach().copy(deep=True)
+
+    def close(self) -> None:
+        """
+        Close the segment in this process. The data frames of attach must not be used anymore; while they still exist
+        the memory is released when they are garbage collected.
+        """
+        if self._shared_memory is not None:
+            try:
+                self._shared_memory.close()
+            except BufferError:
+                # views of attach still exist
+                pass
+            self._shared_memory = None
+
+    def unlink(self) -> None:
+        """Free the segment, in every process."""
+        unlink_segment(self.name)
+        self.close()
+
+
+def unlink_segment(name: str) -> bool:
+    """
+    Free a shared memory segment by name.
+
+    :return: False when the segment does not exist (it was never created or it is freed before).
+    """
+    try:
+        segment = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    segment.unlink()
+    try:
+        segment.close()
+    except BufferError:
+        pass
+    return True
+
+
+class SharedFrameManager:
+    """
+    Keeps the names of the segments of the parent process and frees them all at the end, see the module docstring.
+
+    When the parent process itself is killed, the resource tracker of multiprocessing frees the segments which are
+    created in it or in its workers.
+    """
+
+    def __init__(self):
+        self.names = set()
+
+    def share(self, data_frame: pd.DataFrame) -> SharedFrame:
+        """Write a data frame in shared memory, to send the returned SharedFrame to a worker."""
+        shared_frame = SharedFrame.create(data_frame)
+        self.names.add(shared_frame.name)
+        return shared_frame
+
+    def reserve_name(self) -> str:
+        """A name for the segment of a result which a worker creates, it is freed at the end also when unused."""
+        name = get_new_segment_name()
+        self.names.add(name)
+        return name
+
+    def collect(self, shared_frame: SharedFrame, copy: bool = True) -> pd.DataFrame:
+        """
+        :param shared_frame: the SharedFrame of a result which a worker returned.
+        :param copy: copy the data frame and free the segment. Otherwise the data frame has views on the segment,
+        which is freed at release or at the end of the manager.
+        """
+        if not copy:
+            return shared_frame.attach()
+        data_frame = shared_frame.to_data_frame()
+        self.release(shared_frame)
+        return data_frame
+
+    def release(self, shared_frame: SharedFrame) -> None:
+        """Free the segment of a SharedFrame now."""
+        shared_frame.unlink()
+        self.names.discard(shared_frame.name)
+
+    def close(self) -> None:
+        """Free all the segments of the manager."""
+        for name in list(self.names):
+            unlink_segment(name)
+        self.names.clear()
+
+    def __enter__(self) -> "SharedFrameManager":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def calculate_shared_sheet(shared_data_frame: SharedFrame, constants: dict, layout: WorkbookLayout, result_name: str,
+                           sheet_name: str = None) -> SharedFrame:
+    """
+    The calculations of one sheet in a worker process: calculate_sheet on the shared data frame, the result is
+    written in the segment result_name.
+
+    :return: the SharedFrame of the calculated data frame, to collect with SharedFrameManager.collect.
+    """
+    data_frame = shared_data_frame.attach()
+    try:
+        calculated_data_frame = calculate_sheet(data_frame=data_frame, constants=constants, layout=layout,
+                                                sheet_name=sheet_name)
+        shared_result = SharedFrame.create(calculated_data_frame, name=result_name)
+    finally:
+        del data_frame
+        shared_data_frame.close()
+    # the parent process frees the segment, a worker only closes it
+    shared_result.close()
+    return shared_result
+
+
+def calculate_sheets_with_shared_memory(dict_data_frames: Dict[str, pd.DataFrame], dict_constants: Dict[str, dict],
+                                        layout: WorkbookLayout, executor: Executor
+                                        ) -> (Dict[str, pd.DataFrame], Dict[str, str]):
+    """
+    Calculate sheets in the workers of an executor (for example a ProcessPoolExecutor with spawn), the data frames go
+    to the workers and back through shared memory. All the segments are freed at the end, also when a worker fails
+    or dies.
+
+    :param dict_data_frames: {sheet name: data frame with the measurements}
+    :param dict_constants: {sheet name: constants of the sheet}
+    :return: ({sheet name: calculated data frame}, {sheet name: error} of the sheets of which the calculations failed)
+    """
+    dict_calculated_data_frames = {}
+    dict_errors = {}
+    with SharedFrameManager() as manager:
+        dict_futures = {
+            sheet_name: executor.submit(calculate_shared_sheet, manager.share(data_frame), dict_constants[sheet_name],
+                                        layout, manager.reserve_name(), sheet_name)
+            for sheet_name, data_frame in dict_data_frames.items()}
+        for sheet_name, future in dict_futures.items():
+            try:
+                dict_calculated_data_frames[sheet_name] = manager.collect(future.result())
+            except Exception:
+                dict_errors[sheet_name] = traceback.format_exc(limit=3)
+    return dict_calculated_data_frames, dict_errors
@@ -1,6 +1,12 @@
-import pandas as pd
+from __future__ import annotations
+
 from typing import Dict, List, Union
 
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
 
 def find_column_outliers(data_frame: pd.DataFrame, column_name: str, return_only_indexes: bool = False)\
         -> Dict[str, Dict[str, List[Union[int, float]]]]:
@@ -18,21 +24,166 @@ def find_column_outliers(data_frame: pd.DataFrame, column_name: str, return_only
         and 'outliers'. 'indexes' holds a list of the indices of the outliers in the original DataFrame. 'outliers'
         contains a list of the outlier values.
     """
-    # Calculate the IQR of the column
-    Q1 = data_frame[column_name].quantile(0.25)
-    Q3 = data_frame[column_name].quantile(0.75)
-    IQR = Q3 - Q1
-
-    # Define the outlier boundaries
-    under_boundary = Q1 - 1.5 * IQR
-    outer_boundary = Q3 + 1.5 * IQR
-
-    # Identify the outliers
-    outliers_mask = ((data_frame[column_name] < under_boundary) | (data_frame[column_name] > outer_boundary))
-    outlier_indexes = data_frame[outliers_mask].index.tolist()
-    outlier_values = data_frame[column_name][outliers_mask].tolist()
+    outlier_indexes = find_outliers_in_columns(data_frame=data_frame, column_names=[column_name])[column_name].tolist()
 
     if return_only_indexes:
         return outlier_indexes
 
+    outlier_values = data_frame.loc[outlier_indexes, column_name].tolist()
+
     return {column_name: {"indexes": outlier_indexes, "outliers": outlier_values}}
+
+
+def _to_numeric_values(data_frame: pd.DataFrame) -> pd.DataFrame:
+    """Cells which are not a number (like text in a column with measurements) are seen as missing values."""
+    if all(pd.api.types.is_numeric_dtype(dtype) for dtype in data_frame.dtypes):
+        return data_frame
+    return data_frame.apply(pd.to_numeric, errors="coerce")
+
+
+def find_outliers_in_columns(data_frame: pd.DataFrame, column_names: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Finds the outliers of many columns of a DataFrame at once using the IQR method. The quartiles of all the columns
+    are calculated in one quantile call.
+
+    Parameters:
+    data_frame : pd.DataFrame
+        Input DataFrame.
+    column_names : list[str]
+        Column names in the DataFrame to find outliers in.
+
+    Returns:
+    dict: {column_name: array with the indexes of the outliers in the original DataFrame}
+    """
+    values = _to_numeric_values(data_frame[column_names])
+
+    quartiles = values.quantile([0.25, 0.75])
+    Q1 = quartiles.loc[0.25].to_numpy()
+    Q3 = quartiles.loc[0.75].to_numpy()
+    IQR = Q3 - Q1
+
+    array_values = values.to_numpy(dtype=float)
+    outliers_mask = (array_values < Q1 - 1.5 * IQR) | (array_values > Q3 + 1.5 * IQR)
+
+    return {column_name: data_frame.index[outliers_mask[:, position]].to_numpy()
+            for position, column_name in enumerate(column_names)}
+
+
+def find_outliers_in_sheets(dict_data_frames: {str: pd.DataFrame}, column_names: List[str], pooled: bool = False)\
+        -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Finds the outliers of many columns in many sheets at once using the IQR method. The data frames are stacked and
+    the quartiles of all the columns of all the sheets are calculated in one grouped quantile call.
+
+    Parameters:
+    dict_data_frames : {sheet_name: pd.DataFrame}
+        The data frames of the sheets.
+    column_names : list[str]
+        Column names in the data frames to find outliers in.
+    pooled : bool
+        When True the quartiles are calculated over the stacked data of all the sheets together, instead of for
+        every sheet apart.
+
+    Returns:
+    dict: {sheet_name: {column_name: array with the indexes of the outliers in the data frame of the sheet}}
+    """
+    sheet_names = list(dict_data_frames.keys())
+    if len(sheet_names) == 0:
+        return {}
+
+    stacked = pd.concat([dict_data_frames[sheet_name][column_names] for sheet_name in sheet_names],
+                        keys=range(len(sheet_names)))
+    values = _to_numeric_values(stacked)
+    sheet_codes = stacked.index.get_level_values(0).to_numpy()
+
+    if pooled:
+        quartiles = values.quantile([0.25, 0.75])
+        Q1 = quartiles.loc[0.25].to_numpy()
+        Q3 = quartiles.loc[0.75].to_numpy()
+    else:
+        quartiles = values.groupby(level=0, sort=True).quantile([0.25, 0.75])
+        # one row per sheet (in the order of the sheet codes), broadcast to the rows of the sheets
+        Q1 = quartiles.xs(0.25, level=1).reindex(range(len(sheet_names))).to_numpy()[sheet_codes]
+        Q3 = quartiles.xs(0.75, level=1).reindex(range(len(sheet_names))).to_numpy()[sheet_codes]
+    IQR = Q3 - Q1
+
+    array_values = values.to_numpy(dtype=float)
+    outliers_mask = (array_values < Q1 - 1.5 * IQR) | (array_values > Q3 + 1.5 * IQR)
+
+    dict_outliers = {}
+    row_indexes = stacked.index.get_level_values(1)
+    boundaries = np.searchsorted(sheet_codes, np.arange(len(sheet_names) + 1))
+    for sheet_code, sheet_name in enumerate(sheet_names):
+        start, end = boundaries[sheet_code], boundaries[sheet_code + 1]
+        sheet_mask = outliers_mask[start:end]
+        sheet_indexes = row_indexes[start:end]
+        dict_outliers[sheet_name] = {column_name: sheet_indexes[sheet_mask[:, position]].to_numpy()
+                                     for position, column_name in enumerate(column_names)}
+
+    return dict_outliers
+
+
+def find_segment_outliers_in_sheets(dict_data_frames: {str: pd.DataFrame}, column_names: List[str],
+                                    name_column_flush: str = "Flush (1=yes; 0=no)", threshold: float = 3.5)\
+        -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Finds outliers in the measurement time series, taking the flushes into account.
+
+    The gas percentages climb within every period without a flush and reset at every flush, so the whole column is no
+    single distribution. Every sheet is split in segments which start at a row with a flush. Within every segment the
+    first differences (the change since the previous measurement) are the residuals, so the jump at a flush is never
+    a residual. The residuals are scored with the robust z-score per sheet and column:
+        z = 0.6745 * (residual - median) / MAD
+    and a row is an outlier when |z| > threshold. All the sheets are stacked and scored in one grouped pass.
+
+    Note: a single wrong value gives a large change to the previous and to the next measurement, so the row after the
+    wrong value can be flagged too.
+
+    Parameters:
+    dict_data_frames : {sheet_name: pd.DataFrame}
+        The data frames of the sheets.
+    column_names : list[str]
+        Column names in the data frames to find outliers in.
+    name_column_flush : str
+        The name of the flush column (zeros and ones).
+    threshold : float
+        The robust z-score above which a row is an outlier. Defaults to 3.5.
+
+    Returns:
+    dict: {sheet_name: {column_name: array with the indexes of the outliers in the data frame of the sheet}}
+    """
+    sheet_names = list(dict_data_frames.keys())
+    if len(sheet_names) == 0:
+        return {}
+
+    stacked = pd.concat([dict_data_frames[sheet_name][column_names + [name_column_flush]]
+                         for sheet_name in sheet_names], keys=range(len(sheet_names)))
+    sheet_codes = stacked.index.get_level_values(0).to_numpy()
+    values = _to_numeric_values(stacked[column_names])
+    flush = pd.to_numeric(stacked[name_column_flush], errors="coerce").to_numpy()
+
+    # a new segment starts at a flush and at the first row of every sheet
+    first_row_of_sheet = np.r_[True, sheet_codes[1:] != sheet_codes[:-1]]
+    segment_ids = np.cumsum((flush == 1) | first_row_of_sheet)
+
+    residuals = values.groupby(segment_ids).diff()
+    median = residuals.groupby(sheet_codes).transform("median")
+    absolute_deviation = (residuals - median).abs()
+    MAD = absolute_deviation.groupby(sheet_codes).transform("median")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        robust_z_scores = 0.6745 * (residuals - median).to_numpy(dtype=float) / MAD.to_numpy(dtype=float)
+    # without spread (MAD of zero) or without residual the score is not defined, so it is no outlier
+    outliers_mask = np.isfinite(robust_z_scores) & (np.abs(robust_z_scores) > threshold)
+
+    dict_outliers = {}
+    row_indexes = stacked.index.get_level_values(1)
+    boundaries = np.searchsorted(sheet_codes, np.arange(len(sheet_names) + 1))
+    for sheet_code, sheet_name in enumerate(sheet_names):
+        start, end = boundaries[sheet_code], boundaries[sheet_code + 1]
+        sheet_mask = outliers_mask[start:end]
+        sheet_indexes = row_indexes[start:end]
+        dict_outliers[sheet_name] = {column_name: sheet_indexes[sheet_mask[:, position]].to_numpy()
+                                     for position, column_name in enumerate(column_names)}
+
+    return dict_outliers
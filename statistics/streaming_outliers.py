@@ -0,0 +1,233 @@
+import json
+import math
+import os
+import random
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class QuantileSketch:
+    """
+    A mergeable quantile sketch (KLL) to estimate the quartiles of a stream of measurements with a small, bounded
+    memory.
+
+    The values are stored in compactors. Every value in compactor h stands for 2**h measurements. When a compactor is
+    full it is sorted and every second value (with a random start) goes to the next compactor, so the memory stays
+    about 3 * k values however many measurements are added. The rank error is about 1.65 / k.
+    """
+
+    def __init__(self, k: int = 200, seed: int = None):
+        """
+        :param k: the size of the largest compactor. A larger k gives more accurate quantiles and uses more memory.
+        :param seed: the seed of the random start of the compactions, for a reproducible sketch.
+        """
+        if k < 8:
+            raise ValueError("k of the quantile sketch must be at least 8.")
+        self.k = k
+        self.count = 0
+        self.compactors: List[List[float]] = [[]]
+        self._random = random.Random(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _size(self) -> int:
+        return sum(len(compactor) for compactor in self.compactors)
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def _compress(self) -> None:
+        while self._size() > self._max_size():
+            for level, compactor in enumerate(self.compactors):
+                if len(compactor) >= self._capacity(level):
+                    if level + 1 == len(self.compactors):
+                        self.compactors.append([])
+                    compactor.sort()
+                    # with an odd number of values the largest value stays in this compactor
+                    leftover = [compactor.pop()] if len(compactor) % 2 == 1 else []
+                    self.compactors[level + 1].extend(compactor[self._random.randint(0, 1)::2])
+                    self.compactors[level] = leftover
+                    break
+
+    def update(self, value: float) -> None:
+        """Add one measurement. Missing values (NaN) are skipped."""
+        self.update_many([value])
+
+    def update_many(self, values) -> None:
+        """Add many measurements at once. Missing values (NaN) are skipped."""
+        array_values = np.asarray(values, dtype=float)
+        array_values = array_values[~np.isnan(array_values)]
+        self.count += len(array_values)
+        self.compactors[0].extend(array_values.tolist())
+        self._compress()
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """
+        Merge another sketch in this sketch, for example the sketch of another parallel or experiment.
+
+        :return: this sketch
+        """
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, compactor in enumerate(other.compactors):
+            self.compactors[level].extend(compactor)
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantiles(self, quantiles: List[float]) -> np.ndarray:
+        """
+        Estimate quantiles of all the added measurements.
+
+        :param quantiles: the quantiles between 0 and 1, for example [0.25, 0.75].
+        :return: array with the estimates, NaN when the sketch is empty.
+        """
+        values = np.concatenate([np.asarray(compactor, dtype=float) for compactor in self.compactors])
+        if len(values) == 0:
+            return np.full(len(quantiles), np.nan)
+        weights = np.concatenate([np.full(len(compactor), 2 ** level, dtype=float)
+                                  for level, compactor in enumerate(self.compactors)])
+        order = np.argsort(values, kind="stable")
+        cumulative_weights = np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative_weights, np.asarray(quantiles) * cumulative_weights[-1], side="left")
+        return values[order][np.minimum(positions, len(values) - 1)]
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "count": self.count, "compactors": self.compactors}
+
+    @classmethod
+    def from_dict(cls, dict_sketch: dict) -> "QuantileSketch":
+        sketch = cls(k=dict_sketch["k"])
+        sketch.count = dict_sketch["count"]
+        sketch.compactors = [list(compactor) for compactor in dict_sketch["compactors"]]
+        return sketch
+
+
+class IncrementalOutlierDetector:
+    """
+    Screens new measurements for outliers (IQR method) without a recompute over the whole history.
+
+    For every (sample, column) a QuantileSketch is kept. New rows are flagged against the quartiles of the current
+    sketch and are added to the sketch afterwards. The sketches are saved between runs with save() and load(), and the
+    sketches of parallels or experiments can be merged to screen against the combined data.
+    """
+
+    def __init__(self, k: int = 200, minimum_number_of_measurements: int = 20):
+        """
+        :param k: the size parameter of the quantile sketches.
+        :param minimum_number_of_measurements: below this number of measurements in the sketch no new rows are
+        flagged, because the quartiles are not reliable yet.
+        """
+        self.k = k
+        self.minimum_number_of_measurements = minimum_number_of_measurements
+        # {(sample_key, column_name): QuantileSketch}
+        self.dict_sketches: Dict[Tuple[str, str], QuantileSketch] = {}
+
+    def get_sketch(self, sample_key: str, column_name: str) -> QuantileSketch:
+        key = (sample_key, column_name)
+        if key not in self.dict_sketches:
+            self.dict_sketches[key] = QuantileSketch(k=self.k)
+        return self.dict_sketches[key]
+
+    def merged_sketch(self, sample_keys: List[str], column_name: str) -> QuantileSketch:
+        """
+        Merge the sketches of a column of many samples, for example all the parallels of a sample.
+
+        :return: a new QuantileSketch, the stored sketches are not changed.
+        """
+        merged = QuantileSketch(k=self.k)
+        for sample_key in sample_keys:
+            sketch = self.dict_sketches.get((sample_key, column_name))
+            if sketch is not None:
+                merged.merge(sketch)
+        return merged
+
+    def outlier_boundaries(self, sketch: QuantileSketch) -> Tuple[float, float]:
+        """
+        :return: (lower boundary, upper boundary) of the IQR method, (-inf, inf) when there are too few measurements.
+        """
+        if sketch.count < self.minimum_number_of_measurements:
+            return -np.inf, np.inf
+        Q1, Q3 = sketch.quantiles([0.25, 0.75])
+        IQR = Q3 - Q1
+        return Q1 - 1.5 * IQR, Q3 + 1.5 * IQR
+
+    def screen(self, sample_key: str, column_name: str, values, reference_sample_keys: List[str] = None,
+               update: bool = True) -> np.ndarray:
+        """
+        Flag new measurements against the current sketch and add them to the sketch.
+
+        :param sample_key: the sample (for example the sheet name) of the measurements.
+        :param column_name: the column of the measurements.
+        :param values: the new measurements.
+        :param reference_sample_keys: when given the measurements are flagged against the merged sketches of these
+        samples (for example all the parallels), instead of against the sketch of sample_key.
+        :param update: when True the new measurements are added to the sketch of sample_key.
+        :return: boolean array, True for the outliers.
+        """
+        array_values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float)
+
+        if reference_sample_keys is None:
+            reference_sketch = self.get_sketch(sample_key, column_name)
+        else:
+            reference_sketch = self.merged_sketch(reference_sample_keys, column_name)
+        lower_boundary, upper_boundary = self.outlier_boundaries(reference_sketch)
+        outliers_mask = (array_values < lower_boundary) | (array_values > upper_boundary)
+
+        if update:
+            self.get_sketch(sample_key, column_name).update_many(array_values)
+
+        return outliers_mask
+
+    def screen_data_frame(self, sample_key: str, data_frame: pd.DataFrame, column_names: List[str],
+                          reference_sample_keys: List[str] = None, update: bool = True) -> Dict[str, list]:
+        """
+        Flag the new rows of a data frame, like find_column_outliers but only for the new rows.
+
+        :return: {column_name: [indexes of the outliers in the data frame]}
+        """
+        dict_outliers = {}
+        for column_name in column_names:
+            outliers_mask = self.screen(sample_key=sample_key, column_name=column_name,
+                                        values=data_frame[column_name], reference_sample_keys=reference_sample_keys,
+                                        update=update)
+            dict_outliers[column_name] = data_frame.index[outliers_mask].tolist()
+        return dict_outliers
+
+    def save(self, path: str) -> None:
+        """
+        Save the sketches as JSON file.
+
+        :param path: the path of the JSON file.
+        """
+        dict_detector = {"k": self.k, "minimum_number_of_measurements": self.minimum_number_of_measurements,
+                         "sketches": [{"sample_key": sample_key, "column_name": column_name,
+                                       "sketch": sketch.to_dict()}
+                                      for (sample_key, column_name), sketch in self.dict_sketches.items()]}
+        with open(path, "w") as file:
+            json.dump(dict_detector, file)
+
+    @classmethod
+    def load(cls, path: str, k: int = 200, minimum_number_of_measurements: int = 20) -> "IncrementalOutlierDetector":
+        """
+        Load the sketches from a JSON file. When the file does not exist an empty detector is returned.
+
+        :param path: the path of the JSON file.
+        :return: IncrementalOutlierDetector
+        """
+        if not os.path.exists(path):
+            return cls(k=k, minimum_number_of_measurements=minimum_number_of_measurements)
+
+        with open(path) as file:
+            dict_detector = json.load(file)
+
+        detector = cls(k=dict_detector["k"],
+                       minimum_number_of_measurements=dict_detector["minimum_number_of_measurements"])
+        for dict_sketch in dict_detector["sketches"]:
+            detector.dict_sketches[(dict_sketch["sample_key"], dict_sketch["column_name"])] = \
+                QuantileSketch.from_dict(dict_sketch["sketch"])
+        return detector
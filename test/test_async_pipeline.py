@@ -0,0 +1,76 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import workbook_pipeline
+from async_pipeline import AsyncWorkbookPipeline, run_async_batch
+from batch_run import find_workbooks
+from benchmarks.generate_workbook import generate_workbook
+from progress_events import MemorySink, progress_sinks
+
+
+class TestAsyncPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input_directory = os.path.join(self.directory, "input")
+        self.output_directory = os.path.join(self.directory, "output")
+        os.makedirs(self.input_directory)
+        generate_workbook(path=os.path.join(self.input_directory, "a.xlsx"), number_of_sheets=2, number_of_rows=6)
+        for name in ("b.xlsx", "c.xlsx", "d.xlsx"):
+            shutil.copy(os.path.join(self.input_directory, "a.xlsx"), os.path.join(self.input_directory, name))
+        # a file which can not be read
+        with open(os.path.join(self.input_directory, "broken.xlsx"), "w") as file:
+            file.write("not a workbook")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_all_workbooks_pass_all_steps(self):
+        paths = find_workbooks([self.input_directory])
+        dict_results = run_async_batch(paths=paths, output_directory=self.output_directory, number_of_readers=2,
+                                       number_of_workers=0, queue_size=1)
+
+        self.assertEqual(list(dict_results.keys()), paths)
+        dict_status = {os.path.basename(path): result["status"] for path, result in dict_results.items()}
+        self.assertEqual(dict_status, {"a.xlsx": "done", "b.xlsx": "done", "broken.xlsx": "failed", "c.xlsx": "done",
+                                       "d.xlsx": "done"})
+        for path, result in dict_results.items():
+            if result["status"] == "done":
+                self.assertTrue(os.path.exists(result["output_path"]))
+                self.assertEqual(set(result["timings"].keys()), {"load", "validate", "calculate", "export"})
+
+    def test_resume_from_checkpoint(self):
+        paths = find_workbooks([self.input_directory])
+        run_async_batch(paths=paths[:2], output_directory=self.output_directory, number_of_workers=0)
+
+        pipeline = AsyncWorkbookPipeline(output_directory=self.output_directory, number_of_workers=0)
+        with mock.patch("async_pipeline.read_workbook", wraps=workbook_pipeline.read_workbook) as read_workbook:
+            dict_results = asyncio.run(pipeline.run(paths=paths))
+        self.assertEqual(read_workbook.call_count, len(paths) - 2)
+        self.assertEqual(len(dict_results), len(paths))
+        self.assertGreater(pipeline.dict_busy_seconds["calculate"], 0)
+
+    def test_progress_events_of_the_workbooks(self):
+        paths = find_workbooks([self.input_directory])
+        run_async_batch(paths=paths[:1], output_directory=self.output_directory, number_of_workers=0)
+        collector = MemorySink()
+        with progress_sinks(collector):
+            run_async_batch(paths=paths[:3], output_directory=self.output_directory, number_of_workers=0)
+        events = [event for event in collector.events if event.step == "async_pipeline"]
+        self.assertEqual(events[0].message, "1 of 3 workbooks are done before")
+        self.assertEqual(sorted((event.kind, os.path.basename(event.details["file_path"]), event.details["status"])
+                                for event in events[1:]),
+                         [("write", "b.xlsx", "done"), ("write", "broken.xlsx", "failed")])
+        self.assertTrue(all(event.duration > 0 for event in events[1:]))
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            AsyncWorkbookPipeline(output_directory=self.output_directory, queue_size=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from batch_run import find_workbooks, run_batch, BatchCheckpoint
+from benchmarks.generate_workbook import generate_workbook
+from progress_events import MemorySink, progress_sinks
+
+
+class TestBatchRun(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input_directory = os.path.join(self.directory, "input")
+        self.output_directory = os.path.join(self.directory, "output")
+        os.makedirs(self.input_directory)
+        generate_workbook(path=os.path.join(self.input_directory, "a.xlsx"), number_of_sheets=2, number_of_rows=6)
+        shutil.copy(os.path.join(self.input_directory, "a.xlsx"), os.path.join(self.input_directory, "b.xlsx"))
+        # the lock file of Excel when a workbook is open
+        open(os.path.join(self.input_directory, "~$a.xlsx"), "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_find_workbooks(self):
+        paths = find_workbooks([self.input_directory])
+        self.assertEqual([os.path.basename(path) for path in paths], ["a.xlsx", "b.xlsx"])
+        self.assertEqual(find_workbooks([os.path.join(self.input_directory, "b*.xlsx")]), paths[1:])
+
+    def test_resume_from_checkpoint(self):
+        paths = find_workbooks([self.input_directory])
+        checkpoint_path = os.path.join(self.output_directory, "checkpoint.json")
+
+        # an interrupted batch: only the first workbook is done
+        run_batch(paths=paths[:1], output_directory=self.output_directory, number_of_workers=0)
+        self.assertEqual(list(BatchCheckpoint(checkpoint_path).dict_results.keys()), paths[:1])
+
+        dict_results = run_batch(paths=paths, output_directory=self.output_directory, number_of_workers=0)
+        self.assertEqual({path: result["status"] for path, result in dict_results.items()},
+                         {paths[0]: "done", paths[1]: "done"})
+        self.assertTrue(os.path.exists(os.path.join(self.output_directory, "b_calculated.xlsx")))
+
+        checkpoint = BatchCheckpoint(checkpoint_path)
+        self.assertTrue(checkpoint.is_done(paths[0]))
+        # a changed workbook is processed again
+        with open(paths[0], "ab") as file:
+            file.write(b"\0")
+        self.assertFalse(checkpoint.is_done(paths[0]))
+
+    def test_failed_workbook(self):
+        path = os.path.join(self.input_directory, "broken.xlsx")
+        with open(path, "w") as file:
+            file.write("this is not a workbook")
+        dict_results = run_batch(paths=[path], output_directory=self.output_directory, number_of_workers=0)
+        self.assertEqual(dict_results[path]["status"], "failed")
+        self.assertTrue(BatchCheckpoint(os.path.join(self.output_directory, "checkpoint.json")).is_done(path))
+        self.assertFalse(BatchCheckpoint(os.path.join(self.output_directory, "checkpoint.json")).is_done(
+            path, retry_failed=True))
+
+    def test_progress_events_of_the_workbooks(self):
+        paths = find_workbooks([self.input_directory])
+        collector = MemorySink()
+        with progress_sinks(collector):
+            run_batch(paths=paths, output_directory=self.output_directory, number_of_workers=0)
+        events = [event for event in collector.events if event.step == "run_batch"]
+        self.assertEqual(events[0].message, "0 of 2 workbooks are done before")
+        self.assertEqual([(event.kind, event.details["file_path"], event.details["status"]) for event in events[1:]],
+                         [("write", paths[0], "done"), ("write", paths[1], "done")])
+        self.assertTrue(all(event.duration > 0 for event in events[1:]))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+from openpyxl import load_workbook
+
+from benchmarks.generate_workbook import generate_workbook, BASIC_COLUMN_NAMES, HEADER_ROW, \
+    START_ROW_VALUES_TABLE_IN_EXCEL
+from benchmarks.run_benchmarks import run_benchmarks
+
+
+class TestGenerateWorkbook(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "generated.xlsx")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_layout_of_the_template(self):
+        generated = generate_workbook(path=self.path, number_of_sheets=3, number_of_rows=10, flush_frequency=3)
+        workbook = load_workbook(self.path)
+        self.assertEqual(workbook.sheetnames, ["Notes", "GT1.1", "GT1.2", "GT2.1"])
+        self.assertEqual(generated["sheet_names"], ["GT1.1", "GT1.2", "GT2.1"])
+
+        sheet = workbook["GT1.2"]
+        self.assertEqual(sheet["C1"].value, "Rgas")
+        header = next(sheet.iter_rows(min_row=HEADER_ROW, max_row=HEADER_ROW, max_col=len(BASIC_COLUMN_NAMES),
+                                      values_only=True))
+        self.assertEqual(list(header), BASIC_COLUMN_NAMES)
+
+        flush = [row[0] for row in sheet.iter_rows(min_row=START_ROW_VALUES_TABLE_IN_EXCEL, min_col=12, max_col=12,
+                                                   values_only=True)]
+        self.assertEqual(flush, [None, 0, 0, 1, 0, 0, 1, 0, 0, 1])
+
+    def test_invalid_cells_and_outliers_are_injected(self):
+        generated = generate_workbook(path=self.path, number_of_sheets=1, number_of_rows=100,
+                                      invalid_cell_fraction=0.02, outlier_fraction=0.01)
+        self.assertEqual(generated["number_of_invalid_cells"], 14)
+        self.assertEqual(generated["number_of_outliers"], 7)
+
+    def test_same_seed_same_workbook(self):
+        path_other = os.path.join(self.directory.name, "other.xlsx")
+        generate_workbook(path=self.path, number_of_sheets=1, number_of_rows=5, seed=3)
+        generate_workbook(path=path_other, number_of_sheets=1, number_of_rows=5, seed=3)
+        rows = list(load_workbook(self.path)["GT1.1"].iter_rows(values_only=True))
+        rows_other = list(load_workbook(path_other)["GT1.1"].iter_rows(values_only=True))
+        self.assertEqual(rows, rows_other)
+
+
+class TestRunBenchmarks(unittest.TestCase):
+
+    def test_run_benchmarks(self):
+        benchmark_results = run_benchmarks(list_number_of_sheets=[1], list_number_of_rows=[10])
+        result = benchmark_results["results"][0]
+        self.assertEqual(result["errors"], {})
+        self.assertEqual(set(result["timings"].keys()),
+                         {"load_workbook", "load_tables", "validation", "validation_statistics",
+                          "validation_styling", "calculations", "write_back"})
+
+
+if __name__ == '__main__':
+    unittest.main()
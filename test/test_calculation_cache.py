@@ -0,0 +1,154 @@
+import contextlib
+import importlib.util
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from benchmarks.generate_workbook import generate_workbook
+from calculation_cache import ARROW_SUFFIX, CalculationCache, get_calculation_key
+from excel_manager import ExcelManager
+from workbook_pipeline import WorkbookLayout, calculate_sheet, load_workbook_tables, process_workbook
+
+FIRST_ROW_GAS_COMPOSITION = {"ch4": 0, "co2": 0.03, "o2": 21.90, "n2": 78.07}
+CONSTANTS = {"Rgas": 8.314, "expTemp": 293.15, "volume_headspace": 0.0011}
+
+
+def make_data_frame() -> pd.DataFrame:
+    return pd.DataFrame({"Date": ["2023-04-17", "2023-04-19"], "Time": ["14:42:00", "10:20:00"],
+                         "CO2 [%]": [0.03, 1.53]})
+
+
+class TestCalculationKey(unittest.TestCase):
+
+    def test_key_changes_with_every_input(self):
+        key = get_calculation_key(make_data_frame(), CONSTANTS, FIRST_ROW_GAS_COMPOSITION)
+        self.assertEqual(key, get_calculation_key(make_data_frame(), dict(CONSTANTS), FIRST_ROW_GAS_COMPOSITION))
+
+        data_frame = make_data_frame()
+        data_frame.loc[1, "CO2 [%]"] = 1.54
+        self.assertNotEqual(key, get_calculation_key(data_frame, CONSTANTS, FIRST_ROW_GAS_COMPOSITION))
+        self.assertNotEqual(key, get_calculation_key(make_data_frame(), {**CONSTANTS, "expTemp": 298.15},
+                                                     FIRST_ROW_GAS_COMPOSITION))
+        self.assertNotEqual(key, get_calculation_key(make_data_frame(), CONSTANTS,
+                                                     {**FIRST_ROW_GAS_COMPOSITION, "co2": 0.04}))
+        self.assertNotEqual(key, get_calculation_key(make_data_frame(), CONSTANTS, FIRST_ROW_GAS_COMPOSITION,
+                                                     engine_version="0"))
+
+    def test_only_the_input_columns_are_hashed(self):
+        data_frame = make_data_frame()
+        key = get_calculation_key(data_frame, CONSTANTS, FIRST_ROW_GAS_COMPOSITION, column_names=["Date", "Time"])
+        data_frame["Day"] = [0.0, 1.8]
+        self.assertEqual(key, get_calculation_key(data_frame, CONSTANTS, FIRST_ROW_GAS_COMPOSITION,
+                                                  column_names=["Date", "Time"]))
+
+
+class TestCalculationCache(unittest.TestCase):
+
+    def test_put_get_and_invalidate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = CalculationCache(directory, use_arrow=False)
+            self.assertIsNone(cache.get("a"))
+            cache.put("a", make_data_frame())
+            self.assertIn("a", cache)
+            pd.testing.assert_frame_equal(cache.get("a"), make_data_frame())
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+            self.assertTrue(cache.invalidate("a"))
+            self.assertFalse(cache.invalidate("a"))
+            self.assertIsNone(cache.get("a"))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = CalculationCache(directory, use_arrow=False)
+            for number, key in enumerate(["a", "b", "c"]):
+                os.utime(cache.put(key, make_data_frame()), ns=(number * 10 ** 9, number * 10 ** 9))
+            # "a" is used, so "b" is the least recently used entry
+            cache.get("a")
+
+            cache.max_bytes = cache.get_size() - 1
+            self.assertEqual(cache.evict(), ["b"])
+            self.assertEqual(sorted(key for key in "abc" if key in cache), ["a", "c"])
+
+    def test_entries_removed_by_another_process_are_skipped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = CalculationCache(directory, use_arrow=False)
+            for key in "abc":
+                cache.put(key, make_data_frame())
+            size = cache.get_size()
+            removed_path = os.path.join(cache.version_directory, "b.pkl")
+
+            # another process removes "b" between the scan of the directory and the stat of the entry
+            scandir = os.scandir
+
+            def scandir_and_remove(path):
+                with scandir(path) as iterator:
+                    entries = list(iterator)
+                os.remove(removed_path)
+                return contextlib.nullcontext(entries)
+
+            with mock.patch("calculation_cache.os.scandir", side_effect=scandir_and_remove):
+                self.assertEqual([entry.name for entry in cache.get_entries()], ["a.pkl", "c.pkl"])
+            cache.put("b", make_data_frame())
+            with mock.patch("calculation_cache.os.scandir", side_effect=scandir_and_remove):
+                self.assertEqual(cache.get_size(), size * 2 // 3)
+            cache.put("b", make_data_frame())
+            cache.max_bytes = 0
+            with mock.patch("calculation_cache.os.scandir", side_effect=scandir_and_remove):
+                self.assertEqual(sorted(cache.evict()), ["a", "c"])
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_calculated_sheet_round_trip_through_arrow(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "experiment.xlsx")
+            generate_workbook(path=path, number_of_sheets=1, number_of_rows=10)
+            layout = WorkbookLayout()
+            manager = ExcelManager(path)
+            manager.load_workbook()
+            dict_data_frames, dict_constants = load_workbook_tables(manager=manager, sheet_names=["GT1.1"],
+                                                                    layout=layout)
+            calculated_data_frame = calculate_sheet(data_frame=dict_data_frames["GT1.1"],
+                                                    constants=dict_constants["GT1.1"], layout=layout,
+                                                    sheet_name="GT1.1")
+
+            cache = CalculationCache(os.path.join(directory, "cache"), use_arrow=True)
+            self.assertTrue(cache.put("a", calculated_data_frame).endswith(ARROW_SUFFIX))
+            cached_data_frame = cache.get("a")
+            pd.testing.assert_frame_equal(cached_data_frame, calculated_data_frame)
+            # the copy can be changed
+            cached_data_frame = cached_data_frame.copy()
+            cached_data_frame.loc[0, "CO2 [%]"] = 1.0
+
+    def test_other_engine_versions_are_invalidated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            CalculationCache(directory, engine_version="0").put("a", make_data_frame())
+            cache = CalculationCache(directory, engine_version="1")
+            self.assertEqual(cache.invalidate_other_engine_versions(), ["0"])
+            self.assertEqual(os.listdir(directory), ["1"])
+
+    def test_unchanged_sheets_are_taken_from_the_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "experiment.xlsx")
+            generate_workbook(path=path, number_of_sheets=2, number_of_rows=10)
+            cache = CalculationCache(os.path.join(directory, "cache"))
+
+            first_result = process_workbook(path=path, output_directory=os.path.join(directory, "first"), cache=cache)
+            second_result = process_workbook(path=path, output_directory=os.path.join(directory, "second"),
+                                             cache=cache)
+
+            self.assertFalse(any(sheet["cached"] for sheet in first_result["sheets"].values()))
+            self.assertTrue(all(sheet["cached"] for sheet in second_result["sheets"].values()))
+            layout = WorkbookLayout()
+            for result in (first_result, second_result):
+                self.assertEqual(result["status"], "done")
+            first = pd.read_excel(first_result["output_path"], sheet_name="GT1.2",
+                                  skiprows=layout.start_row_values_table_in_excel - 1, header=None)
+            second = pd.read_excel(second_result["output_path"], sheet_name="GT1.2",
+                                   skiprows=layout.start_row_values_table_in_excel - 1, header=None)
+            pd.testing.assert_frame_equal(first, second)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -42,6 +42,25 @@ class TestGasComposition(unittest.TestCase):
             self.assertAlmostEqual(o2_corr_list_expected[i], data_frame["O2-corr [%]"][i], places=5)
             self.assertAlmostEqual(n2_corr_list_expected[i], data_frame["N2-corr [%]"][i], places=5)
 
+    def test_correct_gas_composition_with_other_gases(self):
+        data_frame = pd.DataFrame({
+            "H2 [%]": [10.0, 20.0],
+            "H2S [%]": [30.0, 5.0],
+            "N2O [%]": [40.0, 25.0]
+        })
+        GasComposition.correct_gas_composition(data_frame, gas_column_names=["H2 [%]", "H2S [%]", "N2O [%]"])
+        self.assertEqual(list(data_frame.columns), ["H2 [%]", "H2S [%]", "N2O [%]", "Sum [%]", "H2-corr [%]",
+                                                    "H2S-corr [%]", "N2O-corr [%]", "Sum-corr [%]"])
+        self.assertEqual(data_frame["Sum [%]"].tolist(), [80, 50])
+        self.assertEqual(data_frame["H2-corr [%]"].tolist(), [12.5, 40])
+        self.assertEqual(data_frame["H2S-corr [%]"].tolist(), [37.5, 10])
+        self.assertEqual(data_frame["N2O-corr [%]"].tolist(), [50, 50])
+        self.assertEqual(data_frame["Sum-corr [%]"].tolist(), [100, 100])
+
+        with self.assertRaises(ValueError):
+            GasComposition.correct_gas_composition(data_frame, gas_column_names=["H2 [%]"],
+                                                   correction_column_names=[])
+
 
 class TestMolGasCompositionCalculations(unittest.TestCase):
 
@@ -105,3 +124,31 @@ class TestMolGasCompositionCalculations(unittest.TestCase):
         expected_result = pd.Series([0.8, 1.2, 1.7])
         actual_values = self.data_frame[self.name_column].tolist()
         self.assertListAlmostEqual(actual_values, expected_result, places=5)
+
+    def test_gas_moles_before_and_after_sampling(self):
+        data_frame = pd.DataFrame({
+            'mg_bs': [0.1, 0.2],
+            'mg_as': [0.05, 0.1],
+            'CO2-corr [%]': [10.0, 20.0],
+            'CH4-corr [%]': [5.0, 0.0],
+            'O2-corr [%]': [85.0, 80.0]
+        })
+        moles, carbon_total = MolGasCompositionCalculations.gas_moles_before_and_after_sampling(
+            data_frame, name_columns_mg=['mg_bs', 'mg_as'],
+            name_columns_specific_gas_corrected=['CO2-corr [%]', 'CH4-corr [%]', 'O2-corr [%]'],
+            name_columns_carbon_gas_corrected=['CO2-corr [%]', 'CH4-corr [%]'],
+            name_columns_moles=[['mCO2_b', 'mCH4_b', 'mO2_b'], ['mCO2_a', 'mCH4_a', 'mO2_a']],
+            name_columns_carbon_total=['mCTot_b', 'mCTot_a'])
+
+        self.assertEqual(moles.shape, (2, 2, 3))
+        self.assertEqual(list(data_frame.columns)[5:], ['mCO2_b', 'mCH4_b', 'mO2_b', 'mCTot_b',
+                                                        'mCO2_a', 'mCH4_a', 'mO2_a', 'mCTot_a'])
+        self.assertListAlmostEqual(data_frame['mCO2_b'].tolist(), [0.01, 0.04])
+        self.assertListAlmostEqual(data_frame['mO2_a'].tolist(), [0.0425, 0.08])
+        self.assertListAlmostEqual(data_frame['mCTot_b'].tolist(), [0.015, 0.04])
+        self.assertListAlmostEqual(carbon_total[:, 1].tolist(), [0.0075, 0.02])
+
+        # the same values as the calculation for every gas separately
+        MolGasCompositionCalculations.specific_gas_in_moles_before_sampling(
+            data_frame, 'mCH4_a_separately', 'mg_as', 'CH4-corr [%]')
+        self.assertEqual(data_frame['mCH4_a'].tolist(), data_frame['mCH4_a_separately'].tolist())
@@ -1,8 +1,12 @@
+import os
+import tempfile
 import unittest
 
 import pandas as pd
 from openpyxl import Workbook
+from benchmarks.generate_workbook import generate_workbook
 from excel_manager import ExcelManager
+from workbook_pipeline import WorkbookLayout, load_workbook_tables, validate_workbook_tables
 
 
 class TestExcelManager(unittest.TestCase):
@@ -160,5 +164,88 @@ class TestExcelManager(unittest.TestCase):
         pd.testing.assert_frame_equal(df, expected_df)
 
 
+class TestLazySheetMapping(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'experiment.xlsx')
+        generate_workbook(path=self.file_path, number_of_sheets=3, number_of_rows=5)
+        self.layout = WorkbookLayout()
+        self.manager = ExcelManager(self.file_path)
+        self.manager.load_workbook()
+        self.sheet_names = ['GT1.1', 'GT1.2', 'GT2.1']
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_mapping(self, **kwargs):
+        return self.manager.get_lazy_dict_panda_data_frames(
+            start_row=self.layout.start_row_values_table_in_excel - 1, column_names=self.layout.column_names,
+            sheet_names=self.sheet_names, end_column=self.layout.end_column, **kwargs)
+
+    def test_sheets_are_loaded_when_used(self):
+        mapping = self.get_mapping(max_data_frames=2)
+        self.addCleanup(mapping.close)
+        self.assertEqual(list(mapping), self.sheet_names)
+        self.assertEqual(mapping.number_of_loads, 0)
+
+        dict_data_frames, _ = load_workbook_tables(manager=self.manager, sheet_names=self.sheet_names,
+                                                   layout=self.layout)
+        pd.testing.assert_frame_equal(mapping['GT1.2'], dict_data_frames['GT1.2'])
+        self.assertEqual(mapping.get_loaded_sheet_names(), ['GT1.2'])
+        with self.assertRaises(KeyError):
+            mapping['Notes']
+
+        mapping['GT1.1'], mapping['GT1.2'], mapping['GT2.1']
+        self.assertEqual(mapping.get_loaded_sheet_names(), ['GT1.2', 'GT2.1'])
+        self.assertEqual(mapping.number_of_loads, 3)
+
+    def test_removed_data_frames_are_spilled_to_disk(self):
+        with self.get_mapping(max_data_frames=1, spill_directory=self.directory.name) as mapping:
+            mapping['GT1.1'].loc[0, 'Comments'] = 'changed'
+            mapping['GT1.2']
+            self.assertEqual(mapping.number_of_spills, 1)
+            self.assertEqual(mapping['GT1.1'].loc[0, 'Comments'], 'changed')
+            self.assertEqual(mapping.number_of_loads, 2)
+            spill_directory = mapping.spill_directory
+        self.assertFalse(os.path.exists(spill_directory))
+
+    def test_sheets_are_read_from_a_read_only_workbook(self):
+        manager = ExcelManager(self.file_path)
+        with manager.get_lazy_dict_panda_data_frames(
+                start_row=self.layout.start_row_values_table_in_excel - 1, column_names=self.layout.column_names,
+                end_column=self.layout.end_column) as mapping:
+            self.assertIsNone(manager.workbook_values)
+            self.assertTrue(mapping.reader.workbook_values.read_only)
+            self.assertEqual(list(mapping), ['Notes'] + self.sheet_names)
+            dict_data_frames, _ = load_workbook_tables(manager=self.manager, sheet_names=self.sheet_names,
+                                                       layout=self.layout)
+            for sheet_name in self.sheet_names:
+                pd.testing.assert_frame_equal(mapping[sheet_name], dict_data_frames[sheet_name])
+
+    def test_every_pass_parses_the_sheets_again_without_spilling(self):
+        with self.get_mapping(max_data_frames=1) as spilling_mapping, \
+                self.get_mapping(max_data_frames=1, spill=False) as mapping:
+            for _ in range(2):
+                for sheet_name in self.sheet_names:
+                    spilling_mapping[sheet_name], mapping[sheet_name]
+            self.assertEqual(spilling_mapping.number_of_loads, 3)
+            self.assertEqual(spilling_mapping.number_of_spills, 5)
+            self.assertEqual(mapping.number_of_loads, 6)
+            self.assertIsNone(mapping.spill_directory)
+
+    def test_validation_with_lazy_mapping(self):
+        dict_data_frames, _ = load_workbook_tables(manager=self.manager, sheet_names=self.sheet_names,
+                                                   layout=self.layout)
+        validation = validate_workbook_tables(dict_data_frames=dict_data_frames,
+                                              workbook=self.manager.workbook_values, layout=self.layout)
+        with self.get_mapping(max_data_frames=1) as mapping:
+            lazy_validation = validate_workbook_tables(dict_data_frames=mapping,
+                                                       workbook=self.manager.workbook_values, layout=self.layout)
+        self.assertEqual(lazy_validation.dict_number_of_errors, validation.dict_number_of_errors)
+        self.assertEqual(lazy_validation.dict_indexes_as_pandas_incorrect_date,
+                         validation.dict_indexes_as_pandas_incorrect_date)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+
+from openpyxl import load_workbook
+
+from benchmarks.generate_workbook import generate_workbook
+from experiment_store import ExperimentStore
+from progress_events import MemorySink, progress_sinks
+
+
+class TestExperimentStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.directory = self.temporary_directory.name
+        self.path_first = os.path.join(self.directory, "first.xlsx")
+        self.path_second = os.path.join(self.directory, "second.xlsx")
+        generate_workbook(path=self.path_first, number_of_sheets=2, number_of_rows=8)
+        generate_workbook(path=self.path_second, number_of_sheets=3, number_of_rows=8, seed=1)
+        self.store = ExperimentStore(os.path.join(self.directory, "experiments.sqlite"))
+
+    def tearDown(self):
+        self.store.close()
+        self.temporary_directory.cleanup()
+
+    def count_measurements(self) -> int:
+        return self.store.connection.execute("SELECT COUNT(*) FROM measurements").fetchone()[0]
+
+    def test_ingestion_is_idempotent_and_incremental(self):
+        results = self.store.ingest_workbooks([self.path_first, self.path_second])
+        self.assertEqual([result["changed_sheets"] for result in results],
+                         [["GT1.1", "GT1.2"], ["GT1.1", "GT1.2", "GT2.1"]])
+        number_of_measurements = self.count_measurements()
+
+        self.assertEqual(self.store.ingest_workbook(self.path_first)["status"], "unchanged")
+        # a saved but unchanged workbook is read again, but no sheet is replaced
+        os.utime(self.path_first, ns=(0, 0))
+        result = self.store.ingest_workbook(self.path_first)
+        self.assertEqual((result["status"], result["changed_sheets"]), ("ingested", []))
+        self.assertEqual(self.count_measurements(), number_of_measurements)
+
+        # change one measurement of one sheet
+        workbook = load_workbook(self.path_second)
+        workbook["GT1.2"]["I15"] = 1.11
+        workbook.save(self.path_second)
+        result = self.store.ingest_workbook(self.path_second)
+        self.assertEqual(result["changed_sheets"], ["GT1.2"])
+        self.assertEqual(self.count_measurements(), number_of_measurements)
+        selection = self.store.select(column_names=["CO2 [%]"], experiments=["second"]).reset_index()
+        value = selection.loc[(selection["sheet_name"] == "GT1.2") & (selection["row_number"] == 2), "CO2 [%]"]
+        self.assertEqual(value.tolist(), [1.11])
+
+        self.assertTrue(self.store.remove_workbook(self.path_second))
+        self.assertEqual(self.store.get_workbooks()["experiment"].tolist(), ["first"])
+
+    def test_progress_events_of_the_ingestion(self):
+        collector = MemorySink()
+        with progress_sinks(collector):
+            self.store.ingest_workbooks([self.path_first, os.path.join(self.directory, "missing.xlsx")])
+        events = [event for event in collector.events if event.step == "ingest_workbooks"]
+        self.assertEqual([(event.kind, event.details["status"]) for event in events],
+                         [("write", "ingested"), ("write", "failed")])
+        self.assertEqual(events[0].details["file_path"], self.path_first)
+        self.assertTrue(all(event.duration >= 0 for event in events))
+
+    def test_select_and_aggregate_across_experiments(self):
+        self.store.ingest_workbooks([self.path_first, self.path_second])
+
+        selection = self.store.select(column_names=["CO2 [%]", "Ctot_DM [mg C/gDW]"], sample_ids=["GT1"],
+                                      parallels=[1], day_max=2)
+        self.assertEqual(list(selection.columns), ["CO2 [%]", "Ctot_DM [mg C/gDW]"])
+        self.assertEqual(set(selection.index.get_level_values("experiment")), {"first", "second"})
+        self.assertTrue(all(day <= 2 for day in selection.index.get_level_values("day")))
+
+        aggregation = self.store.aggregate("CO2 [%]", by=["experiment", "sample_id"])
+        self.assertEqual(aggregation.index.tolist(), [("first", "GT1"), ("second", "GT1"), ("second", "GT2")])
+        self.assertEqual(aggregation.loc[("first", "GT1"), "count"], 16)
+        self.assertAlmostEqual(aggregation.loc[("first", "GT1"), "min"], 0.03)
+
+        constants = self.store.get_constants(experiments=["first"])
+        self.assertEqual(constants.index.tolist(), [("first", "GT1.1"), ("first", "GT1.2")])
+        self.assertEqual(constants["MM_C"].tolist(), [12.0, 12.0])
+
+        with self.assertRaises(ValueError):
+            self.store.aggregate("CO2 [%]", by=["workbook_id; DROP TABLE measurements"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+import instrumentation
+from instrumentation import StageRecorder, MemoryRecorder, MemoryBudgetExceeded, record_block
+from run_data_frame_calculations import RunDataFrameCalculationsForOneDataFrame
+
+
+def make_data_frame() -> pd.DataFrame:
+    return pd.DataFrame({"Date": ["2023-04-17", "2023-04-19", "2023-04-24"],
+                         "Time": ["14:42:00", "14:42:00", "10:20:00"],
+                         "CH4 [%]": [0, 0.12, 0.25], "CO2 [%]": [0.03, 1.53, 2.41],
+                         "O2 [%]": [21.9, 2.21, 1.59], "N2 [%]": [78.07, 96.64, 99.14]})
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_no_records_when_disabled(self):
+        self.assertIsNone(instrumentation.get_active_recorder())
+        data_frame = make_data_frame()
+        RunDataFrameCalculationsForOneDataFrame(data_frame=data_frame).run_data_frame_processor_calculations()
+        self.assertIn("Day", data_frame.columns)
+
+    def test_records_per_stage_and_sheet(self):
+        with StageRecorder() as recorder:
+            for sheet_name in ["GT1.1", "GT1.2"]:
+                run = RunDataFrameCalculationsForOneDataFrame(data_frame=make_data_frame(), sheet_name=sheet_name)
+                run.run_data_frame_processor_calculations()
+                run.run_gas_composition_calculations()
+        self.assertIsNone(instrumentation.get_active_recorder())
+
+        report = recorder.report()
+        self.assertEqual([(record.sheet_name, record.stage) for record in report.records],
+                         [("GT1.1", "run_data_frame_processor_calculations"),
+                          ("GT1.1", "run_gas_composition_calculations"),
+                          ("GT1.2", "run_data_frame_processor_calculations"),
+                          ("GT1.2", "run_gas_composition_calculations")])
+        self.assertEqual(report.records[0].columns_created, ["Day + Time", "Day"])
+        self.assertEqual(report.records[0].rows, 3)
+
+        per_stage = report.per_stage()
+        self.assertEqual(per_stage["run_gas_composition_calculations"]["calls"], 2)
+        self.assertEqual(per_stage["run_gas_composition_calculations"]["columns_created"], 12)
+        self.assertEqual(set(report.per_sheet().keys()), {"GT1.1", "GT1.2"})
+
+    def test_export_json_and_chrome_trace(self):
+        with StageRecorder() as recorder:
+            RunDataFrameCalculationsForOneDataFrame(data_frame=make_data_frame(),
+                                                    sheet_name="GT1.1").run_data_frame_processor_calculations()
+        report = recorder.report()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path_json = os.path.join(directory, "report.json")
+            path_trace = os.path.join(directory, "trace.json")
+            report.to_json(path_json)
+            report.to_chrome_trace(path_trace)
+            with open(path_json) as file:
+                self.assertEqual(json.load(file)["records"][0]["stage"], "run_data_frame_processor_calculations")
+            with open(path_trace) as file:
+                trace_events = json.load(file)["traceEvents"]
+
+        complete_events = [event for event in trace_events if event["ph"] == "X"]
+        self.assertEqual(len(complete_events), 1)
+        self.assertEqual(complete_events[0]["args"]["rows"], 3)
+
+
+class TestMemoryRecorder(unittest.TestCase):
+
+    def test_records_memory_per_stage(self):
+        with MemoryRecorder() as memory_recorder, StageRecorder() as stage_recorder:
+            run = RunDataFrameCalculationsForOneDataFrame(data_frame=make_data_frame(), sheet_name="GT1.1")
+            run.run_data_frame_processor_calculations()
+            with record_block("load_workbook_values"):
+                values = [0.0] * 100000
+        del values
+        self.assertIsNone(instrumentation.get_active_recorder())
+
+        self.assertEqual([record.stage for record in memory_recorder.records],
+                         ["run_data_frame_processor_calculations", "load_workbook_values"])
+        self.assertEqual(len(stage_recorder.records), 2)
+        record_calculations, record_block_values = memory_recorder.records
+        self.assertEqual(record_calculations.sheet_name, "GT1.1")
+        self.assertGreater(record_calculations.data_frame_memory, 0)
+        self.assertIsNone(record_block_values.data_frame_memory)
+        self.assertGreaterEqual(record_block_values.traced_peak, 800000)
+
+        report = memory_recorder.report()
+        self.assertEqual(set(report["per_stage"].keys()),
+                         {"run_data_frame_processor_calculations", "load_workbook_values"})
+        self.assertTrue(len(report["top_allocators"]) > 0)
+        self.assertEqual(json.loads(memory_recorder.report_to_json())["stages"][0]["sheet_name"], "GT1.1")
+
+    def test_records_data_frames_per_sheet(self):
+        memory_recorder = MemoryRecorder(trace_python_allocations=False)
+        dict_data_frames = {"GT1.1": make_data_frame(), "GT1.2": pd.concat([make_data_frame()] * 10)}
+        dict_memory = memory_recorder.record_data_frames(dict_data_frames)
+        self.assertEqual(dict_memory["GT1.1"], int(dict_data_frames["GT1.1"].memory_usage(deep=True).sum()))
+        self.assertGreater(dict_memory["GT1.2"], dict_memory["GT1.1"])
+
+    def test_memory_budget_exceeded(self):
+        if instrumentation.get_current_rss() is None:
+            self.skipTest("the RSS can not be measured on this platform")
+        with self.assertRaises(MemoryBudgetExceeded) as context:
+            with MemoryRecorder(memory_budget=1, trace_python_allocations=False):
+                RunDataFrameCalculationsForOneDataFrame(data_frame=make_data_frame(),
+                                                        sheet_name="GT1.1").run_data_frame_processor_calculations()
+        self.assertIn("run_data_frame_processor_calculations", str(context.exception))
+        self.assertEqual(len(context.exception.report["stages"]), 1)
+        self.assertIsNone(instrumentation.get_active_recorder())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import unittest
+
+import numpy as np
+
+from benchmarks.kernel_scaling import KERNELS, discover_kernel_names, fit_exponent, find_scaling_problems, \
+    measure_scaling, load_baseline
+
+# the sizes and the time cap of the scaling test can be set with environment variables, for example
+# KERNEL_SCALING_SIZES="1000 10000 100000 1000000" KERNEL_SCALING_TIME_CAP=10 for the full measurement.
+SIZES = [int(size) for size in os.environ.get("KERNEL_SCALING_SIZES", "1000 10000 100000").split()]
+TIME_CAP = float(os.environ.get("KERNEL_SCALING_TIME_CAP", "1.0"))
+# the comparison with the absolute times of the baseline depends on the machine and its load, so it only runs as a
+# benchmark with KERNEL_SCALING_BASELINE=1
+COMPARE_WITH_BASELINE = os.environ.get("KERNEL_SCALING_BASELINE", "0") == "1"
+# generous, a quadratic kernel has an exponent of about 2, the noise of short timings stays well below this
+MAX_EXPONENT_IN_TESTS = float(os.environ.get("KERNEL_SCALING_MAX_EXPONENT", "1.5"))
+
+
+class TestKernelScaling(unittest.TestCase):
+
+    def test_all_kernels_are_registered(self):
+        self.assertEqual(sorted(discover_kernel_names()), sorted(KERNELS.keys()))
+
+    def test_fit_exponent(self):
+        sizes = [1_000, 10_000, 100_000]
+        self.assertAlmostEqual(fit_exponent(sizes, [1e-2 * size / 1_000 for size in sizes]), 1.0)
+        self.assertAlmostEqual(fit_exponent(sizes, [1e-2 * (size / 1_000) ** 2 for size in sizes]), 2.0)
+        # the overhead below the minimum time for the fit is left out
+        self.assertAlmostEqual(fit_exponent(sizes, [1e-4, 1e-2, 1e-1]), 1.0)
+        self.assertTrue(np.isnan(fit_exponent([1_000], [1.0])))
+
+    def test_find_scaling_problems(self):
+        results = {"linear": {"sizes": [1_000, 10_000], "times": [0.01, 0.1], "exponent": 1.0},
+                   "quadratic": {"sizes": [1_000, 10_000], "times": [0.01, 1.0], "exponent": 2.0}}
+        baseline = {"linear": {"sizes": [1_000, 10_000], "times": [0.001, 0.01]}}
+        problems = find_scaling_problems(results, baseline=baseline, regression_threshold=2.0)
+        self.assertEqual(len(problems), 3)
+        self.assertTrue(problems[0].startswith("linear is 10.0 times slower"))
+        self.assertTrue(problems[2].startswith("quadratic scales worse than linear"))
+
+    def test_at_least_two_sizes_are_timed(self):
+        kernel_name = next(iter(KERNELS))
+        result = measure_scaling(kernel_names=[kernel_name], sizes=[100, 200, 400], time_cap=0.0, repeat=1)[kernel_name]
+        self.assertEqual(result["sizes"], [100, 200])
+        self.assertEqual(result["skipped_sizes"], [400])
+        self.assertFalse(np.isnan(result["exponent"]))
+
+    def test_kernel_without_exponent_is_a_problem(self):
+        results = {"slow": {"sizes": [1_000], "times": [2.0], "exponent": np.nan, "skipped_sizes": [10_000]}}
+        problems = find_scaling_problems(results)
+        self.assertEqual(len(problems), 1)
+        self.assertTrue(problems[0].startswith("slow has no exponent"))
+
+    def test_kernels_scale_at_most_linear(self):
+        results = measure_scaling(sizes=SIZES, time_cap=TIME_CAP)
+        self.assertEqual(find_scaling_problems(results, max_exponent=MAX_EXPONENT_IN_TESTS), [])
+
+    @unittest.skipUnless(COMPARE_WITH_BASELINE, "set KERNEL_SCALING_BASELINE=1 to compare with the baseline")
+    def test_kernels_are_not_slower_than_the_baseline(self):
+        results = measure_scaling(sizes=SIZES, time_cap=TIME_CAP)
+        self.assertEqual(find_scaling_problems(results, baseline=load_baseline()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
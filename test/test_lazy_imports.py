@@ -0,0 +1,39 @@
+import os
+import sys
+import unittest
+
+from lazy_imports import LazyModule, lazy_import, measure_import_time
+
+# the import of the core modules takes about 0.05s, pandas alone takes about 0.3s and openpyxl about 0.15s
+IMPORT_TIME_BUDGET_SECONDS = float(os.environ.get("IMPORT_TIME_BUDGET_SECONDS", "0.25"))
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def test_lazy_module_is_imported_at_the_first_use(self):
+        sys.modules.pop("colorsys", None)
+        colorsys = lazy_import("colorsys")
+        self.assertIsInstance(colorsys, LazyModule)
+        self.assertNotIn("colorsys", sys.modules)
+        self.assertIn("not loaded", repr(colorsys))
+
+        self.assertEqual(colorsys.rgb_to_hsv(1.0, 0.0, 0.0), (0.0, 1.0, 1.0))
+        self.assertIn("colorsys", sys.modules)
+        self.assertIn("rgb_to_hsv", dir(colorsys))
+        self.assertNotIn("not loaded", repr(colorsys))
+
+    def test_lazy_import_returns_an_imported_module(self):
+        self.assertIs(lazy_import("os"), os)
+
+    def test_core_modules_do_not_import_the_heavy_dependencies(self):
+        measurement = measure_import_time(repeat=1)
+        self.assertEqual(measurement["heavy_modules_loaded"], [])
+
+    def test_import_time_budget(self):
+        measurement = measure_import_time()
+        self.assertLess(measurement["seconds"], IMPORT_TIME_BUDGET_SECONDS,
+                        f"the import of the core modules takes {measurement['seconds']:.3f}s")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,11 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
 
-from nice_functions import NiceExcelFunction
+from openpyxl import Workbook
+
+from nice_functions import NiceExcelFunction, HeaderIndex, WorkbookValueIndex, WorkbookReader
 
 
 class TestNiceExcelFunction(unittest.TestCase):
@@ -18,4 +23,149 @@ class TestNiceExcelFunction(unittest.TestCase):
         self.assertEqual(NiceExcelFunction.get_column_letter_from_index(27), 'AA')
         self.assertEqual(NiceExcelFunction.get_column_letter_from_index(28), 'AB')
         self.assertEqual(NiceExcelFunction.get_column_letter_from_index(53), 'BA')
-        self.assertEqual(NiceExcelFunction.get_column_letter_from_index(702), 'ZZ')
\ No newline at end of file
+        self.assertEqual(NiceExcelFunction.get_column_letter_from_index(702), 'ZZ')
+
+
+class TestHeaderIndex(unittest.TestCase):
+    def setUp(self):
+        self.workbook = Workbook()
+        self.sheet = self.workbook.active
+        for column, value in enumerate(["Sample ID", "Parallel", "Date", "CH4 [%]", "Date"], start=1):
+            self.sheet.cell(row=3, column=column, value=value)
+
+    def test_get_column_letter_and_index(self):
+        header_index = HeaderIndex.for_sheet(workbook=self.workbook, sheet_name="Sheet", header_row=3)
+        self.assertEqual(header_index.get_column_letter("CH4 [%]"), "D")
+        self.assertEqual(header_index.get_column_index("CH4 [%]"), 4)
+        # the first column with the name is used
+        self.assertEqual(header_index.get_column_letter("Date"), "C")
+
+    def test_bulk_lookup(self):
+        header_index = HeaderIndex.for_sheet(workbook=self.workbook, sheet_name="Sheet", header_row=3)
+        self.assertEqual(header_index.get_column_letters(["Sample ID", "CH4 [%]"]), {"Sample ID": "A", "CH4 [%]": "D"})
+        self.assertEqual(header_index.get_column_indexes(["Parallel"]), {"Parallel": 2})
+        with self.assertRaises(ValueError):
+            header_index.get_column_letters(["Sample ID", "O2 [%]"])
+
+    def test_cached_and_rebuilt_when_sheet_is_modified(self):
+        header_index = HeaderIndex.for_sheet(workbook=self.workbook, sheet_name="Sheet", header_row=3)
+        self.assertIs(HeaderIndex.for_sheet(workbook=self.workbook, sheet_name="Sheet", header_row=3), header_index)
+
+        self.sheet.cell(row=3, column=6, value="O2 [%]")
+        header_index = HeaderIndex.for_sheet(workbook=self.workbook, sheet_name="Sheet", header_row=3)
+        self.assertEqual(header_index.get_column_letter("O2 [%]"), "F")
+
+        # a name changed in place
+        self.sheet.cell(row=3, column=1, value="Sample")
+        HeaderIndex.invalidate(self.workbook, "Sheet")
+        header_index = HeaderIndex.for_sheet(workbook=self.workbook, sheet_name="Sheet", header_row=3)
+        self.assertEqual(header_index.get_column_letter("Sample"), "A")
+        with self.assertRaises(ValueError):
+            header_index.get_column_letter("Sample ID")
+
+    def test_lookup_does_not_read_the_header_row_again(self):
+        HeaderIndex.for_sheet(workbook=self.workbook, sheet_name="Sheet", header_row=3)
+        with mock.patch.object(HeaderIndex, "_read_header", side_effect=AssertionError("the header row is read")):
+            for _ in range(3):
+                column_letter = NiceExcelFunction.find_column_name_excel_index_based_on_column_name_string_in_given_row(
+                    workbook=self.workbook, sheet_name="Sheet", search_string="Parallel", header_row=3)
+                self.assertEqual(column_letter, "B")
+
+    def test_find_column_name_excel_index_based_on_column_name_string_in_given_row(self):
+        column_letter = NiceExcelFunction.find_column_name_excel_index_based_on_column_name_string_in_given_row(
+            workbook=self.workbook, sheet_name="Sheet", search_string="Parallel", header_row=3)
+        self.assertEqual(column_letter, "B")
+        with self.assertRaises(ValueError):
+            NiceExcelFunction.find_column_name_excel_index_based_on_column_name_string_in_given_row(
+                workbook=self.workbook, sheet_name="Sheet", search_string="N2 [%]", header_row=3)
+
+class TestWorkbookValueIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "workbook.xlsx")
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.title = "GT1.1"
+        sheet["C1"] = "Rgas"
+        sheet["D1"] = 8.314
+        for column, value in enumerate(["Sample ID", "P sample before gc [hPa]", "P sample after gc [hPa]"], start=1):
+            sheet.cell(row=11, column=column, value=value)
+        workbook.create_sheet("GT1.2")["A2"] = "Rgas"
+        workbook.save(self.path)
+
+    def tearDown(self):
+        WorkbookValueIndex.invalidate()
+        self.directory.cleanup()
+
+    def test_find_string_index(self):
+        self.assertEqual(NiceExcelFunction.find_string_index(self.path, "GT1.1", "Rgas"), (1, 3))
+        self.assertEqual(NiceExcelFunction.find_string_index(self.path, "GT1.2", "Rgas"), (2, 1))
+        self.assertEqual(NiceExcelFunction.find_string_index(self.path, "GT1.1", "Sample ID"), (11, 1))
+        self.assertEqual(NiceExcelFunction.find_string_index(self.path, "GT1.1", "Parallel"), (None, None))
+        # the 31st cell of the sheet (3 columns) is not searched with 30 iterations
+        self.assertEqual(NiceExcelFunction.find_string_index(self.path, "GT1.1", "Sample ID", max_iterations=30),
+                         (None, None))
+
+    def test_find_many_and_prefix(self):
+        value_index = WorkbookValueIndex.for_file(self.path)
+        # only the strings are indexed by default
+        self.assertEqual(value_index.find_many(["Rgas", 8.314]),
+                         {"Rgas": [("GT1.1", 1, 3), ("GT1.2", 2, 1)], 8.314: []})
+        self.assertEqual(WorkbookValueIndex.for_file(self.path, value_types=(str, float)).find(8.314),
+                         [("GT1.1", 1, 4)])
+        self.assertEqual(value_index.find_prefix("P sample", sheet_name="GT1.1"),
+                         {"P sample after gc [hPa]": [("GT1.1", 11, 3)],
+                          "P sample before gc [hPa]": [("GT1.1", 11, 2)]})
+        self.assertEqual(value_index.find_first("Rgas", sheet_name="GT1.2"), (2, 1))
+
+    def test_cached_and_rebuilt_when_file_is_changed(self):
+        value_index = WorkbookValueIndex.for_file(self.path)
+        self.assertIs(WorkbookValueIndex.for_file(self.path), value_index)
+
+        workbook = Workbook()
+        workbook.active.title = "GT1.1"
+        workbook.active["B5"] = "Rgas"
+        workbook.save(self.path)
+        os.utime(self.path, ns=(0, value_index.file_signature[0] + 1))
+
+        self.assertIsNot(WorkbookValueIndex.for_file(self.path), value_index)
+        self.assertEqual(NiceExcelFunction.find_string_index(self.path, "GT1.1", "Rgas"), (5, 2))
+
+
+
+class TestGetCellValues(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "workbook.xlsx")
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.title = "GT1.1"
+        for row, (name, value) in enumerate([("Rgas", 8314.5), ("expTemp", 293.15), ("volume_headspace", 0.961)],
+                                            start=1):
+            sheet.cell(row=row, column=3, value=name)
+            sheet.cell(row=row, column=4, value=value)
+        workbook.create_sheet("GT1.2")["D2"] = 300
+        workbook.save(self.path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_cell_values(self):
+        values = NiceExcelFunction.get_cell_values(self.path, [("GT1.1", "D1"), ("GT1.1", "C2:D3"),
+                                                               ("GT1.2", "D2"), ("GT1.2", "E20")])
+        self.assertEqual(values, {("GT1.1", "D1"): 8314.5,
+                                  ("GT1.1", "C2:D3"): (("expTemp", 293.15), ("volume_headspace", 0.961)),
+                                  ("GT1.2", "D2"): 300,
+                                  ("GT1.2", "E20"): None})
+
+    def test_get_cell_value_openpyxl(self):
+        self.assertEqual(NiceExcelFunction.get_cell_value_openpyxl(self.path, "GT1.1", "C2"), "expTemp")
+
+    def test_get_cell_value_pandas(self):
+        self.assertEqual(NiceExcelFunction.get_cell_value_pandas(self.path, "GT1.1", "D3"), 0.961)
+        self.assertEqual(NiceExcelFunction.get_cell_value_pandas(self.path, "GT1.2", "D2"), 300)
+
+    def test_workbook_reader_reuses_the_opened_file(self):
+        with WorkbookReader(self.path) as workbook_reader:
+            self.assertEqual(workbook_reader.get_cell_values([("GT1.1", "D2")]), {("GT1.1", "D2"): 293.15})
+            self.assertEqual(workbook_reader.get_cell_values([("GT1.2", "D2")]), {("GT1.2", "D2"): 300})
@@ -0,0 +1,82 @@
+import contextlib
+import io
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+import progress_events
+from progress_events import MemorySink, JsonlSink, LoggingSink, progress_sinks, emit_progress
+from run_data_frame_calculations import RunDataFrameCalculationsForOneDataFrame
+from validation_input_data.validate_input_data import validate_if_all_cells_are_correctly_filled
+
+
+def make_dict_data_frames() -> {str, pd.DataFrame}:
+    return {"GT1.1": pd.DataFrame({"CO2 [%]": [0.03, 1.53, "abc"], "Date": ["2023-04-17", "2023-04-19", "x"],
+                                   "Time": ["14:42:00", "14:42:00", "10:20:00"]}),
+            "GT1.2": pd.DataFrame({"CO2 [%]": [0.03, 1.2], "Date": ["2023-04-17", "2023-04-19"],
+                                   "Time": ["14:42:00", "14:42:00"]})}
+
+
+class TestProgressEvents(unittest.TestCase):
+
+    def test_nothing_is_emitted_without_sinks(self):
+        self.assertEqual(progress_events.get_sinks(), [])
+        self.assertIsNone(emit_progress(kind="load", step="load_workbook", rows=10, duration=1.0))
+
+    def test_show_process_prints_the_same_messages(self):
+        validation = validate_if_all_cells_are_correctly_filled(dict_data_frames=make_dict_data_frames())
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            validation.fill_dict_indexes_as_panda_indexes_no_int_or_float(
+                list_column_names_to_be_checked=["CO2 [%]"], show_process=True)
+        self.assertEqual(output.getvalue(),
+                         "GT1.1  with column CO2 [%] is done\nGT1.2  with column CO2 [%] is done\n")
+
+    def test_memory_sink_collects_validation_events(self):
+        validation = validate_if_all_cells_are_correctly_filled(dict_data_frames=make_dict_data_frames())
+        collector = MemorySink()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), progress_sinks(collector):
+            validation.fill_dict_indexes_as_panda_indexes_no_int_or_float(
+                list_column_names_to_be_checked=["CO2 [%]"])
+        self.assertEqual(output.getvalue(), "")
+        self.assertEqual(progress_events.get_sinks(), [])
+
+        self.assertEqual([(event.kind, event.sheet_name, event.rows) for event in collector.events],
+                         [("validate", "GT1.1", 3), ("validate", "GT1.2", 2)])
+        self.assertTrue(all(event.duration >= 0 for event in collector.events))
+        summary = collector.summary()["fill_dict_indexes_as_panda_indexes_no_int_or_float"]
+        self.assertEqual(summary["events"], 2)
+        self.assertEqual(summary["rows"], 5)
+
+    def test_compute_events_of_the_calculation_stages(self):
+        collector = MemorySink()
+        data_frame = pd.DataFrame({"Date": ["2023-04-17", "2023-04-19"], "Time": ["14:42:00", "10:20:00"]})
+        with progress_sinks(collector):
+            RunDataFrameCalculationsForOneDataFrame(data_frame=data_frame,
+                                                    sheet_name="GT1.1").run_data_frame_processor_calculations()
+        self.assertEqual([(event.kind, event.step, event.sheet_name, event.rows) for event in collector.events],
+                         [("compute", "run_data_frame_processor_calculations", "GT1.1", 2)])
+
+    def test_jsonl_and_logging_sinks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "progress.jsonl")
+            with self.assertLogs("gas_respiration.progress", level=logging.INFO) as logs:
+                with progress_sinks(JsonlSink(path, mode="w"), LoggingSink()):
+                    emit_progress(kind="write", step="replace_table_in_specific_sheet_with_data_frame",
+                                  sheet_name="GT1.1", rows=100, duration=0.5)
+            with open(path) as file:
+                lines = [json.loads(line) for line in file]
+
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]["sheet_name"], "GT1.1")
+        self.assertEqual(lines[0]["rows_per_second"], 200)
+        self.assertIn("GT1.1: 100 rows in 0.500s (200 rows/s)", logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
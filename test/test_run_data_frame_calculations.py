@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.generate_workbook import generate_workbook
+from excel_manager import ExcelManager, ExcelChunkWriter
+from run_data_frame_calculations import RunDataFrameCalculationsForOneDataFrame, RunDataFrameCalculationsInChunks
+from workbook_pipeline import WorkbookLayout, calculate_sheet, calculate_sheet_in_chunks, load_workbook_tables
+
+
+class TestRunDataFrameCalculationsInChunks(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temporary_directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.temporary_directory.name, "experiment.xlsx")
+        generate_workbook(path=cls.path, number_of_sheets=1, number_of_rows=40, flush_frequency=3)
+        cls.layout = WorkbookLayout()
+        manager = ExcelManager(cls.path)
+        manager.load_workbook()
+        dict_data_frames, dict_constants = load_workbook_tables(manager=manager, sheet_names=["GT1.1"],
+                                                                layout=cls.layout)
+        cls.data_frame = dict_data_frames["GT1.1"]
+        cls.constants = dict_constants["GT1.1"]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temporary_directory.cleanup()
+
+    def calculate_in_chunks(self, data_frame: pd.DataFrame, chunk_size: int) -> pd.DataFrame:
+        run = RunDataFrameCalculationsInChunks(
+            Rgas=self.constants["Rgas"], exp_temperature=self.constants["expTemp"],
+            volume_headspace=self.constants["volume_headspace"], molar_mass_carbon=self.constants["MM_C"],
+            dry_mass_sample=self.constants["dry_mass_sample"], water_volume_in_liters=self.constants["water_volume"],
+            first_row_gas_composition=self.layout.first_row_gas_composition)
+        chunks = [run.calculate_chunk(data_frame.iloc[start:start + chunk_size].copy())
+                  for start in range(0, len(data_frame), chunk_size)]
+        return pd.concat(chunks)
+
+    def assert_chunks_equal_whole_sheet(self, data_frame: pd.DataFrame) -> None:
+        with warnings.catch_warnings():
+            # the unknown flush values
+            warnings.simplefilter("ignore")
+            expected = calculate_sheet(data_frame=data_frame.copy(), constants=self.constants, layout=self.layout)
+            for chunk_size in (1, 2, 7, 40, 100):
+                with self.subTest(chunk_size=chunk_size):
+                    pd.testing.assert_frame_equal(self.calculate_in_chunks(data_frame, chunk_size), expected,
+                                                  check_exact=True)
+
+    def run_until_moles_produced(self, write_columns: bool) -> RunDataFrameCalculationsForOneDataFrame:
+        run = RunDataFrameCalculationsForOneDataFrame(data_frame=self.data_frame.copy())
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            run.run_data_frame_processor_calculations()
+            run.run_gas_composition_calculations(set_values_gas_composition_first_row=True,
+                                                 **self.layout.first_row_gas_composition)
+            run.run_mol_gases_before_and_after_sampling(Rgas=self.constants["Rgas"],
+                                                        exp_temperature=self.constants["expTemp"],
+                                                        volume_headspace=self.constants["volume_headspace"])
+            run.data_frame.loc[0, "mg_as"] = run.data_frame.loc[0, "mg_bs"]
+            run.run_mol_gas_composition_calculation(write_columns=write_columns)
+            run.run_moles_produced()
+        return run
+
+    def test_moles_produced_from_the_moles_array(self):
+        run = self.run_until_moles_produced(write_columns=False)
+        run_with_columns = self.run_until_moles_produced(write_columns=True)
+
+        self.assertEqual(run.moles.shape, (len(self.data_frame), 2, 4))
+        self.assertEqual(run.carbon_total.shape, (len(self.data_frame), 2))
+        self.assertFalse({"mCO2_b", "mN2_a", "mCTot_b", "mCTot_a"} & set(run.data_frame.columns))
+        for column_name in ("mCTot_produced", "O2 consumed", "CO2 produced"):
+            pd.testing.assert_series_equal(run.data_frame[column_name], run_with_columns.data_frame[column_name],
+                                           check_exact=True)
+        np.testing.assert_array_equal(run_with_columns.data_frame["mO2_a"].to_numpy(), run.moles[:, 1, 2])
+
+    def test_chunks_equal_whole_sheet(self):
+        self.assert_chunks_equal_whole_sheet(self.data_frame)
+
+    def test_chunks_equal_whole_sheet_with_empty_cells(self):
+        data_frame = self.data_frame.copy()
+        data_frame.loc[[6, 13], "P sample after gc [hPa]"] = np.nan
+        data_frame.loc[[9, 27], "Flush (1=yes; 0=no)"] = np.nan
+        data_frame.loc[[20, 21, 22], "CO2 [%]"] = np.nan
+        self.assert_chunks_equal_whole_sheet(data_frame)
+
+    def test_calculate_sheet_in_chunks_writes_every_chunk(self):
+        expected = calculate_sheet(data_frame=self.data_frame.copy(), constants=self.constants, layout=self.layout)
+        output_path = os.path.join(self.temporary_directory.name, "GT1.1_calculated.xlsx")
+        with ExcelChunkWriter(output_path, sheet_name="GT1.1") as writer:
+            result = calculate_sheet_in_chunks(path=self.path, sheet_name="GT1.1", write_chunk=writer.write_chunk,
+                                               chunk_size=16)
+
+        self.assertEqual(result, {"rows": 40, "chunks": 3})
+        written = pd.read_excel(output_path, sheet_name="GT1.1")
+        self.assertEqual(list(written.columns), list(expected.columns))
+        np.testing.assert_allclose(written["Ctot_DM [mg C/gDW]"], expected["Ctot_DM [mg C/gDW]"])
+        np.testing.assert_allclose(written["DIC_cum"], expected["DIC_cum"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+import pickle
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.generate_workbook import generate_workbook
+from excel_manager import ExcelManager
+from shared_frames import NAME_PREFIX, SharedFrame, SharedFrameManager, calculate_sheets_with_shared_memory
+from workbook_pipeline import WorkbookLayout, calculate_sheet, load_workbook_tables
+
+
+def make_data_frame(number_of_rows: int = 1000) -> pd.DataFrame:
+    return pd.DataFrame({
+        "Sample ID": ["GT1.1"] * number_of_rows,
+        "Date": pd.date_range("2023-04-17", periods=number_of_rows, freq="h"),
+        "CO2 [%]": np.linspace(0.03, 5, number_of_rows),
+        "CH4 [%]": np.linspace(0, 1, number_of_rows),
+        "Flush": np.arange(number_of_rows) % 3 == 0,
+        "Comments": [None] * number_of_rows,
+        "Parallel": np.arange(number_of_rows, dtype="int64"),
+    })
+
+
+def segment_exists(name: str) -> bool:
+    try:
+        shared_memory.SharedMemory(name=name).close()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def list_segments() -> set:
+    """The names of the shared frame segments, on Linux where the segments are files in /dev/shm."""
+    if not os.path.isdir("/dev/shm"):
+        return set()
+    return {name for name in os.listdir("/dev/shm") if name.startswith(NAME_PREFIX)}
+
+
+def create_result_and_die(shared_data_frame: SharedFrame, result_name: str) -> None:
+    """A worker which dies (for example out of memory) after it created the segment of its result."""
+    SharedFrame.create(shared_data_frame.attach(), name=result_name).close()
+    os._exit(1)
+
+
+class TestSharedFrame(unittest.TestCase):
+
+    def test_round_trip_keeps_columns_and_dtypes(self):
+        data_frame = make_data_frame()
+        with SharedFrameManager() as manager:
+            shared_frame = manager.share(data_frame)
+            received = pickle.loads(pickle.dumps(shared_frame))
+            pd.testing.assert_frame_equal(received.attach(), data_frame)
+            received.close()
+
+    def test_numeric_columns_are_views_and_only_metadata_is_pickled(self):
+        data_frame = make_data_frame(number_of_rows=100000).drop(columns=["Sample ID", "Comments"])
+        with SharedFrameManager() as manager:
+            shared_frame = manager.share(data_frame)
+            self.assertLess(len(pickle.dumps(shared_frame)), 2000)
+
+            received = pickle.loads(pickle.dumps(shared_frame))
+            attached = received.attach()
+            segment = np.ndarray(shape=(received.size,), dtype=np.uint8, buffer=received._shared_memory.buf)
+            for column_name in ("Date", "CO2 [%]", "Flush", "Parallel"):
+                self.assertTrue(np.shares_memory(attached[column_name].to_numpy(), segment))
+            del attached, segment
+            received.close()
+
+    def test_manager_frees_all_segments(self):
+        with SharedFrameManager() as manager:
+            name = manager.share(make_data_frame()).name
+            # a result segment which a worker created, but the worker never returned
+            reserved_name = manager.reserve_name()
+            SharedFrame.create(make_data_frame(), name=reserved_name).close()
+            self.assertTrue(segment_exists(name) and segment_exists(reserved_name))
+        self.assertFalse(segment_exists(name) or segment_exists(reserved_name))
+
+    def test_segment_of_a_dead_worker_is_freed(self):
+        segments_before = list_segments()
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            with SharedFrameManager() as manager:
+                result_name = manager.reserve_name()
+                future = executor.submit(create_result_and_die, manager.share(make_data_frame()), result_name)
+                with self.assertRaises(BrokenProcessPool):
+                    future.result()
+                self.assertTrue(segment_exists(result_name))
+        self.assertFalse(segment_exists(result_name))
+        self.assertEqual(list_segments(), segments_before)
+
+    def test_sheets_calculated_through_shared_memory(self):
+        self._test_sheets_calculated_through_shared_memory(lambda: ThreadPoolExecutor(max_workers=2))
+
+    def test_sheets_calculated_through_shared_memory_in_spawned_processes(self):
+        segments_before = list_segments()
+        self._test_sheets_calculated_through_shared_memory(
+            lambda: ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn")))
+        self.assertEqual(list_segments(), segments_before)
+
+    def _test_sheets_calculated_through_shared_memory(self, create_executor):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "experiment.xlsx")
+            generate_workbook(path=path, number_of_sheets=2, number_of_rows=20)
+            layout = WorkbookLayout()
+            manager = ExcelManager(path)
+            manager.load_workbook()
+            dict_data_frames, dict_constants = load_workbook_tables(manager=manager, sheet_names=["GT1.1", "GT1.2"],
+                                                                    layout=layout)
+
+            with create_executor() as executor:
+                dict_calculated_data_frames, dict_errors = calculate_sheets_with_shared_memory(
+                    {sheet_name: data_frame.copy() for sheet_name, data_frame in dict_data_frames.items()},
+                    dict_constants, layout, executor)
+
+            self.assertEqual(dict_errors, {})
+            for sheet_name, data_frame in dict_data_frames.items():
+                expected = calculate_sheet(data_frame=data_frame, constants=dict_constants[sheet_name],
+                                           layout=layout, sheet_name=sheet_name)
+                pd.testing.assert_frame_equal(dict_calculated_data_frames[sheet_name], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,8 @@ import unittest
 import numpy as np
 import pandas as pd
 
-from statistics.statistics import find_column_outliers
+from statistics.statistics import find_column_outliers, find_outliers_in_columns, find_outliers_in_sheets, \
+    find_segment_outliers_in_sheets
 
 
 class TestFindColumnOutliers(unittest.TestCase):
@@ -70,6 +71,83 @@ class TestFindColumnOutliers(unittest.TestCase):
         self.assertEqual(result_B['B']['outliers'], expected_values_B)
 
 
+
+class TestFindOutliersInColumnsAndSheets(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0)  # for reproducibility
+        self.dict_data_frames = {}
+        for sheet_number in range(4):
+            df = pd.DataFrame({'A': np.random.normal(0, 1, 100), 'B': np.random.normal(5, 2, 100)})
+            df.at[sheet_number, 'A'] = 10
+            df.at[50 + sheet_number, 'B'] = -50
+            self.dict_data_frames[f"GT{sheet_number}"] = df
+
+    def test_find_outliers_in_columns_equals_find_column_outliers(self):
+        df = self.dict_data_frames["GT0"]
+        result = find_outliers_in_columns(df, ['A', 'B'])
+        for column_name in ['A', 'B']:
+            self.assertEqual(result[column_name].tolist(), find_column_outliers(df, column_name,
+                                                                                return_only_indexes=True))
+
+    def test_find_outliers_in_columns_with_text(self):
+        df = pd.DataFrame({'A': list(range(1, 51)) + [1000, 'text']})
+        result = find_outliers_in_columns(df, ['A'])
+        self.assertEqual(result['A'].tolist(), [50])
+
+    def test_find_outliers_in_sheets_equals_per_sheet(self):
+        result = find_outliers_in_sheets(self.dict_data_frames, ['A', 'B'])
+        self.assertEqual(list(result.keys()), list(self.dict_data_frames.keys()))
+        for sheet_name, df in self.dict_data_frames.items():
+            for column_name in ['A', 'B']:
+                self.assertEqual(result[sheet_name][column_name].tolist(),
+                                 find_column_outliers(df, column_name, return_only_indexes=True))
+
+    def test_find_outliers_in_sheets_pooled(self):
+        dict_data_frames = {"low": pd.DataFrame({'A': list(range(0, 50))}),
+                            "high": pd.DataFrame({'A': list(range(50, 100)) + [1000]})}
+        result = find_outliers_in_sheets(dict_data_frames, ['A'], pooled=True)
+        self.assertEqual(result["low"]['A'].tolist(), [])
+        self.assertEqual(result["high"]['A'].tolist(), [50])
+
+    def test_find_outliers_in_sheets_empty(self):
+        self.assertEqual(find_outliers_in_sheets({}, ['A']), {})
+
+
+class TestFindSegmentOutliersInSheets(unittest.TestCase):
+
+    def setUp(self):
+        # CO2 climbs about 0.5 per measurement and resets at every flush
+        flush = ([1] + [0] * 9) * 3
+        co2 = []
+        for segment in range(3):
+            co2 += list(np.cumsum(0.5 + 0.02 * np.sin(np.arange(10) + segment)))
+        self.data_frame = pd.DataFrame({"CO2 [%]": co2, "Flush (1=yes; 0=no)": flush})
+
+    def test_no_outliers_at_the_flushes(self):
+        result = find_segment_outliers_in_sheets({"GT1.1": self.data_frame}, ["CO2 [%]"])
+        self.assertEqual(result["GT1.1"]["CO2 [%]"].tolist(), [])
+
+    def test_spike_within_segment_is_found(self):
+        data_frame = self.data_frame.copy()
+        data_frame.loc[15, "CO2 [%]"] += 1.5
+        # the spike is within the range of the column, so the IQR method does not find it
+        self.assertEqual(find_column_outliers(data_frame, "CO2 [%]", return_only_indexes=True), [])
+
+        result = find_segment_outliers_in_sheets({"GT1.1": data_frame}, ["CO2 [%]"])
+        self.assertIn(15, result["GT1.1"]["CO2 [%]"].tolist())
+
+    def test_sheets_are_scored_apart(self):
+        data_frame = self.data_frame.copy()
+        data_frame.loc[25, "CO2 [%]"] += 1.5
+        result = find_segment_outliers_in_sheets({"GT1.1": self.data_frame, "GT1.2": data_frame}, ["CO2 [%]"])
+        self.assertEqual(result["GT1.1"]["CO2 [%]"].tolist(), [])
+        self.assertIn(25, result["GT1.2"]["CO2 [%]"].tolist())
+
+    def test_find_segment_outliers_in_sheets_empty(self):
+        self.assertEqual(find_segment_outliers_in_sheets({}, ["CO2 [%]"]), {})
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from statistics.streaming_outliers import QuantileSketch, IncrementalOutlierDetector
+from validation_input_data.validate_input_data import ValidateInputDataStatistics
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def test_quantiles_exact_when_small(self):
+        sketch = QuantileSketch(k=200)
+        sketch.update_many(range(1, 101))
+        np.testing.assert_array_equal(sketch.quantiles([0.25, 0.75]), [25, 75])
+
+    def test_quantiles_large_stream_bounded_memory(self):
+        values = np.random.default_rng(0).normal(0, 1, 100_000)
+        sketch = QuantileSketch(k=200, seed=0)
+        for block in np.array_split(values, 100):
+            sketch.update_many(block)
+        self.assertEqual(sketch.count, 100_000)
+        self.assertLess(sum(len(compactor) for compactor in sketch.compactors), 1000)
+        np.testing.assert_allclose(sketch.quantiles([0.25, 0.75]), np.quantile(values, [0.25, 0.75]), atol=0.05)
+
+    def test_merge(self):
+        rng = np.random.default_rng(1)
+        values_1, values_2 = rng.normal(0, 1, 20_000), rng.normal(5, 1, 20_000)
+        sketch_1, sketch_2 = QuantileSketch(seed=1), QuantileSketch(seed=2)
+        sketch_1.update_many(values_1)
+        sketch_2.update_many(values_2)
+        sketch_1.merge(sketch_2)
+        self.assertEqual(sketch_1.count, 40_000)
+        np.testing.assert_allclose(sketch_1.quantiles([0.5]), np.quantile(np.r_[values_1, values_2], [0.5]),
+                                   atol=0.3)
+
+    def test_nan_is_skipped(self):
+        sketch = QuantileSketch()
+        sketch.update_many([1.0, np.nan, 3.0])
+        self.assertEqual(sketch.count, 2)
+
+
+class TestIncrementalOutlierDetector(unittest.TestCase):
+
+    def test_too_few_measurements_no_outliers(self):
+        detector = IncrementalOutlierDetector(minimum_number_of_measurements=20)
+        self.assertFalse(detector.screen("GT1.1", "CO2 [%]", [1.0, 1000.0]).any())
+
+    def test_new_rows_flagged_against_history(self):
+        detector = IncrementalOutlierDetector()
+        detector.screen("GT1.1", "CO2 [%]", list(range(1, 51)))
+
+        data_frame = pd.DataFrame({"CO2 [%]": [25.0, 1000.0, "text"]}, index=[50, 51, 52])
+        result = detector.screen_data_frame("GT1.1", data_frame, ["CO2 [%]"])
+        self.assertEqual(result, {"CO2 [%]": [51]})
+        self.assertEqual(detector.get_sketch("GT1.1", "CO2 [%]").count, 52)
+
+    def test_screen_against_merged_parallels(self):
+        detector = IncrementalOutlierDetector()
+        detector.screen("GT1.1", "CO2 [%]", list(range(0, 50)))
+        detector.screen("GT1.2", "CO2 [%]", list(range(50, 100)))
+        outliers = detector.screen("GT1.1", "CO2 [%]", [90.0], update=False)
+        self.assertTrue(outliers[0])
+        outliers = detector.screen("GT1.1", "CO2 [%]", [90.0], reference_sample_keys=["GT1.1", "GT1.2"])
+        self.assertFalse(outliers[0])
+
+    def test_save_and_load(self):
+        detector = IncrementalOutlierDetector()
+        detector.screen("GT1.1", "CO2 [%]", list(range(1, 51)))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sketches.json")
+            self.assertEqual(IncrementalOutlierDetector.load(path).dict_sketches, {})
+            detector.save(path)
+            loaded_detector = IncrementalOutlierDetector.load(path)
+        np.testing.assert_array_equal(loaded_detector.get_sketch("GT1.1", "CO2 [%]").quantiles([0.25, 0.75]),
+                                      detector.get_sketch("GT1.1", "CO2 [%]").quantiles([0.25, 0.75]))
+        self.assertTrue(loaded_detector.screen("GT1.1", "CO2 [%]", [1000.0])[0])
+
+    def test_validation_screens_only_the_new_rows(self):
+        data_frame = pd.DataFrame({"CO2 [%]": [float(value) for value in range(1, 51)]})
+        validation = ValidateInputDataStatistics({"GT1.1": data_frame})
+        detector = IncrementalOutlierDetector()
+        self.assertEqual(validation.fill_dict_streaming_outliers_indexes_as_pandas(["CO2 [%]"], detector),
+                         {"GT1.1": {}})
+
+        data_frame.loc[50] = 1000.0
+        result = validation.fill_dict_streaming_outliers_indexes_as_pandas(
+            ["CO2 [%]"], detector, dict_sheet_name_new_indexes={"GT1.1": [50]})
+        self.assertEqual(result, {"GT1.1": {"CO2 [%]": [50]}})
+        self.assertEqual(detector.get_sketch("GT1.1", "CO2 [%]").count, 51)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ import pandas as pd
 
 from validation_input_data.general_validation_functions import validate_if_there_is_a_float_or_integer_in_cell, \
     validate_if_there_is_a_specific_string
+from validation_input_data.validate_input_data import validate_if_all_cells_are_correctly_filled
 
 
 class DataFrameValidationTest(unittest.TestCase):
@@ -98,3 +99,84 @@ class TestValidation(unittest.TestCase):
         self.assertEqual(column_name, 'Column2')
         self.assertEqual(result, [4, 5])
 
+
+class TestFailFastValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.list_column_names = ["CH4 [%]", "CO2 [%]"]
+        self.dict_data_frames = {
+            "GT1.1": pd.DataFrame({"CH4 [%]": [1.0, "a", "b", 4.0] * 100, "CO2 [%]": [1.0, 2.0, 3.0, 4.0] * 100}),
+            "GT1.2": pd.DataFrame({"CH4 [%]": [1.0, 2.0, 3.0, 4.0], "CO2 [%]": [1.0, 2.0, None, 4.0]}),
+            "GT2.1": pd.DataFrame({"CH4 [%]": [1.0, 2.0], "CO2 [%]": [1.0, 2.0]}),
+        }
+
+    def test_stops_at_first_violation(self):
+        validation = validate_if_all_cells_are_correctly_filled(dict_data_frames=self.dict_data_frames,
+                                                                error_budget=0)
+        validation.rows_per_block_error_budget = 4
+        result = validation.fill_dict_indexes_as_panda_indexes_no_int_or_float(
+            list_column_names_to_be_checked=self.list_column_names)
+
+        self.assertTrue(validation.error_budget_exceeded)
+        self.assertEqual(result, {"GT1.1": {"CH4 [%]": [1, 2]}, "GT1.2": {}, "GT2.1": {}})
+
+    def test_error_budget_per_sheet(self):
+        validation = validate_if_all_cells_are_correctly_filled(dict_data_frames=self.dict_data_frames,
+                                                                error_budget=1, error_budget_per_sheet=True)
+        result = validation.fill_dict_indexes_as_panda_indexes_no_int_or_float(
+            list_column_names_to_be_checked=self.list_column_names)
+
+        self.assertEqual(validation.list_sheet_names_over_error_budget, ["GT1.1"])
+        self.assertEqual(result["GT1.2"], {"CO2 [%]": [2]})
+        self.assertEqual(validation.dict_number_of_errors["GT1.2"], 1)
+
+    def test_without_error_budget_everything_is_validated(self):
+        validation = validate_if_all_cells_are_correctly_filled(dict_data_frames=self.dict_data_frames)
+        result = validation.fill_dict_indexes_as_panda_indexes_no_int_or_float(
+            list_column_names_to_be_checked=self.list_column_names)
+
+        self.assertEqual(len(result["GT1.1"]["CH4 [%]"]), 200)
+        self.assertFalse(validation.error_budget_exceeded)
+
+    def test_run_validation_cheap_rules_first(self):
+        dict_data_frames = {"GT2.1": self.dict_data_frames["GT2.1"]}
+        validation = validate_if_all_cells_are_correctly_filled(dict_data_frames=dict_data_frames, error_budget=0)
+        self.assertTrue(validation.run_validation_cheap_rules_first(
+            list_column_names_to_be_checked=self.list_column_names))
+
+        validation = validate_if_all_cells_are_correctly_filled(dict_data_frames=dict_data_frames, error_budget=0)
+        is_valid = validation.run_validation_cheap_rules_first(list_column_names_to_be_checked=self.list_column_names,
+                                                               column_name_date="Date")
+        self.assertFalse(is_valid)
+        self.assertEqual(validation.dict_missing_column_names, {"GT2.1": ["Date"]})
+        self.assertEqual(validation.dict_indexes_as_panda_indexes_no_int_or_float, {"GT2.1": {}})
+
+    def test_sample_ids_and_parallels_need_their_lists(self):
+        validation = validate_if_all_cells_are_correctly_filled(dict_data_frames=self.dict_data_frames)
+        with self.assertRaises(ValueError):
+            validation.run_validation_cheap_rules_first(list_column_names_to_be_checked=self.list_column_names,
+                                                        column_name_sample_id="Sample ID")
+        with self.assertRaises(ValueError):
+            validation.run_validation_cheap_rules_first(list_column_names_to_be_checked=self.list_column_names,
+                                                        column_name_parallel="Parallel", list_sample_ids=["GT1.1"])
+        # nothing is validated before the error
+        self.assertIsNone(validation.dict_missing_column_names)
+
+    def test_sheets_with_missing_columns_are_skipped(self):
+        dict_data_frames = {
+            "GT2.1": self.dict_data_frames["GT2.1"],
+            "GT2.2": pd.DataFrame({"CH4 [%]": [1.0, "a"], "CO2 [%]": [1.0, 2.0], "Date": ["2023-04-17", "x"]}),
+        }
+        for error_budget in (None, 5):
+            validation = validate_if_all_cells_are_correctly_filled(dict_data_frames=dict_data_frames,
+                                                                    error_budget=error_budget)
+            is_valid = validation.run_validation_cheap_rules_first(
+                list_column_names_to_be_checked=self.list_column_names, column_name_date="Date")
+
+            # without a budget every error makes the workbook invalid, 3 errors are within a budget of 5
+            self.assertEqual(is_valid, error_budget is not None)
+            self.assertEqual(validation.dict_missing_column_names, {"GT2.1": ["Date"]})
+            # the other sheet is still validated
+            self.assertEqual(validation.dict_indexes_as_panda_indexes_no_int_or_float["GT2.2"], {"CH4 [%]": [1]})
+            self.assertEqual(validation.dict_indexes_as_pandas_incorrect_date["GT2.2"], {"Date": [1]})
+            self.assertEqual(validation.dict_indexes_as_pandas_incorrect_date["GT2.1"], {})
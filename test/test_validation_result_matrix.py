@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from validation_input_data.validate_input_data import validate_if_all_cells_are_correctly_filled
+from validation_input_data.validation_result_matrix import ValidationResultMatrix
+
+
+class TestValidationResultMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.dict_rule_names_results = {
+            "no_int_or_float": {"GT1.1": {"CH4 [%]": [1, 3], "CO2 [%]": [3]}, "GT1.2": {}},
+            "incorrect_date": {"GT1.1": {"Date": [0]}, "GT1.2": {"Date": [5]}},
+            "incorrect_time": None,
+        }
+        self.matrix = ValidationResultMatrix.from_dict_rule_names_results(self.dict_rule_names_results)
+
+    def test_from_dict_rule_names_results_shape(self):
+        self.assertEqual(self.matrix.rule_names, ["no_int_or_float", "incorrect_date"])
+        self.assertEqual(self.matrix.masks.shape, (2, 6, 3))
+        self.assertEqual(self.matrix.masks.dtype, np.uint8)
+
+    def test_rows_failing_any_rule(self):
+        rows = self.matrix.rows_failing_any_rule()
+        np.testing.assert_array_equal(rows["GT1.1"], [0, 1, 3])
+        np.testing.assert_array_equal(rows["GT1.2"], [5])
+        np.testing.assert_array_equal(self.matrix.rows_failing_any_rule(sheet_name="GT1.2"), [5])
+
+    def test_rows_failing_rule(self):
+        np.testing.assert_array_equal(self.matrix.rows_failing_rule("no_int_or_float", "GT1.1"), [1, 3])
+        np.testing.assert_array_equal(self.matrix.rows_failing_rule("incorrect_date", "GT1.1"), [0])
+
+    def test_count_per_rule(self):
+        self.assertEqual(self.matrix.count_per_rule(), {"no_int_or_float": 3, "incorrect_date": 2})
+
+        counts = self.matrix.count_per_rule_per_sheet()
+        self.assertEqual(counts.loc["GT1.1", "no_int_or_float"], 3)
+        self.assertEqual(counts.loc["GT1.2", "no_int_or_float"], 0)
+        self.assertEqual(counts.loc["GT1.2", "incorrect_date"], 1)
+
+    def test_to_dict_sheet_name_column_names_indexes(self):
+        result = self.matrix.to_dict_sheet_name_column_names_indexes("no_int_or_float")
+        self.assertEqual(result, {"GT1.1": {"CH4 [%]": [1, 3], "CO2 [%]": [3]}, "GT1.2": {}})
+
+    def test_to_data_frame(self):
+        data_frame = self.matrix.to_data_frame()
+        self.assertEqual(len(data_frame), 5)
+        self.assertEqual(data_frame["no_int_or_float"].sum(), 3)
+        self.assertEqual(data_frame["incorrect_date"].sum(), 2)
+
+    def test_to_json_and_from_json(self):
+        matrix = ValidationResultMatrix.from_json(self.matrix.to_json())
+        np.testing.assert_array_equal(matrix.masks, self.matrix.masks)
+        self.assertEqual(matrix.sheet_names, self.matrix.sheet_names)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "matrix.json")
+            self.matrix.to_json(path)
+            matrix = ValidationResultMatrix.from_json(path)
+        np.testing.assert_array_equal(matrix.masks, self.matrix.masks)
+
+    def test_get_validation_result_matrix_of_validation_class(self):
+        data_frame = pd.DataFrame({"CH4 [%]": [1.0, "a", 3.0], "CO2 [%]": [1.0, 2.0, None]})
+        validation = validate_if_all_cells_are_correctly_filled(dict_data_frames={"GT1.1": data_frame})
+        validation.fill_dict_indexes_as_panda_indexes_no_int_or_float(
+            list_column_names_to_be_checked=["CH4 [%]", "CO2 [%]"])
+
+        matrix = validation.get_validation_result_matrix()
+        self.assertEqual(matrix.rule_names, ["no_int_or_float"])
+        np.testing.assert_array_equal(matrix.rows_failing_any_rule(sheet_name="GT1.1"), [1, 2])
+
+    def test_every_sheet_has_its_own_number_of_rows(self):
+        self.assertEqual(self.matrix.get_sheet_masks("GT1.1").shape, (4, 3))
+        self.assertEqual(self.matrix.get_sheet_masks("GT1.2").shape, (6, 3))
+
+    def test_rules_added_later_get_a_larger_integer_type(self):
+        for number in range(8):
+            self.matrix.set_rule_failed(rule_name=f"rule_{number}", sheet_name="GT1.1", column_name="O2 [%]",
+                                        indexes=[number])
+        self.assertEqual(self.matrix.masks.dtype, np.uint16)
+        self.assertEqual(self.matrix.to_dict_sheet_name_column_names_indexes("rule_7"), {"GT1.1": {"O2 [%]": [7]},
+                                                                                        "GT1.2": {}})
+        self.assertEqual(self.matrix.count_per_rule()["no_int_or_float"], 3)
+
+    def test_validation_writes_the_matrix_while_validating(self):
+        data_frame = pd.DataFrame({"CH4 [%]": [1.0, "a", 3.0], "Date": ["2023-04-17", "x", "2023-04-18"]})
+        validation = validate_if_all_cells_are_correctly_filled(
+            dict_data_frames={"GT1.1": data_frame, "GT1.2": data_frame.iloc[:2]})
+        with mock.patch.object(ValidationResultMatrix, "from_dict_rule_names_results",
+                               side_effect=AssertionError("the matrix is built from the dictionaries")):
+            validation.fill_dict_indexes_as_panda_indexes_no_int_or_float(list_column_names_to_be_checked=["CH4 [%]"])
+            validation.fill_dict_indexes_as_pandas_incorrect_date(column_name_date="Date")
+            matrix = validation.get_validation_result_matrix()
+
+        self.assertEqual(matrix.rule_names, ["no_int_or_float", "incorrect_date"])
+        self.assertEqual(matrix.get_sheet_masks("GT1.2").shape, (2, 2))
+        # the second row fails the first rule in the first column and the second rule in the second column
+        np.testing.assert_array_equal(matrix.get_sheet_masks("GT1.1")[1], [0b01, 0b10])
+        # the dictionaries are exported from the matrix
+        self.assertEqual(validation.dict_indexes_as_pandas_incorrect_date, {"GT1.1": {"Date": [1]},
+                                                                            "GT1.2": {"Date": [1]}})
+
+        # a rule which is run again replaces its results
+        validation.dict_data_frames["GT1.1"] = pd.DataFrame({"CH4 [%]": [1.0, 2.0, "b"],
+                                                             "Date": ["2023-04-17"] * 3})
+        validation.fill_dict_indexes_as_panda_indexes_no_int_or_float(list_column_names_to_be_checked=["CH4 [%]"])
+        np.testing.assert_array_equal(matrix.rows_failing_rule("no_int_or_float", "GT1.1"), [2])
+        np.testing.assert_array_equal(matrix.rows_failing_rule("incorrect_date", "GT1.1"), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
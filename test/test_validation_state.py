@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+from openpyxl import Workbook
+
+from validation_input_data import general_validation_functions
+from validation_input_data.validate_input_data import validate_if_all_cells_are_correctly_filled
+from validation_input_data.validation_state import ValidationState
+
+
+class TestValidationState(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path_state = os.path.join(self.directory.name, "validation_state.json")
+        self.data_frame = pd.DataFrame({"CH4 [%]": [1.0, "a", 3.0, 4.0], "CO2 [%]": [1.0, 2.0, 3.0, None]})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_validation(self, dict_data_frames):
+        validation_state = ValidationState.load(self.path_state)
+        validation = validate_if_all_cells_are_correctly_filled(dict_data_frames=dict_data_frames,
+                                                                validation_state=validation_state)
+        result = validation.fill_dict_indexes_as_panda_indexes_no_int_or_float(
+            list_column_names_to_be_checked=["CH4 [%]", "CO2 [%]"])
+        validation_state.save(self.path_state)
+        return validation, result
+
+    def test_start_validation_changed_rows(self):
+        validation_state = ValidationState()
+        dict_changed_indexes, _ = validation_state.start_validation({"GT1.1": self.data_frame})
+        self.assertEqual(dict_changed_indexes["GT1.1"].tolist(), [0, 1, 2, 3])
+
+        data_frame = self.data_frame.copy()
+        data_frame.loc[2, "CH4 [%]"] = 30.0
+        dict_changed_indexes, _ = validation_state.start_validation({"GT1.1": data_frame})
+        self.assertEqual(dict_changed_indexes["GT1.1"].tolist(), [2])
+
+    def test_first_run_equals_full_validation(self):
+        _, result = self.run_validation({"GT1.1": self.data_frame})
+        self.assertEqual(result, {"GT1.1": {"CH4 [%]": [1], "CO2 [%]": [3]}})
+
+    def test_second_run_only_validates_changed_rows(self):
+        self.run_validation({"GT1.1": self.data_frame})
+
+        data_frame = self.data_frame.copy()
+        data_frame.loc[1, "CH4 [%]"] = 2.0
+        data_frame.loc[0, "CO2 [%]"] = "b"
+
+        validate_function = general_validation_functions.validate_if_there_is_a_float_or_integer_in_cell
+        with mock.patch("validation_input_data.validate_input_data.validate_if_there_is_a_float_or_integer_in_cell",
+                        wraps=validate_function) as mocked_function:
+            mocked_function.__name__ = validate_function.__name__
+            validation, result = self.run_validation({"GT1.1": data_frame})
+
+        self.assertEqual(mocked_function.call_count, 2)
+        for call in mocked_function.call_args_list:
+            self.assertEqual(call.kwargs["data_frame"].index.tolist(), [0, 1])
+        self.assertEqual(result, {"GT1.1": {"CO2 [%]": [0, 3]}})
+
+    def test_unchanged_workbook_reuses_results(self):
+        self.run_validation({"GT1.1": self.data_frame})
+        validation, result = self.run_validation({"GT1.1": self.data_frame.copy()})
+        self.assertEqual(len(validation.dict_changed_indexes["GT1.1"]), 0)
+        self.assertEqual(result, {"GT1.1": {"CH4 [%]": [1], "CO2 [%]": [3]}})
+
+    def test_constants_are_reused_when_not_changed(self):
+        workbook = Workbook()
+        sheet = workbook.active
+        for row, value in enumerate([8314.5, None, 0.961], start=1):
+            sheet.cell(row=row, column=3, value=value)
+
+        validation_state = ValidationState()
+        validation = validate_if_all_cells_are_correctly_filled(dict_data_frames={}, validation_state=validation_state)
+        result = validation.fill_dict_with_indexes_as_excel_when_constants_is_not_filled(
+            workbook=workbook, start_row_constants_value=1, end_row_constants_value=3, column_letter_values="C")
+        self.assertEqual(result, {"Sheet": [2]})
+
+        sheet.cell(row=2, column=3, value=293.15)
+        result = validation.fill_dict_with_indexes_as_excel_when_constants_is_not_filled(
+            workbook=workbook, start_row_constants_value=1, end_row_constants_value=3, column_letter_values="C")
+        self.assertEqual(result, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+
+from openpyxl import load_workbook
+
+from benchmarks.generate_workbook import generate_workbook
+from progress_events import MemorySink, progress_sinks
+from watch_folder import FolderWatcher
+from workbook_pipeline import WorkbookLayout
+
+
+class TestFolderWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input_directory = os.path.join(self.directory, "input")
+        self.output_directory = os.path.join(self.directory, "output")
+        os.makedirs(self.input_directory)
+        self.path = os.path.abspath(os.path.join(self.input_directory, "experiment.xlsx"))
+        generate_workbook(path=self.path, number_of_sheets=2, number_of_rows=6)
+        self.watcher = FolderWatcher(directory=self.input_directory, output_directory=self.output_directory,
+                                     debounce_seconds=2.0, number_of_workers=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_debounce_and_lock_files(self):
+        open(os.path.join(self.input_directory, "~$experiment.xlsx"), "w").close()
+        self.assertEqual(self.watcher.poll_once(now=0.0), [])
+        self.assertEqual(self.watcher.poll_once(now=1.0), [])
+        # the workbook is saved again before the debounce time is over
+        with open(self.path, "ab") as file:
+            file.write(b"\0")
+        self.assertEqual(self.watcher.poll_once(now=2.5), [])
+        # and once more, the debounce time starts again
+        generate_workbook(path=self.path, number_of_sheets=2, number_of_rows=6)
+        self.assertEqual(self.watcher.poll_once(now=3.0), [])
+        self.assertEqual(self.watcher.poll_once(now=5.0), [self.path])
+        self.assertEqual(self.watcher.state.dict_results[self.path]["status"], "done")
+        # unchanged workbooks are not processed again
+        self.assertEqual(self.watcher.poll_once(now=10.0), [])
+        self.assertEqual(self.watcher.poll_once(now=20.0), [])
+
+    def test_only_changed_sheets_are_calculated(self):
+        self.watcher.poll_once(now=0.0)
+        self.watcher.poll_once(now=5.0)
+        result = self.watcher.state.dict_results[self.path]
+        self.assertEqual(result["calculated_sheets"], ["GT1.1", "GT1.2"])
+
+        layout = WorkbookLayout()
+        workbook = load_workbook(self.path)
+        workbook["GT1.2"].cell(row=layout.start_row_values_table_in_excel + 2, column=9, value=2.5)
+        workbook.save(self.path)
+
+        self.watcher.poll_once(now=10.0)
+        self.assertEqual(self.watcher.poll_once(now=15.0), [self.path])
+        result = self.watcher.state.dict_results[self.path]
+        self.assertEqual(result["calculated_sheets"], ["GT1.2"])
+
+        # the sheet which is not calculated again is kept in the export
+        sheet = load_workbook(result["output_path"])["GT1.1"]
+        self.assertIsNotNone(sheet.cell(row=layout.start_row_values_table_in_excel,
+                                        column=len(layout.column_names) + 5).value)
+        sheet = load_workbook(result["output_path"])["GT1.2"]
+        self.assertEqual(sheet.cell(row=layout.start_row_values_table_in_excel + 2, column=9).value, 2.5)
+
+    def test_progress_events_of_the_processed_workbooks(self):
+        collector = MemorySink()
+        with progress_sinks(collector):
+            self.watcher.poll_once(now=0.0)
+            self.watcher.poll_once(now=5.0)
+        events = [event for event in collector.events if event.step == "watch_folder"]
+        self.assertEqual([(event.kind, event.details["file_path"], event.details["status"]) for event in events],
+                         [("write", self.path, "done")])
+        self.assertGreater(events[0].duration, 0)
+
+    def test_new_pool_after_a_worker_died(self):
+        watcher = FolderWatcher(directory=self.input_directory, output_directory=self.output_directory,
+                                debounce_seconds=2.0, number_of_workers=1)
+        with watcher:
+            # the worker dies before the workbook is submitted
+            broken_executor = watcher.executor
+            with self.assertRaises(BrokenProcessPool):
+                broken_executor.submit(os._exit, 1).result()
+            watcher.poll_once(now=0.0)
+            self.assertEqual(watcher.poll_once(now=5.0), [self.path])
+            self.assertIsNot(watcher.executor, broken_executor)
+            watcher.collect_results(wait=True)
+            self.assertEqual(watcher.state.dict_results[self.path]["status"], "done")
+
+            # the worker dies while the workbook is in flight
+            broken_executor = watcher.executor
+            generate_workbook(path=self.path, number_of_sheets=2, number_of_rows=7)
+            broken_executor.submit(os._exit, 1)
+            watcher.submit(self.path)
+            watcher.collect_results(wait=True)
+            self.assertIsNot(watcher.executor, broken_executor)
+
+            # the new pool processes the next workbooks
+            generate_workbook(path=self.path, number_of_sheets=2, number_of_rows=8)
+            watcher.submit(self.path)
+            watcher.collect_results(wait=True)
+            self.assertEqual(watcher.state.dict_results[self.path]["status"], "done")
+
+    def test_output_directory_can_not_be_watched(self):
+        with self.assertRaises(ValueError):
+            FolderWatcher(directory=self.input_directory, output_directory=self.input_directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
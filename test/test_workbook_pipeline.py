@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+from openpyxl import load_workbook
+
+from benchmarks.generate_workbook import generate_workbook
+from workbook_pipeline import WorkbookLayout, process_workbook
+
+
+class TestProcessWorkbook(unittest.TestCase):
+
+    def test_process_workbook(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "experiment.xlsx")
+            generate_workbook(path=path, number_of_sheets=2, number_of_rows=10)
+            result = process_workbook(path=path, output_directory=os.path.join(directory, "output"))
+
+            self.assertEqual(result["status"], "done")
+            self.assertEqual(list(result["sheets"].keys()), ["GT1.1", "GT1.2"])
+            self.assertEqual(result["sheets"]["GT1.1"]["rows"], 10)
+            self.assertEqual(set(result["timings"].keys()), {"load", "validate", "calculate", "export"})
+
+            sheet = load_workbook(result["output_path"])["GT1.1"]
+            layout = WorkbookLayout()
+            first_row = [cell.value for cell in sheet[layout.start_row_values_table_in_excel]]
+            self.assertGreater(len(first_row), len(layout.column_names))
+            self.assertEqual(first_row[0], "GT1")
+            self.assertIsNone(sheet.cell(row=layout.start_row_values_table_in_excel + 10, column=1).value)
+
+    def test_failing_sheet_is_reported(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "experiment.xlsx")
+            generate_workbook(path=path, number_of_sheets=2, number_of_rows=10, invalid_cell_fraction=0.2)
+            result = process_workbook(path=path, output_directory=directory)
+
+            self.assertEqual(result["status"], "partial")
+            self.assertTrue(any(sheet["error"] is not None for sheet in result["sheets"].values()))
+            self.assertTrue(all(sheet["invalid_cells"] > 0 for sheet in result["sheets"].values()))
+            self.assertTrue(os.path.exists(result["output_path"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,15 @@
+from __future__ import annotations
+
+import time
 from datetime import datetime
 from typing import Dict, Any, List
 
-import pandas as pd
-from openpyxl.styles import PatternFill
+from lazy_imports import lazy_import
+from nice_functions import HeaderIndex
+from progress_events import emit_progress
 
-from nice_functions import NiceExcelFunction
+pd = lazy_import("pandas")
+openpyxl_styles = lazy_import("openpyxl.styles")
 
 
 def validate_if_there_is_a_float_or_integer_in_cell(data_frame: pd.DataFrame, column_name: str,
@@ -22,6 +27,24 @@ def validate_if_there_is_a_float_or_integer_in_cell(data_frame: pd.DataFrame, co
         return column_name, True
 
 
+def validate_if_there_is_a_float_or_integer_in_cell_when_flush(data_frame: pd.DataFrame, column_name: str,
+                                                               column_name_flush: str,
+                                                               start_row_values_table_in_excel: int = 0) -> tuple:
+    invalid_rows = []
+    column_in_data_frame_to_be_checked = data_frame[column_name]
+    column_in_data_frame_flush = data_frame[column_name_flush]
+    for index in column_in_data_frame_to_be_checked.index:
+        if column_in_data_frame_flush[index] == 1:
+            value = column_in_data_frame_to_be_checked[index]
+            if not isinstance(value, (float, int)) or pd.isnull(value):
+                invalid_rows.append(index + start_row_values_table_in_excel)
+
+    if len(invalid_rows) > 0:
+        return column_name, invalid_rows
+    else:
+        return column_name, True
+
+
 def validate_if_there_is_no_specific_float_or_integer_in_cell(data_frame: pd.DataFrame, column_name: str,
                                                               specific_float_or_integer: float | int,
                                                               start_row_values_table_in_excel: int = 0) -> tuple:
@@ -196,34 +219,54 @@ def style_color_cells_with_given_indexes(workbook, dict_sheet_name_column_names_
     :param start_row_values_table_in_excel: the starting row of the values of the table in Excel. In Excel the rows
     are starting with 1.
     """
-    color_fill = PatternFill(start_color=color, end_color=color, fill_type=fill_type)
+    color_fill = openpyxl_styles.PatternFill(start_color=color, end_color=color, fill_type=fill_type)
 
     for sheet_name, sheet_data in dict_sheet_name_column_names_indexes.items():
+        start = time.perf_counter()
         sheet = workbook[sheet_name]
+        dict_column_letters = HeaderIndex.for_sheet(workbook=workbook, sheet_name=sheet_name,
+                                                    header_row=header_row).get_column_letters(list(sheet_data.keys()))
         for column_name, indexes in sheet_data.items():
-            column_letter = NiceExcelFunction.find_column_name_excel_index_based_on_column_name_string_in_given_row(
-                workbook=workbook, sheet_name=sheet_name, search_string=column_name, header_row=header_row)
+            column_letter = dict_column_letters[column_name]
             for index in indexes:
                 index_row_in_excel = start_row_values_table_in_excel + index
                 column_and_row_excel_combination = column_letter + str(index_row_in_excel)
                 sheet[column_and_row_excel_combination].fill = color_fill
 
-        if show_process is True:
-            print(f"Finished with coloring {sheet_name}")
+        emit_progress(kind="write", step="style_color_cells_with_given_indexes", sheet_name=sheet_name,
+                      rows=sum(len(indexes) for indexes in sheet_data.values()),
+                      duration=time.perf_counter() - start, message=f"Finished with coloring {sheet_name}",
+                      show_process=show_process is True)
 
 
 def style_color_cells_with_given_excel_indexes_and_excel_column_name(workbook, dict_sheet_name_indexes: {},
                                                                      excel_column_name: str,
                                                                      color: str,
                                                                      fill_type: str,
-                                                                     show_process: bool = False) -> None:
-    color_fill = PatternFill(start_color=color, end_color=color, fill_type=fill_type)
+                                                                     show_process: bool = False,
+                                                                     header_row: int = None) -> None:
+    """
+
+    :param workbook: The workbook
+    :param dict_sheet_name_indexes: {sheet_name: row indexes in Excel}
+    :param excel_column_name: the column letter, or the column name in the header row when header_row is given.
+    :param color: the colorcode based on RGB colors
+    :param fill_type: Fill type: "solid", "gradient", "patter", "None"
+    :param show_process: when you like to see the process.
+    :param header_row: the row where the header is, the column letter is then looked up with the HeaderIndex.
+    """
+    color_fill = openpyxl_styles.PatternFill(start_color=color, end_color=color, fill_type=fill_type)
 
     for sheet_name, indexes in dict_sheet_name_indexes.items():
         sheet = workbook[sheet_name]
-        if show_process is True:
-            print(f"started with {sheet_name}")
+        column_letter = excel_column_name
+        if header_row is not None:
+            column_letter = HeaderIndex.for_sheet(workbook=workbook, sheet_name=sheet_name,
+                                                  header_row=header_row).get_column_letter(excel_column_name)
+        emit_progress(kind="write", step="style_color_cells_with_given_excel_indexes_and_excel_column_name",
+                      sheet_name=sheet_name, rows=len(indexes), message=f"started with {sheet_name}",
+                      show_process=show_process is True)
         for index in indexes:
             index_row_in_excel = index
-            column_and_row_excel_combination = excel_column_name + str(index_row_in_excel)
+            column_and_row_excel_combination = column_letter + str(index_row_in_excel)
             sheet[column_and_row_excel_combination].fill = color_fill
@@ -1,25 +1,74 @@
-import pandas as pd
-from openpyxl.workbook import Workbook
+from __future__ import annotations
 
+import time
+from typing import TYPE_CHECKING
+
+from instrumentation import instrumented_pass
+from lazy_imports import lazy_import
 from nice_functions import NiceExcelFunction
-from statistics.statistics import find_column_outliers
+from progress_events import emit_progress, emit_sheet_progress
+from statistics.statistics import find_outliers_in_sheets, find_segment_outliers_in_sheets
 from validation_input_data.general_validation_functions import validate_if_there_is_a_float_or_integer_in_cell, \
     validate_if_there_is_no_specific_float_or_integer_in_cell, validate_if_there_is_a_specific_string, \
     validate_if_there_is_in_cell_one_of_the_specific_strings, validate_if_in_cell_is_correct_date_or_not_filled, \
     validate_if_in_cell_is_correct_time_or_not_filled, style_color_cells_with_given_indexes, \
-    style_color_cells_with_given_excel_indexes_and_excel_column_name
+    style_color_cells_with_given_excel_indexes_and_excel_column_name, \
+    validate_if_there_is_a_float_or_integer_in_cell_when_flush
+from validation_input_data.validation_result_matrix import ValidationResultMatrix
+from validation_input_data.validation_state import ValidationState
+
+if TYPE_CHECKING:
+    from openpyxl.workbook import Workbook
+    from statistics.streaming_outliers import IncrementalOutlierDetector
+
+pd = lazy_import("pandas")
+
+
+# the names of the parameter with the checked column in the validation functions of general_validation_functions
+PARAMETER_NAMES_CHECKED_COLUMN = ("column_name", "column_name_date", "column_name_time")
 
 
 # TODO: write unit tests!
 class validate_if_all_cells_are_correctly_filled:
-    def __init__(self, dict_data_frames: {str, pd.DataFrame}):
+    # the number of rows that are validated at once when there is an error budget
+    rows_per_block_error_budget: int = 256
+
+    def __init__(self, dict_data_frames: {str, pd.DataFrame}, validation_state: ValidationState = None,
+                 error_budget: int = None, error_budget_per_sheet: bool = False):
         """
 
         :type dict_data_frames: {sheet name of sample, pd.DataFrame}
+        :param validation_state: the state of the previous validation run. When given only the changed rows and the
+        sheets with changed constants are validated, for all the other cells the previous results are reused. Save the
+        state after the run with validation_state.save(path).
+        :param error_budget: the number of invalid cells that is allowed. When more invalid cells are found the
+        validation stops (fail-fast), so with 0 it stops at the first invalid cell. None validates everything.
+        :param error_budget_per_sheet: when True the error budget is for every sheet and only the validation of the
+        sheet that is over the budget stops. When False the error budget is for the whole workbook.
         """
+        if validation_state is not None and error_budget is not None:
+            raise ValueError("An error budget can not be combined with a validation state, "
+                             "because the results of a fail-fast validation are not complete.")
+
         self.dict_data_frames = dict_data_frames
         self.sheet_names = self.dict_data_frames.keys()
 
+        self.error_budget = error_budget
+        self.error_budget_per_sheet = error_budget_per_sheet
+        self.error_budget_exceeded = False
+        self.number_of_errors = 0
+        self.dict_number_of_errors = {}
+        self.list_sheet_names_over_error_budget = []
+        # the sheets which can not be validated further, because columns are missing in the header
+        self.list_sheet_names_with_missing_columns = []
+
+        self.validation_state = validation_state
+        self.dict_changed_indexes = {}
+        self.dict_reusable_rule_results = {}
+        if validation_state is not None:
+            self.dict_changed_indexes, self.dict_reusable_rule_results = \
+                validation_state.start_validation(dict_data_frames=dict_data_frames)
+
         self.dict_indexes_as_panda_indexes_no_int_or_float = None
 
         self.dict_indexes_as_pandas_incorrect_sample_id = None
@@ -32,22 +81,154 @@ class validate_if_all_cells_are_correctly_filled:
         self.dict_indexes_as_pandas_incorrect_time = None
 
         self.dict_wrong_constants_for_each_sheet_name = None
+        self.dict_missing_column_names = None
+
+        # the invalid cells of all the rules, written by _validate_column; the dictionaries above are exported from it
+        self.validation_result_matrix = ValidationResultMatrix()
+        for sheet_name, data_frame in self.dict_data_frames.items():
+            self.validation_result_matrix.add_sheet(sheet_name, number_of_rows=len(data_frame))
+
+    def _count_errors(self, sheet_name: str, number_of_errors: int) -> None:
+        """Count the invalid cells of a sheet and check if the error budget is exceeded."""
+        self.number_of_errors += number_of_errors
+        self.dict_number_of_errors[sheet_name] = self.dict_number_of_errors.get(sheet_name, 0) + number_of_errors
+
+        if self.error_budget is None:
+            return
+
+        if self.error_budget_per_sheet:
+            if self.dict_number_of_errors[sheet_name] > self.error_budget:
+                self._stop_sheet(sheet_name)
+        elif self.number_of_errors > self.error_budget:
+            self.error_budget_exceeded = True
+
+    def _stop_sheet(self, sheet_name: str) -> None:
+        if sheet_name not in self.list_sheet_names_over_error_budget:
+            self.list_sheet_names_over_error_budget.append(sheet_name)
+        self.error_budget_exceeded = True
+
+    def _is_stopped(self, sheet_name: str) -> bool:
+        """
+        Check if the validation of a sheet must stop, because columns are missing in the header or because the error
+        budget is exceeded.
+        """
+        return sheet_name in self.list_sheet_names_with_missing_columns or self._is_over_error_budget(sheet_name)
+
+    def _is_over_error_budget(self, sheet_name: str) -> bool:
+        if self.error_budget is None:
+            return False
+        if self.error_budget_per_sheet:
+            return sheet_name in self.list_sheet_names_over_error_budget
+        return self.error_budget_exceeded
+
+    def _validate_column(self, rule_name: str, sheet_name: str, validation_function, **kwargs) -> list | bool:
+        """
+        Run a validation function of general_validation_functions on the data frame of a sheet and write the invalid
+        cells with the bit of the rule in validation_result_matrix.
+
+        With a validation state only the changed rows are validated. For the other rows the results of the previous
+        run are reused.
+
+        :param rule_name: the name of the rule in validation_result_matrix.
+        :param sheet_name: the name of the sheet.
+        :param validation_function: the validation function, which returns (column_name, indexes or True).
+        :param kwargs: the arguments for the validation function, without the data frame.
+        :return: the list with the invalid indexes or True when all the rows are valid.
+        """
+        data_frame = self.dict_data_frames[sheet_name]
+        column_name = next(kwargs[name] for name in PARAMETER_NAMES_CHECKED_COLUMN if name in kwargs)
+        self.validation_result_matrix.add_rule(rule_name)
+        # the results of a previous run of the rule on this column are replaced
+        self.validation_result_matrix.clear_rule(rule_name=rule_name, sheet_name=sheet_name, column_name=column_name)
+
+        if self.error_budget is not None:
+            return self._validate_column_with_error_budget(rule_name=rule_name, sheet_name=sheet_name,
+                                                           validation_function=validation_function, **kwargs)
+
+        if self.validation_state is None:
+            indexes = validation_function(data_frame=data_frame, **kwargs)[1]
+            if indexes is not True:
+                self.validation_result_matrix.set_rule_failed(rule_name=rule_name, sheet_name=sheet_name,
+                                                              column_name=column_name, indexes=indexes)
+                self._count_errors(sheet_name=sheet_name, number_of_errors=len(indexes))
+            return indexes
+
+        rule_key = validation_function.__name__ + repr(sorted(kwargs.items()))
+        reusable_indexes = self.dict_reusable_rule_results.get(rule_key, {}).get(sheet_name)
+
+        if reusable_indexes is None:
+            indexes = validation_function(data_frame=data_frame, **kwargs)[1]
+            invalid_indexes = [] if indexes is True else indexes
+        else:
+            changed_indexes = self.dict_changed_indexes[sheet_name]
+            invalid_indexes = set(reusable_indexes) - set(changed_indexes)
+            if len(changed_indexes) > 0:
+                indexes = validation_function(data_frame=data_frame.loc[changed_indexes], **kwargs)[1]
+                if indexes is not True:
+                    invalid_indexes.update(indexes)
+
+            # keep the order of the data frame and drop the rows that are removed
+            invalid_indexes = data_frame.index[data_frame.index.isin(list(invalid_indexes))].tolist()
+
+        self.validation_state.set_rule_result(rule_key=rule_key, sheet_name=sheet_name, indexes=invalid_indexes)
+
+        if len(invalid_indexes) > 0:
+            self.validation_result_matrix.set_rule_failed(rule_name=rule_name, sheet_name=sheet_name,
+                                                          column_name=column_name, indexes=invalid_indexes)
+            self._count_errors(sheet_name=sheet_name, number_of_errors=len(invalid_indexes))
+            return invalid_indexes
+        return True
+
+    def _validate_column_with_error_budget(self, rule_name: str, sheet_name: str, validation_function,
+                                           **kwargs) -> list | bool:
+        """
+        Run a validation function on blocks of rows and stop as soon as the error budget is exceeded.
+
+        :return: the list with the invalid indexes found until the stop, or True when all the rows are valid.
+        """
+        data_frame = self.dict_data_frames[sheet_name]
+        invalid_indexes = []
+        for start_row in range(0, len(data_frame), self.rows_per_block_error_budget):
+            column_name, indexes = validation_function(
+                data_frame=data_frame.iloc[start_row:start_row + self.rows_per_block_error_budget], **kwargs)
+            if indexes is not True:
+                self.validation_result_matrix.set_rule_failed(rule_name=rule_name, sheet_name=sheet_name,
+                                                              column_name=column_name, indexes=indexes)
+                invalid_indexes.extend(indexes)
+                self._count_errors(sheet_name=sheet_name, number_of_errors=len(indexes))
+                if self._is_stopped(sheet_name):
+                    break
+
+        if len(invalid_indexes) > 0:
+            return invalid_indexes
+        return True
+
+    def _export_rule_results(self, rule_name: str, number_of_sheets: int = None) -> {str: {str: list}}:
+        """
+        :param number_of_sheets: only the first sheets, for the rules with a value for every sheet in a list.
+        :return: {sheet_name: {column_name: invalid indexes}} of a rule, exported from validation_result_matrix.
+        """
+        return self.validation_result_matrix.to_dict_sheet_name_column_names_indexes(
+            rule_name=rule_name, sheet_names=list(self.sheet_names)[:number_of_sheets])
 
+    @instrumented_pass
     def fill_dict_indexes_as_panda_indexes_no_int_or_float(self, list_column_names_to_be_checked: [str],
                                                            show_process: bool = False) -> {}:
-        dict_indexes_as_panda_indexes_no_int_or_float = {}
         for sheet_name in self.sheet_names:
-            dict_indexes_as_panda_indexes_no_int_or_float[sheet_name] = {}
-            data_frame = self.dict_data_frames[sheet_name]
             for column_name in list_column_names_to_be_checked:
-                indexes = validate_if_there_is_a_float_or_integer_in_cell(data_frame=data_frame,
-                                                                          column_name=column_name)
-                if indexes[1] is not True:
-                    dict_indexes_as_panda_indexes_no_int_or_float[sheet_name][column_name] = indexes[1]
-
-                if show_process:
-                    print(f"{sheet_name}  with column {column_name} is done")
-
+                start = time.perf_counter()
+                if self._is_stopped(sheet_name):
+                    break
+                self._validate_column(rule_name="no_int_or_float", sheet_name=sheet_name,
+                                      validation_function=validate_if_there_is_a_float_or_integer_in_cell,
+                                      column_name=column_name)
+
+                emit_sheet_progress(kind="validate", step="fill_dict_indexes_as_panda_indexes_no_int_or_float",
+                                    sheet_name=sheet_name, data_frame=self.dict_data_frames[sheet_name], start=start,
+                                    message=f"{sheet_name}  with column {column_name} is done",
+                                    show_process=show_process)
+
+        dict_indexes_as_panda_indexes_no_int_or_float = self._export_rule_results(rule_name="no_int_or_float")
         self.dict_indexes_as_panda_indexes_no_int_or_float = dict_indexes_as_panda_indexes_no_int_or_float
 
         return dict_indexes_as_panda_indexes_no_int_or_float
@@ -67,49 +248,58 @@ class validate_if_all_cells_are_correctly_filled:
                                              start_row_values_table_in_excel=start_row_values_table_in_excel,
                                              show_process=show_process)
 
+    @instrumented_pass
     def fill_dict_indexes_as_pandas_incorrect_sample_id(self, column_name_to_be_checked: str,
                                                         list_specific_string: [str],
                                                         show_process: bool = False) -> {}:
 
-        dict_indexes_as_pandas_incorrect_sample_id = {}
         for sheet_name, specific_string in zip(self.sheet_names, list_specific_string):
-            dict_indexes_as_pandas_incorrect_sample_id[sheet_name] = {}
-            data_frame = self.dict_data_frames[sheet_name]
-            indexes = validate_if_there_is_a_specific_string(data_frame=data_frame,
-                                                             column_name=column_name_to_be_checked,
-                                                             specific_string=specific_string)
-            if indexes[1] is not True:
-                dict_indexes_as_pandas_incorrect_sample_id[sheet_name][column_name_to_be_checked] = indexes[1]
-            if show_process:
-                print(f"{sheet_name}  with column {column_name_to_be_checked} is done")
-
+            start = time.perf_counter()
+            if self._is_stopped(sheet_name):
+                continue
+            self._validate_column(rule_name="incorrect_sample_id", sheet_name=sheet_name,
+                                  validation_function=validate_if_there_is_a_specific_string,
+                                  column_name=column_name_to_be_checked,
+                                  specific_string=specific_string)
+            emit_sheet_progress(kind="validate", step="fill_dict_indexes_as_pandas_incorrect_sample_id",
+                                sheet_name=sheet_name, data_frame=self.dict_data_frames[sheet_name], start=start,
+                                message=f"{sheet_name}  with column {column_name_to_be_checked} is done",
+                                show_process=show_process)
+
+        dict_indexes_as_pandas_incorrect_sample_id = self._export_rule_results(
+            rule_name="incorrect_sample_id", number_of_sheets=len(list_specific_string))
         self.dict_indexes_as_pandas_incorrect_sample_id = dict_indexes_as_pandas_incorrect_sample_id
         self.list_no_correct_strings_and_parallel.append(dict_indexes_as_pandas_incorrect_sample_id)
 
         return dict_indexes_as_pandas_incorrect_sample_id
 
+    @instrumented_pass
     def fill_dict_indexes_as_pandas_incorrect_parallel(self, column_name_to_be_checked: str,
                                                        list_specific_float_or_integer: [int],
                                                        show_process: bool = False) -> {}:
 
-        dict_indexes_as_pandas_incorrect_parallel = {}
         for sheet_name, specific_integer in zip(self.sheet_names, list_specific_float_or_integer):
-            dict_indexes_as_pandas_incorrect_parallel[sheet_name] = {}
-            data_frame = self.dict_data_frames[sheet_name]
-            indexes = validate_if_there_is_no_specific_float_or_integer_in_cell(data_frame=data_frame,
-                                                                                column_name=column_name_to_be_checked,
-                                                                                specific_float_or_integer=
-                                                                                specific_integer)
-            if indexes[1] is not True:
-                dict_indexes_as_pandas_incorrect_parallel[sheet_name][column_name_to_be_checked] = indexes[1]
-            if show_process:
-                print(f"{sheet_name}  with column {column_name_to_be_checked} is done")
-
+            start = time.perf_counter()
+            if self._is_stopped(sheet_name):
+                continue
+            self._validate_column(rule_name="incorrect_parallel", sheet_name=sheet_name,
+                                  validation_function=
+                                  validate_if_there_is_no_specific_float_or_integer_in_cell,
+                                  column_name=column_name_to_be_checked,
+                                  specific_float_or_integer=specific_integer)
+            emit_sheet_progress(kind="validate", step="fill_dict_indexes_as_pandas_incorrect_parallel",
+                                sheet_name=sheet_name, data_frame=self.dict_data_frames[sheet_name], start=start,
+                                message=f"{sheet_name}  with column {column_name_to_be_checked} is done",
+                                show_process=show_process)
+
+        dict_indexes_as_pandas_incorrect_parallel = self._export_rule_results(
+            rule_name="incorrect_parallel", number_of_sheets=len(list_specific_float_or_integer))
         self.dict_indexes_as_pandas_incorrect_parallel = dict_indexes_as_pandas_incorrect_parallel
         self.list_no_correct_strings_and_parallel.append(dict_indexes_as_pandas_incorrect_parallel)
 
         return dict_indexes_as_pandas_incorrect_parallel
 
+    @instrumented_pass
     def fill_dict_indexes_as_pandas_incorrect_gc_method(self, column_name_to_be_checked: str,
                                                         list_specific_string: [str] = None,
                                                         show_process: bool = False):
@@ -125,18 +315,21 @@ class validate_if_all_cells_are_correctly_filled:
         """
         if list_specific_string is None:
             list_specific_string = ["LM", "HM", "VHM"]
-        dict_indexes_as_pandas_incorrect_gc_method = {}
         for sheet_name in self.sheet_names:
-            dict_indexes_as_pandas_incorrect_gc_method[sheet_name] = {}
-            data_frame = self.dict_data_frames[sheet_name]
-            indexes = validate_if_there_is_in_cell_one_of_the_specific_strings(data_frame=data_frame,
-                                                                               column_name=column_name_to_be_checked,
-                                                                               list_specific_string=list_specific_string)
-            if indexes[1] is not True:
-                dict_indexes_as_pandas_incorrect_gc_method[sheet_name][column_name_to_be_checked] = indexes[1]
-            if show_process:
-                print(f"{sheet_name}  with column {column_name_to_be_checked} is done")
-
+            start = time.perf_counter()
+            if self._is_stopped(sheet_name):
+                continue
+            self._validate_column(rule_name="incorrect_gc_method", sheet_name=sheet_name,
+                                  validation_function=
+                                  validate_if_there_is_in_cell_one_of_the_specific_strings,
+                                  column_name=column_name_to_be_checked,
+                                  list_specific_string=list_specific_string)
+            emit_sheet_progress(kind="validate", step="fill_dict_indexes_as_pandas_incorrect_gc_method",
+                                sheet_name=sheet_name, data_frame=self.dict_data_frames[sheet_name], start=start,
+                                message=f"{sheet_name}  with column {column_name_to_be_checked} is done",
+                                show_process=show_process)
+
+        dict_indexes_as_pandas_incorrect_gc_method = self._export_rule_results(rule_name="incorrect_gc_method")
         self.dict_indexes_as_pandas_incorrect_gc_method = dict_indexes_as_pandas_incorrect_gc_method
         self.list_no_correct_strings_and_parallel.append(dict_indexes_as_pandas_incorrect_gc_method)
 
@@ -162,28 +355,26 @@ class validate_if_all_cells_are_correctly_filled:
                                                      start_row_values_table_in_excel=start_row_values_table_in_excel,
                                                      show_process=show_process)
 
+    @instrumented_pass
     def fill_dict_indexes_as_pandas_no_weight_when_flush(self, column_name_to_be_checked: str,
                                                          column_name_flush: str,
                                                          show_process: bool = False) -> {}:
-        dict_indexes_as_pandas_no_weight_when_flush = {}
         for sheet_name in self.sheet_names:
-            dict_indexes_as_pandas_no_weight_when_flush[sheet_name] = {}
-            data_frame = self.dict_data_frames[sheet_name]
-            invalid_rows = []
-            column_in_data_frame_to_be_checked = data_frame[column_name_to_be_checked]
-            column_in_data_frame_flush = data_frame[column_name_flush]
-            for index in column_in_data_frame_to_be_checked.index:
-                if column_in_data_frame_flush[index] == 1:
-                    value = column_in_data_frame_to_be_checked[index]
-                    if not isinstance(value, (float, int)) or pd.isnull(value):
-                        invalid_rows.append(index)
-
-            if len(invalid_rows) > 0:
-                dict_indexes_as_pandas_no_weight_when_flush[sheet_name][column_name_to_be_checked] = invalid_rows
-
-            if show_process:
-                print(f"{sheet_name}  with column {column_name_to_be_checked} is done")
-
+            start = time.perf_counter()
+            if self._is_stopped(sheet_name):
+                continue
+            self._validate_column(rule_name="no_weight_when_flush", sheet_name=sheet_name,
+                                  validation_function=
+                                  validate_if_there_is_a_float_or_integer_in_cell_when_flush,
+                                  column_name=column_name_to_be_checked,
+                                  column_name_flush=column_name_flush)
+
+            emit_sheet_progress(kind="validate", step="fill_dict_indexes_as_pandas_no_weight_when_flush",
+                                sheet_name=sheet_name, data_frame=self.dict_data_frames[sheet_name], start=start,
+                                message=f"{sheet_name}  with column {column_name_to_be_checked} is done",
+                                show_process=show_process)
+
+        dict_indexes_as_pandas_no_weight_when_flush = self._export_rule_results(rule_name="no_weight_when_flush")
         self.dict_indexes_as_pandas_no_weight_when_flush = dict_indexes_as_pandas_no_weight_when_flush
 
         return dict_indexes_as_pandas_no_weight_when_flush
@@ -203,44 +394,48 @@ class validate_if_all_cells_are_correctly_filled:
                                              start_row_values_table_in_excel=start_row_values_table_in_excel,
                                              show_process=show_process)
 
+    @instrumented_pass
     def fill_dict_indexes_as_pandas_incorrect_date(self, column_name_date: str, format_date: str = "%Y-%m-%d",
                                                    show_process: bool = False) -> {}:
 
-        dict_indexes_as_pandas_incorrect_date = {}
         for sheet_name in self.sheet_names:
-            dict_indexes_as_pandas_incorrect_date[sheet_name] = {}
-            data_frame = self.dict_data_frames[sheet_name]
-
-            indexes = validate_if_in_cell_is_correct_date_or_not_filled(data_frame=data_frame,
-                                                                        column_name_date=column_name_date,
-                                                                        format_date=format_date)
-            if indexes[1] is not True:
-                dict_indexes_as_pandas_incorrect_date[sheet_name][column_name_date] = indexes[1]
+            start = time.perf_counter()
+            if self._is_stopped(sheet_name):
+                continue
+            self._validate_column(rule_name="incorrect_date", sheet_name=sheet_name,
+                                  validation_function=validate_if_in_cell_is_correct_date_or_not_filled,
+                                  column_name_date=column_name_date,
+                                  format_date=format_date)
 
-            if show_process:
-                print(f"{sheet_name}  with column {column_name_date} is done")
+            emit_sheet_progress(kind="validate", step="fill_dict_indexes_as_pandas_incorrect_date",
+                                sheet_name=sheet_name, data_frame=self.dict_data_frames[sheet_name], start=start,
+                                message=f"{sheet_name}  with column {column_name_date} is done",
+                                show_process=show_process)
 
+        dict_indexes_as_pandas_incorrect_date = self._export_rule_results(rule_name="incorrect_date")
         self.dict_indexes_as_pandas_incorrect_date = dict_indexes_as_pandas_incorrect_date
 
         return dict_indexes_as_pandas_incorrect_date
 
+    @instrumented_pass
     def fill_dict_indexes_as_pandas_incorrect_time(self, column_name_time: str, format_time: str = "%H:%M:%S",
                                                    show_process: bool = False) -> {}:
 
-        dict_indexes_as_pandas_incorrect_time = {}
         for sheet_name in self.sheet_names:
-            dict_indexes_as_pandas_incorrect_time[sheet_name] = {}
-            data_frame = self.dict_data_frames[sheet_name]
-
-            indexes = validate_if_in_cell_is_correct_time_or_not_filled(data_frame=data_frame,
-                                                                        column_name_time=column_name_time,
-                                                                        format_time=format_time)
-            if indexes[1] is not True:
-                dict_indexes_as_pandas_incorrect_time[sheet_name][column_name_time] = indexes[1]
+            start = time.perf_counter()
+            if self._is_stopped(sheet_name):
+                continue
+            self._validate_column(rule_name="incorrect_time", sheet_name=sheet_name,
+                                  validation_function=validate_if_in_cell_is_correct_time_or_not_filled,
+                                  column_name_time=column_name_time,
+                                  format_time=format_time)
 
-            if show_process:
-                print(f"{sheet_name}  with column {column_name_time} is done")
+            emit_sheet_progress(kind="validate", step="fill_dict_indexes_as_pandas_incorrect_time",
+                                sheet_name=sheet_name, data_frame=self.dict_data_frames[sheet_name], start=start,
+                                message=f"{sheet_name}  with column {column_name_time} is done",
+                                show_process=show_process)
 
+        dict_indexes_as_pandas_incorrect_time = self._export_rule_results(rule_name="incorrect_time")
         self.dict_indexes_as_pandas_incorrect_time = dict_indexes_as_pandas_incorrect_time
 
         return dict_indexes_as_pandas_incorrect_time
@@ -262,6 +457,7 @@ class validate_if_all_cells_are_correctly_filled:
                                                  start_row_values_table_in_excel=start_row_values_table_in_excel,
                                                  show_process=show_process)
 
+    @instrumented_pass
     def fill_dict_with_indexes_as_excel_when_constants_is_not_filled(self,
                                                                      workbook: Workbook,
                                                                      start_row_constants_value: int,
@@ -272,24 +468,42 @@ class validate_if_all_cells_are_correctly_filled:
         dict_wrong_constants_for_each_sheet_name = {}
         start_col_values = NiceExcelFunction.get_column_index_from_letter(column_letter_values)
         end_col_values = start_col_values
+        constants_key = f"{column_letter_values}{start_row_constants_value}:{end_row_constants_value}"
         for sheet_name in workbook.sheetnames:
-            indexes = []
+            start = time.perf_counter()
+            if self._is_stopped(sheet_name):
+                continue
             sheet = workbook[sheet_name]
             values_list = list(sheet.iter_rows(min_row=start_row_constants_value,
                                                min_col=start_col_values,
                                                max_row=end_row_constants_value,
                                                max_col=end_col_values,
                                                values_only=True))
-            for index, value_tuple in enumerate(values_list):
-                value = value_tuple[0]
-                if not isinstance(value, (float, int)) or pd.isnull(value):
-                    indexes.append(index + start_row_constants_value)
+
+            indexes = None
+            if self.validation_state is not None:
+                constants_hash = ValidationState.hash_values(values_list)
+                indexes = self.validation_state.get_constants_result(constants_key=constants_key,
+                                                                     sheet_name=sheet_name,
+                                                                     constants_hash=constants_hash)
+            if indexes is None:
+                indexes = []
+                for index, value_tuple in enumerate(values_list):
+                    value = value_tuple[0]
+                    if not isinstance(value, (float, int)) or pd.isnull(value):
+                        indexes.append(index + start_row_constants_value)
+
+                if self.validation_state is not None:
+                    self.validation_state.set_constants_result(constants_key=constants_key, sheet_name=sheet_name,
+                                                               constants_hash=constants_hash, indexes=indexes)
 
             if len(indexes) > 0:
                 dict_wrong_constants_for_each_sheet_name[sheet_name] = indexes
+                self._count_errors(sheet_name=sheet_name, number_of_errors=len(indexes))
 
-            if show_process:
-                print(f"{sheet_name} constants are done")
+            emit_progress(kind="validate", step="fill_dict_with_indexes_as_excel_when_constants_is_not_filled",
+                          sheet_name=sheet_name, rows=len(values_list), duration=time.perf_counter() - start,
+                          message=f"{sheet_name} constants are done", show_process=show_process)
 
         self.dict_wrong_constants_for_each_sheet_name = dict_wrong_constants_for_each_sheet_name
 
@@ -311,6 +525,125 @@ class validate_if_all_cells_are_correctly_filled:
                                                                          fill_type=fill_type,
                                                                          show_process=show_process)
 
+    @instrumented_pass
+    def fill_dict_missing_column_names(self, list_column_names_to_be_checked: [str],
+                                       show_process: bool = False) -> {}:
+        """
+        Check if the header of every sheet has all the column names. A sheet with missing columns can not be validated
+        further, so the next rules skip that sheet. The missing columns count as errors for the error budget.
+
+        :param list_column_names_to_be_checked: the column names which must be in the header.
+        :param show_process: when set on True than the function shows the process.
+        :return: {sheet_name: [missing column names]}, only for the sheets with missing columns.
+        """
+        dict_missing_column_names = {}
+        for sheet_name in self.sheet_names:
+            start = time.perf_counter()
+            if self._is_over_error_budget(sheet_name):
+                continue
+            columns = self.dict_data_frames[sheet_name].columns
+            missing_column_names = [column_name for column_name in list_column_names_to_be_checked
+                                    if column_name not in columns]
+            if len(missing_column_names) > 0:
+                dict_missing_column_names[sheet_name] = missing_column_names
+                self._count_errors(sheet_name=sheet_name, number_of_errors=len(missing_column_names))
+
+            emit_sheet_progress(kind="validate", step="fill_dict_missing_column_names",
+                                sheet_name=sheet_name, data_frame=self.dict_data_frames[sheet_name], start=start,
+                                message=f"{sheet_name} header is done",
+                                show_process=show_process)
+
+        self.dict_missing_column_names = dict_missing_column_names
+        self.list_sheet_names_with_missing_columns = list(dict_missing_column_names)
+
+        return dict_missing_column_names
+
+    @instrumented_pass
+    def run_validation_cheap_rules_first(self,
+                                         list_column_names_to_be_checked: [str],
+                                         workbook: Workbook = None,
+                                         start_row_constants_value: int = None,
+                                         end_row_constants_value: int = None,
+                                         column_letter_values: str = None,
+                                         column_name_gc_method: str = None,
+                                         column_name_sample_id: str = None,
+                                         list_sample_ids: [str] = None,
+                                         column_name_parallel: str = None,
+                                         list_parallels: [int] = None,
+                                         column_name_weight: str = None,
+                                         column_name_flush: str = None,
+                                         column_name_date: str = None,
+                                         column_name_time: str = None,
+                                         show_process: bool = False) -> bool:
+        """
+        Run the rules from cheap to expensive: the constants, the header, the numbers, the strings, the weight when
+        flushed and at last the dates and times. Together with an error budget (fail-fast) the validation stops as soon
+        as the budget is exceeded, so a bad workbook is rejected without validating all the cells.
+
+        The rules of which the column name (or the workbook for the constants) is not given are skipped.
+
+        :return: True when the workbook is within the error budget (or has no invalid cells without a budget),
+        False otherwise.
+        :raises ValueError: when column_name_sample_id is given without list_sample_ids, or column_name_parallel
+        without list_parallels.
+        """
+        if column_name_sample_id is not None and list_sample_ids is None:
+            raise ValueError("list_sample_ids is needed to validate the column of the sample ids.")
+        if column_name_parallel is not None and list_parallels is None:
+            raise ValueError("list_parallels is needed to validate the column of the parallels.")
+
+        if workbook is not None:
+            self.fill_dict_with_indexes_as_excel_when_constants_is_not_filled(
+                workbook=workbook, start_row_constants_value=start_row_constants_value,
+                end_row_constants_value=end_row_constants_value, column_letter_values=column_letter_values,
+                show_process=show_process)
+
+        list_column_names_in_header = list(list_column_names_to_be_checked)
+        for column_name in (column_name_gc_method, column_name_sample_id, column_name_parallel, column_name_weight,
+                            column_name_flush, column_name_date, column_name_time):
+            if column_name is not None and column_name not in list_column_names_in_header:
+                list_column_names_in_header.append(column_name)
+        self.fill_dict_missing_column_names(list_column_names_to_be_checked=list_column_names_in_header,
+                                            show_process=show_process)
+
+        self.fill_dict_indexes_as_panda_indexes_no_int_or_float(
+            list_column_names_to_be_checked=list_column_names_to_be_checked, show_process=show_process)
+        if column_name_gc_method is not None:
+            self.fill_dict_indexes_as_pandas_incorrect_gc_method(column_name_to_be_checked=column_name_gc_method,
+                                                                 show_process=show_process)
+        if column_name_sample_id is not None:
+            self.fill_dict_indexes_as_pandas_incorrect_sample_id(column_name_to_be_checked=column_name_sample_id,
+                                                                 list_specific_string=list_sample_ids,
+                                                                 show_process=show_process)
+        if column_name_parallel is not None:
+            self.fill_dict_indexes_as_pandas_incorrect_parallel(column_name_to_be_checked=column_name_parallel,
+                                                                list_specific_float_or_integer=list_parallels,
+                                                                show_process=show_process)
+        if column_name_weight is not None:
+            self.fill_dict_indexes_as_pandas_no_weight_when_flush(column_name_to_be_checked=column_name_weight,
+                                                                  column_name_flush=column_name_flush,
+                                                                  show_process=show_process)
+        if column_name_date is not None:
+            self.fill_dict_indexes_as_pandas_incorrect_date(column_name_date=column_name_date,
+                                                            show_process=show_process)
+        if column_name_time is not None:
+            self.fill_dict_indexes_as_pandas_incorrect_time(column_name_time=column_name_time,
+                                                            show_process=show_process)
+
+        if self.error_budget is None:
+            return self.number_of_errors == 0
+        return not self.error_budget_exceeded
+
+    def get_validation_result_matrix(self) -> ValidationResultMatrix:
+        """
+        Get the compact bitmask matrix in which the rules write their invalid cells while validating. The rules which
+        are not run yet have no bit. The constants are not part of the matrix, because these are not in the table of
+        the sheet.
+
+        :return: ValidationResultMatrix with one bit for every rule.
+        """
+        return self.validation_result_matrix
+
 
 class ValidateInputDataStatistics:
 
@@ -320,29 +653,128 @@ class ValidateInputDataStatistics:
         self.sheet_names = self.dict_sheet_name_with_panda_data_frames.keys()
 
         self.dict_outliers_indexes_as_pandas = None
+        self.dict_segment_outliers_indexes_as_pandas = None
+        self.dict_streaming_outliers_indexes_as_pandas = None
 
+    @instrumented_pass
     def fill_dict_outliers_indexes_as_pandas(self,
                                              list_column_names_to_be_checked: [str],
+                                             pooled: bool = False,
                                              show_process: bool = False) -> {}:
+        """
+        Fill the dictionary with the indexes of the outliers (IQR method) of the columns in every sheet. The quartiles
+        of all the columns of all the sheets are calculated in one vectorized operation.
+
+        :param list_column_names_to_be_checked: the names of the columns to find outliers in.
+        :param pooled: when True the quartiles are calculated over the data of all the sheets together.
+        :param show_process: when set on True than the function shows the process.
+        :return: {sheet_name: {column_name: indexes}}
+        """
+        dict_outliers_arrays = find_outliers_in_sheets(dict_data_frames=self.dict_sheet_name_with_panda_data_frames,
+                                                       column_names=list_column_names_to_be_checked,
+                                                       pooled=pooled)
 
         dict_outliers_indexes_as_pandas = {}
         for sheet_name in self.sheet_names:
+            start = time.perf_counter()
             dict_outliers_indexes_as_pandas[sheet_name] = {}
-            data_frame = self.dict_sheet_name_with_panda_data_frames[sheet_name]
-            for column_name in list_column_names_to_be_checked:
-                indexes = find_column_outliers(data_frame=data_frame, column_name=column_name,
-                                               return_only_indexes=True)
-
+            for column_name, indexes in dict_outliers_arrays[sheet_name].items():
                 if len(indexes) > 0:
-                    dict_outliers_indexes_as_pandas[sheet_name][column_name] = indexes
+                    dict_outliers_indexes_as_pandas[sheet_name][column_name] = indexes.tolist()
 
-            if show_process:
-                print(f"dict outliers for sheet {sheet_name} is filled")
+            emit_sheet_progress(kind="validate", step="fill_dict_outliers_indexes_as_pandas",
+                                sheet_name=sheet_name, start=start,
+                                data_frame=self.dict_sheet_name_with_panda_data_frames[sheet_name],
+                                message=f"dict outliers for sheet {sheet_name} is filled",
+                                show_process=show_process)
 
         self.dict_outliers_indexes_as_pandas = dict_outliers_indexes_as_pandas
 
         return dict_outliers_indexes_as_pandas
 
+    @instrumented_pass
+    def fill_dict_segment_outliers_indexes_as_pandas(self,
+                                                     list_column_names_to_be_checked: [str],
+                                                     column_name_flush: str = "Flush (1=yes; 0=no)",
+                                                     threshold: float = 3.5,
+                                                     show_process: bool = False) -> {}:
+        """
+        Fill the dictionary with the indexes of the outliers in the measurement time series. The sheets are split on
+        the flushes and the changes between the measurements within every part are scored with the robust z-score, so
+        the reset of the gas percentages at a flush is not seen as an outlier.
+
+        :param list_column_names_to_be_checked: the names of the columns to find outliers in.
+        :param column_name_flush: the name of the flush column.
+        :param threshold: the robust z-score above which a cell is an outlier.
+        :param show_process: when set on True than the function shows the process.
+        :return: {sheet_name: {column_name: indexes}}
+        """
+        dict_outliers_arrays = find_segment_outliers_in_sheets(
+            dict_data_frames=self.dict_sheet_name_with_panda_data_frames,
+            column_names=list_column_names_to_be_checked,
+            name_column_flush=column_name_flush,
+            threshold=threshold)
+
+        dict_segment_outliers_indexes_as_pandas = {}
+        for sheet_name in self.sheet_names:
+            start = time.perf_counter()
+            dict_segment_outliers_indexes_as_pandas[sheet_name] = {}
+            for column_name, indexes in dict_outliers_arrays[sheet_name].items():
+                if len(indexes) > 0:
+                    dict_segment_outliers_indexes_as_pandas[sheet_name][column_name] = indexes.tolist()
+
+            emit_sheet_progress(kind="validate", step="fill_dict_segment_outliers_indexes_as_pandas",
+                                sheet_name=sheet_name, start=start,
+                                data_frame=self.dict_sheet_name_with_panda_data_frames[sheet_name],
+                                message=f"dict segment outliers for sheet {sheet_name} is filled",
+                                show_process=show_process)
+
+        self.dict_segment_outliers_indexes_as_pandas = dict_segment_outliers_indexes_as_pandas
+
+        return dict_segment_outliers_indexes_as_pandas
+
+    @instrumented_pass
+    def fill_dict_streaming_outliers_indexes_as_pandas(self,
+                                                       list_column_names_to_be_checked: [str],
+                                                       detector: IncrementalOutlierDetector,
+                                                       dict_sheet_name_new_indexes: {str: list} = None,
+                                                       update: bool = True,
+                                                       show_process: bool = False) -> {}:
+        """
+        Fill the dictionary with the indexes of the outliers (IQR method) of the new rows, screened against the
+        quantile sketches of the previous runs instead of a recompute over all the rows of every sheet. Save the
+        sketches after the run with detector.save(path).
+
+        :param list_column_names_to_be_checked: the names of the columns to find outliers in.
+        :param detector: the IncrementalOutlierDetector with the sketches of the previous runs, the sheet name is the
+        sample.
+        :param dict_sheet_name_new_indexes: {sheet_name: indexes of the new rows}. None screens all the rows, for
+        example the first run; a sheet which is not in the dictionary has no new rows.
+        :param update: when True the new rows are added to the sketches.
+        :param show_process: when set on True than the function shows the process.
+        :return: {sheet_name: {column_name: indexes}}
+        """
+        dict_streaming_outliers_indexes_as_pandas = {}
+        for sheet_name in self.sheet_names:
+            start = time.perf_counter()
+            data_frame = self.dict_sheet_name_with_panda_data_frames[sheet_name]
+            if dict_sheet_name_new_indexes is not None:
+                data_frame = data_frame.loc[dict_sheet_name_new_indexes.get(sheet_name, [])]
+
+            dict_outliers = detector.screen_data_frame(sample_key=sheet_name, data_frame=data_frame,
+                                                       column_names=list_column_names_to_be_checked, update=update)
+            dict_streaming_outliers_indexes_as_pandas[sheet_name] = {
+                column_name: indexes for column_name, indexes in dict_outliers.items() if len(indexes) > 0}
+
+            emit_sheet_progress(kind="validate", step="fill_dict_streaming_outliers_indexes_as_pandas",
+                                sheet_name=sheet_name, start=start, data_frame=data_frame,
+                                message=f"dict streaming outliers for sheet {sheet_name} is filled",
+                                show_process=show_process)
+
+        self.dict_streaming_outliers_indexes_as_pandas = dict_streaming_outliers_indexes_as_pandas
+
+        return dict_streaming_outliers_indexes_as_pandas
+
     def fill_outliers_in_excel(self, workbook, header_row: int,
                                start_row_values_table_in_excel: int,
                                color: str = "99FFCC",
@@ -357,3 +789,14 @@ class ValidateInputDataStatistics:
                                              fill_type=fill_type,
                                              start_row_values_table_in_excel=start_row_values_table_in_excel,
                                              show_process=show_process)
+
+    def get_validation_result_matrix(self) -> ValidationResultMatrix:
+        """
+        Put the filled dictionaries with the outliers in a compact bitmask matrix with the rules "outliers" and
+        "segment_outliers". A dictionary that is not filled is skipped.
+
+        :return: ValidationResultMatrix
+        """
+        return ValidationResultMatrix.from_dict_rule_names_results(
+            {"outliers": self.dict_outliers_indexes_as_pandas,
+             "segment_outliers": self.dict_segment_outliers_indexes_as_pandas})
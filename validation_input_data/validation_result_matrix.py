@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import json
+from typing import Dict
+
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+
+class ValidationResultMatrix:
+    """
+    A compact representation of validation results.
+
+    Instead of nested dictionaries {sheet_name: {column_name: [indexes]}} for every rule, the results of every sheet
+    are stored in one array with the shape (rows of the sheet, columns). Every element is a bitmask with one bit for
+    each rule, so a cell that fails the second and third rule has the value 0b110. The sheets, columns and rules can be
+    added while validating, so a validation can write the failed cells in the matrix as it goes. The column of a sheet
+    is only allocated when a rule writes in that sheet, and every sheet has only its own number of rows.
+    """
+
+    def __init__(self, sheet_names: [str] = (), column_names: [str] = (), rule_names: [str] = (),
+                 number_of_rows: int = 0):
+        """
+        :param sheet_names: the names of the sheets.
+        :param column_names: the names of the columns, in the order of the second axis of the arrays.
+        :param rule_names: the names of the rules. The position in the list is the bit of the rule in the bitmask.
+        :param number_of_rows: the number of rows of every given sheet. A sheet grows when a larger index is set.
+        """
+        if len(rule_names) > 64:
+            raise ValueError("A maximum of 64 rules can be stored in one validation result matrix.")
+
+        self.sheet_names = []
+        self.column_names = []
+        self.rule_names = []
+
+        self._sheet_positions = {}
+        self._column_positions = {}
+        self._rule_bits = {}
+        # {sheet_name: array (rows, columns)}, the columns which are added later are not allocated yet
+        self._sheet_masks = {}
+        self._dtype = np.uint8
+
+        for rule_name in rule_names:
+            self.add_rule(rule_name)
+        for column_name in column_names:
+            self.add_column(column_name)
+        for sheet_name in sheet_names:
+            self.add_sheet(sheet_name, number_of_rows=number_of_rows)
+
+    @classmethod
+    def from_dict_rule_names_results(cls,
+                                     dict_rule_names_results: {str: {str: {str: [int]}}}
+                                     ) -> "ValidationResultMatrix":
+        """
+        Build the matrix from the nested dictionaries of the validation classes.
+
+        :param dict_rule_names_results: {rule_name: {sheet_name: {column_name: indexes}}}. The values are the
+        dictionaries like dict_indexes_as_panda_indexes_no_int_or_float. Rules with None as value are skipped.
+        :return: ValidationResultMatrix
+        """
+        matrix = cls()
+        for rule_name, results in dict_rule_names_results.items():
+            if results is None:
+                continue
+            matrix.add_rule(rule_name)
+            for sheet_name, sheet_data in results.items():
+                matrix.add_sheet(sheet_name)
+                for column_name, indexes in sheet_data.items():
+                    matrix.set_rule_failed(rule_name=rule_name, sheet_name=sheet_name, column_name=column_name,
+                                           indexes=indexes)
+
+        return matrix
+
+    def add_rule(self, rule_name: str) -> int:
+        """
+        Add a rule, when it is not in the matrix yet. The arrays get a larger integer type when the bits do not fit.
+
+        :return: the bit of the rule.
+        """
+        if rule_name in self._rule_bits:
+            return self._rule_bits[rule_name]
+        if len(self.rule_names) == 64:
+            raise ValueError("A maximum of 64 rules can be stored in one validation result matrix.")
+
+        self._rule_bits[rule_name] = len(self.rule_names)
+        self.rule_names.append(rule_name)
+
+        # use the smallest unsigned integer that has a bit for every rule
+        for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+            if len(self.rule_names) <= np.iinfo(dtype).bits:
+                break
+        if dtype != self._dtype:
+            self._dtype = dtype
+            self._sheet_masks = {sheet_name: masks.astype(dtype) for sheet_name, masks in self._sheet_masks.items()}
+
+        return self._rule_bits[rule_name]
+
+    def add_column(self, column_name: str) -> int:
+        """
+        Add a column, when it is not in the matrix yet.
+
+        :return: the position of the column.
+        """
+        if column_name not in self._column_positions:
+            self._column_positions[column_name] = len(self.column_names)
+            self.column_names.append(column_name)
+        return self._column_positions[column_name]
+
+    def add_sheet(self, sheet_name: str, number_of_rows: int = 0) -> None:
+        """
+        Add a sheet, when it is not in the matrix yet, or make it at least number_of_rows long.
+
+        :param sheet_name: the name of the sheet.
+        :param number_of_rows: the number of rows of the sheet, for example the length of its data frame.
+        """
+        if sheet_name not in self._sheet_positions:
+            self._sheet_positions[sheet_name] = len(self.sheet_names)
+            self.sheet_names.append(sheet_name)
+            self._sheet_masks[sheet_name] = np.zeros((number_of_rows, 0), dtype=self._dtype)
+        self._grow_sheet(sheet_name=sheet_name, number_of_rows=number_of_rows)
+
+    def _grow_sheet(self, sheet_name: str, number_of_rows: int = 0, number_of_columns: int = 0) -> np.ndarray:
+        """:return: the array of the sheet with at least the given number of rows and columns."""
+        masks = self._sheet_masks[sheet_name]
+        if number_of_rows > masks.shape[0] or number_of_columns > masks.shape[1]:
+            masks = np.pad(masks, ((0, max(number_of_rows - masks.shape[0], 0)),
+                                   (0, max(number_of_columns - masks.shape[1], 0))))
+            self._sheet_masks[sheet_name] = masks
+        return masks
+
+    def get_sheet_masks(self, sheet_name: str) -> np.ndarray:
+        """:return: the bitmasks of a sheet with the shape (rows of the sheet, all the columns)."""
+        return self._grow_sheet(sheet_name=sheet_name, number_of_columns=len(self.column_names))
+
+    @property
+    def masks(self) -> np.ndarray:
+        """
+        All the bitmasks in one dense array with the shape (sheets, rows of the longest sheet, columns). The array is
+        built at every call, use it to export the matrix and not while validating.
+        """
+        number_of_rows = max((masks.shape[0] for masks in self._sheet_masks.values()), default=0)
+        dense_masks = np.zeros((len(self.sheet_names), number_of_rows, len(self.column_names)), dtype=self._dtype)
+        for sheet_position, sheet_name in enumerate(self.sheet_names):
+            masks = self._sheet_masks[sheet_name]
+            dense_masks[sheet_position, :masks.shape[0], :masks.shape[1]] = masks
+        return dense_masks
+
+    def set_rule_failed(self, rule_name: str, sheet_name: str, column_name: str, indexes: [int]) -> None:
+        """
+        Set the bit of a rule for the given rows of one column in one sheet. The rule, sheet and column are added when
+        they are not in the matrix yet.
+
+        :param rule_name: the name of the rule that failed.
+        :param sheet_name: the name of the sheet.
+        :param column_name: the name of the column.
+        :param indexes: the pandas indexes of the rows that failed the rule.
+        """
+        # the rule first, it can change the integer type
+        rule_bit = self.add_rule(rule_name)
+        bit = self._dtype(1 << rule_bit)
+        column_position = self.add_column(column_name)
+        self.add_sheet(sheet_name)
+
+        indexes = np.asarray(indexes, dtype=np.intp)
+        number_of_rows = int(indexes.max()) + 1 if len(indexes) > 0 else 0
+        masks = self._grow_sheet(sheet_name=sheet_name, number_of_rows=number_of_rows,
+                                 number_of_columns=column_position + 1)
+        masks[indexes, column_position] |= bit
+
+    def clear_rule(self, rule_name: str, sheet_name: str, column_name: str) -> None:
+        """Remove the bit of a rule from all the rows of one column in one sheet, to validate the column again."""
+        if rule_name not in self._rule_bits or sheet_name not in self._sheet_masks or \
+                column_name not in self._column_positions:
+            return
+        masks = self._sheet_masks[sheet_name]
+        column_position = self._column_positions[column_name]
+        if column_position < masks.shape[1]:
+            masks[:, column_position] &= ~self._dtype(1 << self._rule_bits[rule_name])
+
+    def rows_failing_any_rule(self, sheet_name: str = None) -> Dict[str, np.ndarray] | np.ndarray:
+        """
+        Get the rows which fail at least one rule in at least one column.
+
+        :param sheet_name: when given only the rows of this sheet are returned as an array.
+        :return: {sheet_name: array with the indexes} or the array with the indexes of the given sheet.
+        """
+        if sheet_name is not None:
+            return np.flatnonzero(self._sheet_masks[sheet_name].any(axis=1))
+
+        return {sheet_name: np.flatnonzero(masks.any(axis=1)) for sheet_name, masks in self._sheet_masks.items()}
+
+    def rows_failing_rule(self, rule_name: str, sheet_name: str) -> np.ndarray:
+        """
+        Get the rows of a sheet which fail the given rule in at least one column.
+
+        :param rule_name: the name of the rule.
+        :param sheet_name: the name of the sheet.
+        :return: array with the indexes.
+        """
+        bit = self._dtype(1 << self._rule_bits[rule_name])
+        return np.flatnonzero((self._sheet_masks[sheet_name] & bit).any(axis=1))
+
+    def count_per_rule(self) -> Dict[str, int]:
+        """
+        Count the number of failed cells for every rule over all the sheets.
+
+        :return: {rule_name: number of failed cells}
+        """
+        counts = self.count_per_rule_per_sheet().sum()
+        return {rule_name: int(counts[rule_name]) for rule_name in self.rule_names}
+
+    def count_per_rule_per_sheet(self) -> pd.DataFrame:
+        """
+        Count the number of failed cells for every rule in every sheet.
+
+        :return: pd.DataFrame with the sheet names as index and the rule names as columns.
+        """
+        counts = {rule_name: [np.count_nonzero(self._sheet_masks[sheet_name] & self._dtype(1 << bit))
+                              for sheet_name in self.sheet_names]
+                  for rule_name, bit in self._rule_bits.items()}
+        return pd.DataFrame(counts, index=pd.Index(self.sheet_names, name="sheet"), dtype=np.int64)
+
+    def to_dict_sheet_name_column_names_indexes(self, rule_name: str,
+                                                sheet_names: [str] = None) -> {str: {str: [int]}}:
+        """
+        Get the results of one rule as the nested dictionary, which can be used for styling the cells in Excel.
+
+        :param rule_name: the name of the rule.
+        :param sheet_names: the sheets in the dictionary, by default all the sheets of the matrix. A sheet without
+        failed cells (or which is not in the matrix) has an empty dictionary.
+        :return: {sheet_name: {column_name: indexes}}
+        """
+        if sheet_names is None:
+            sheet_names = self.sheet_names
+
+        dict_sheet_name_column_names_indexes = {}
+        for sheet_name in sheet_names:
+            dict_sheet_name_column_names_indexes[sheet_name] = {}
+            if rule_name not in self._rule_bits or sheet_name not in self._sheet_masks:
+                continue
+            failed = (self._sheet_masks[sheet_name] & self._dtype(1 << self._rule_bits[rule_name])) != 0
+            for column_position in np.flatnonzero(failed.any(axis=0)):
+                dict_sheet_name_column_names_indexes[sheet_name][self.column_names[column_position]] = \
+                    np.flatnonzero(failed[:, column_position]).tolist()
+
+        return dict_sheet_name_column_names_indexes
+
+    def _get_failed_cells(self) -> tuple:
+        """:return: (sheet positions, rows, column positions, masks) of all the failed cells."""
+        list_cells = []
+        for sheet_position, sheet_name in enumerate(self.sheet_names):
+            masks = self._sheet_masks[sheet_name]
+            rows, column_positions = np.nonzero(masks)
+            list_cells.append((np.full(len(rows), sheet_position, dtype=np.intp), rows, column_positions,
+                               masks[rows, column_positions]))
+        if len(list_cells) == 0:
+            return tuple(np.zeros(0, dtype=dtype) for dtype in (np.intp, np.intp, np.intp, self._dtype))
+        return tuple(np.concatenate(arrays) for arrays in zip(*list_cells))
+
+    def to_data_frame(self) -> pd.DataFrame:
+        """
+        Get the failed cells as a long data frame with one row for every failed cell.
+
+        :return: pd.DataFrame with the columns "sheet", "row", "column", "mask" and a boolean column for every rule.
+        """
+        sheet_positions, rows, column_positions, masks = self._get_failed_cells()
+
+        data_frame = pd.DataFrame({
+            "sheet": pd.Categorical.from_codes(sheet_positions, categories=self.sheet_names),
+            "row": rows,
+            "column": pd.Categorical.from_codes(column_positions, categories=self.column_names),
+            "mask": masks,
+        })
+        for rule_name, bit in self._rule_bits.items():
+            data_frame[rule_name] = (masks & self._dtype(1 << bit)) != 0
+
+        return data_frame
+
+    def to_parquet(self, path: str) -> None:
+        """
+        Write the failed cells to a Parquet file. This requires pyarrow or fastparquet.
+
+        :param path: the path of the Parquet file.
+        """
+        self.to_data_frame().to_parquet(path, index=False)
+
+    def to_json(self, path: str = None) -> str | None:
+        """
+        Write the matrix as compact JSON. Only the failed cells are stored as [sheet, row, column, mask].
+
+        :param path: the path of the JSON file. When None the JSON string is returned.
+        :return: the JSON string when no path is given.
+        """
+        sheet_positions, rows, column_positions, masks = self._get_failed_cells()
+
+        dict_matrix = {
+            "sheet_names": self.sheet_names,
+            "column_names": self.column_names,
+            "rule_names": self.rule_names,
+            "numbers_of_rows": [int(self._sheet_masks[sheet_name].shape[0]) for sheet_name in self.sheet_names],
+            "cells": np.column_stack((sheet_positions, rows, column_positions, masks)).tolist(),
+        }
+
+        if path is None:
+            return json.dumps(dict_matrix)
+
+        with open(path, "w") as file:
+            json.dump(dict_matrix, file)
+
+    @classmethod
+    def from_json(cls, json_string_or_path: str) -> "ValidationResultMatrix":
+        """
+        Read a matrix that is written with to_json.
+
+        :param json_string_or_path: the JSON string or the path of the JSON file.
+        :return: ValidationResultMatrix
+        """
+        if json_string_or_path.lstrip().startswith("{"):
+            dict_matrix = json.loads(json_string_or_path)
+        else:
+            with open(json_string_or_path) as file:
+                dict_matrix = json.load(file)
+
+        matrix = cls(column_names=dict_matrix["column_names"], rule_names=dict_matrix["rule_names"])
+        # the files of the dense matrix have one number of rows for all the sheets
+        numbers_of_rows = dict_matrix.get("numbers_of_rows",
+                                          [dict_matrix.get("number_of_rows", 0)] * len(dict_matrix["sheet_names"]))
+        for sheet_name, number_of_rows in zip(dict_matrix["sheet_names"], numbers_of_rows):
+            matrix.add_sheet(sheet_name, number_of_rows=number_of_rows)
+
+        cells = np.asarray(dict_matrix["cells"], dtype=np.uint64).reshape(-1, 4)
+        for sheet_position, sheet_name in enumerate(matrix.sheet_names):
+            sheet_cells = cells[cells[:, 0] == sheet_position]
+            masks = matrix.get_sheet_masks(sheet_name)
+            masks[sheet_cells[:, 1].astype(np.intp), sheet_cells[:, 2].astype(np.intp)] = \
+                sheet_cells[:, 3].astype(matrix._dtype)
+
+        return matrix
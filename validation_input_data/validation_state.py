@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Dict, Tuple
+
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+
+class ValidationState:
+    """
+    The persisted state of a validation run, so that the next run only has to validate what is changed.
+
+    For every sheet a hash of every row and a hash of the constants block is stored together with the results of the
+    rules. When the validation is run again, only the rows with another hash (and the new rows) are validated again and
+    for all the other rows the stored results are reused.
+    """
+
+    def __init__(self):
+        # {sheet_name: pd.Series with the hash of every row, the index is the pandas index of the row}
+        self.dict_row_hashes: Dict[str, pd.Series] = {}
+        # {rule_key: {sheet_name: [indexes]}}
+        self.dict_rule_results: Dict[str, Dict[str, list]] = {}
+        # {constants_key: {sheet_name: {"hash": hash of the constants block, "indexes": [indexes as in Excel]}}}
+        self.dict_constants_results: Dict[str, Dict[str, dict]] = {}
+
+    @staticmethod
+    def hash_rows(data_frame: pd.DataFrame) -> pd.Series:
+        """
+        Hash the content of every row of the data frame.
+
+        :param data_frame: the data frame of the sheet.
+        :return: pd.Series with an uint64 hash for every row and the index of the data frame.
+        """
+        # the objects are hashed on their string representation, so mixed columns with dates, times and strings work.
+        return pd.util.hash_pandas_object(data_frame.astype(str), index=False)
+
+    @staticmethod
+    def hash_values(values) -> str:
+        """
+        Hash a small block of values, like the constants of a sheet.
+
+        :param values: the values, for example the list with tuples of openpyxl iter_rows.
+        :return: the hash as hexadecimal string.
+        """
+        return hashlib.sha1(repr(values).encode()).hexdigest()
+
+    def start_validation(self, dict_data_frames: {str, pd.DataFrame}) -> Tuple[dict, dict]:
+        """
+        Compare the data frames with the stored row hashes and store the new row hashes.
+
+        The stored results of the sheets with changed rows are removed from the state. The rules that are run again add
+        their new results, so the results of a rule that is not run again are not reused for changed rows later on.
+
+        :param dict_data_frames: {sheet_name: pd.DataFrame}
+        :return: ({sheet_name: pd.Index with the changed rows}, {rule_key: {sheet_name: [indexes]}} with the stored
+        results that can be reused in this validation run). Sheets which are not in the state are not in the second
+        dictionary, so these are validated completely.
+        """
+        dict_changed_indexes = {}
+        dict_reusable_rule_results = {}
+
+        for sheet_name in dict_data_frames.keys():
+            new_row_hashes = self.hash_rows(dict_data_frames[sheet_name])
+            old_row_hashes = self.dict_row_hashes.get(sheet_name)
+
+            if old_row_hashes is None:
+                changed_indexes = new_row_hashes.index
+            else:
+                unchanged = new_row_hashes.eq(old_row_hashes.reindex(new_row_hashes.index))
+                changed_indexes = new_row_hashes.index[~unchanged.to_numpy()]
+
+                for rule_key, dict_sheet_name_indexes in self.dict_rule_results.items():
+                    if sheet_name in dict_sheet_name_indexes:
+                        dict_reusable_rule_results.setdefault(rule_key, {})[sheet_name] = \
+                            dict_sheet_name_indexes[sheet_name]
+
+            if len(changed_indexes) > 0:
+                for dict_sheet_name_indexes in self.dict_rule_results.values():
+                    dict_sheet_name_indexes.pop(sheet_name, None)
+
+            dict_changed_indexes[sheet_name] = changed_indexes
+            self.dict_row_hashes[sheet_name] = new_row_hashes
+
+        return dict_changed_indexes, dict_reusable_rule_results
+
+    def set_rule_result(self, rule_key: str, sheet_name: str, indexes: list) -> None:
+        self.dict_rule_results.setdefault(rule_key, {})[sheet_name] = list(indexes)
+
+    def get_constants_result(self, constants_key: str, sheet_name: str, constants_hash: str) -> list | None:
+        """
+        Get the stored result of the constants check of a sheet, when the constants block is not changed.
+
+        :return: the stored indexes, or None when the constants are changed or not validated before.
+        """
+        result = self.dict_constants_results.get(constants_key, {}).get(sheet_name)
+        if result is None or result["hash"] != constants_hash:
+            return None
+        return result["indexes"]
+
+    def set_constants_result(self, constants_key: str, sheet_name: str, constants_hash: str, indexes: list) -> None:
+        self.dict_constants_results.setdefault(constants_key, {})[sheet_name] = {"hash": constants_hash,
+                                                                                  "indexes": list(indexes)}
+
+    def save(self, path: str) -> None:
+        """
+        Save the state as JSON file.
+
+        :param path: the path of the JSON file.
+        """
+        dict_state = {
+            "row_hashes": {sheet_name: {"indexes": row_hashes.index.tolist(),
+                                        "hashes": [str(row_hash) for row_hash in row_hashes.tolist()]}
+                           for sheet_name, row_hashes in self.dict_row_hashes.items()},
+            "rule_results": self.dict_rule_results,
+            "constants_results": self.dict_constants_results,
+        }
+        with open(path, "w") as file:
+            json.dump(dict_state, file, default=int)
+
+    @classmethod
+    def load(cls, path: str) -> "ValidationState":
+        """
+        Load the state from a JSON file. When the file does not exist an empty state is returned, so the first run
+        validates everything.
+
+        :param path: the path of the JSON file.
+        :return: ValidationState
+        """
+        validation_state = cls()
+        if not os.path.exists(path):
+            return validation_state
+
+        with open(path) as file:
+            dict_state = json.load(file)
+
+        for sheet_name, row_hashes in dict_state["row_hashes"].items():
+            validation_state.dict_row_hashes[sheet_name] = pd.Series(
+                [int(row_hash) for row_hash in row_hashes["hashes"]], index=row_hashes["indexes"], dtype="uint64")
+        validation_state.dict_rule_results = dict_state["rule_results"]
+        validation_state.dict_constants_results = dict_state["constants_results"]
+
+        return validation_state
@@ -0,0 +1,238 @@
+"""
+Watch a folder and process every new or changed workbook automatically, only the changed sheets are calculated again.
+
+Example:
+    python watch_folder.py //lab-share/gc_results --output-directory //lab-share/gc_results/calculated
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+from batch_run import BatchCheckpoint, get_file_signature, process_workbook_in_worker
+from progress_events import emit_progress
+from workbook_pipeline import WorkbookLayout
+
+
+def warm_up_worker() -> None:
+    """Import the heavy modules (pandas, openpyxl) when a worker starts, so the first workbook does not wait for it."""
+    import workbook_pipeline  # noqa: F401
+
+
+class FolderWatcher:
+    """
+    Polls a folder for new or changed workbooks (.xlsx) and processes them in a pool of warm worker processes.
+
+    A workbook is processed when its modification time and size did not change for debounce_seconds, so a workbook
+    which is still being saved or copied is not read half-written. The lock files of Excel (~$...) are ignored. The
+    results and the hashes of the sheets are saved in the state file, so after a restart only the workbooks which
+    changed in the meantime are processed, and of a changed workbook only the changed sheets are calculated again.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 output_directory: str,
+                 state_path: str = None,
+                 debounce_seconds: float = 2.0,
+                 poll_interval: float = 1.0,
+                 number_of_workers: int = 2,
+                 layout: WorkbookLayout = None,
+                 show_process: bool = False):
+        """
+        :param directory: the folder with the workbooks.
+        :param output_directory: the folder of the calculated workbooks, this must not be the watched folder.
+        :param state_path: the JSON file with the state, by default watch_state.json in the output directory.
+        :param debounce_seconds: the seconds a workbook must be unchanged before it is processed.
+        :param poll_interval: the seconds between two scans of the folder.
+        :param number_of_workers: the number of worker processes. With 0 the workbooks are processed in this process.
+        :param layout: the layout of the workbooks, the layout of the template when None.
+        :param show_process: print every processed workbook. The sinks of progress_events get a write event for every
+        processed workbook also without show_process.
+        """
+        if os.path.abspath(directory) == os.path.abspath(output_directory):
+            raise ValueError("The output directory can not be the watched directory.")
+
+        self.directory = directory
+        self.output_directory = output_directory
+        self.debounce_seconds = debounce_seconds
+        self.poll_interval = poll_interval
+        self.number_of_workers = number_of_workers
+        self.layout = layout if layout is not None else WorkbookLayout()
+        self.show_process = show_process
+
+        os.makedirs(output_directory, exist_ok=True)
+        self.state = BatchCheckpoint(state_path if state_path is not None
+                                     else os.path.join(output_directory, "watch_state.json"))
+
+        # {path: (signature, time when this signature was seen first)}
+        self.dict_pending: Dict[str, tuple] = {}
+        # {path: future of the worker}
+        self.dict_in_flight: Dict[str, Future] = {}
+        self.executor: Optional[ProcessPoolExecutor] = None
+        # {path: the executor of the future}, to replace a broken pool only once
+        self._dict_in_flight_executors: Dict[str, ProcessPoolExecutor] = {}
+        self._stopped = False
+
+    def start(self) -> "FolderWatcher":
+        """Start the worker processes, they stay alive until stop()."""
+        if self.number_of_workers > 0 and self.executor is None:
+            self.executor = self._create_executor()
+        return self
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        executor = ProcessPoolExecutor(max_workers=self.number_of_workers,
+                                       mp_context=multiprocessing.get_context("spawn"), initializer=warm_up_worker)
+        # start all the workers now instead of at the first workbook
+        for future in [executor.submit(warm_up_worker) for _ in range(self.number_of_workers)]:
+            future.result()
+        return executor
+
+    def _replace_broken_executor(self, executor: ProcessPoolExecutor) -> None:
+        """A worker died (for example out of memory): the pool is broken, the next workbooks go to a new pool."""
+        if self.executor is executor:
+            executor.shutdown(wait=False)
+            self.executor = self._create_executor()
+
+    def stop(self) -> None:
+        self._stopped = True
+        if self.executor is not None:
+            self.collect_results(wait=True)
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self) -> "FolderWatcher":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+    def scan(self) -> Dict[str, list]:
+        """:return: {path: signature} of the workbooks in the folder, without the lock files of Excel."""
+        dict_signatures = {}
+        for file_name in os.listdir(self.directory):
+            if not file_name.lower().endswith(".xlsx") or file_name.startswith("~$"):
+                continue
+            path = os.path.abspath(os.path.join(self.directory, file_name))
+            try:
+                dict_signatures[path] = get_file_signature(path)
+            except FileNotFoundError:
+                # removed between listdir and stat
+                continue
+        return dict_signatures
+
+    def find_ready_workbooks(self, now: float = None) -> List[str]:
+        """
+        Scan the folder and return the new or changed workbooks which did not change for debounce_seconds.
+
+        :param now: the current time (time.monotonic()), for the tests.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        dict_signatures = self.scan()
+        for path in list(self.dict_pending.keys()):
+            if path not in dict_signatures:
+                del self.dict_pending[path]
+
+        paths_ready = []
+        for path, signature in dict_signatures.items():
+            if path in self.dict_in_flight or self.state.is_done(path):
+                self.dict_pending.pop(path, None)
+                continue
+            pending = self.dict_pending.get(path)
+            if pending is None or pending[0] != signature:
+                self.dict_pending[path] = (signature, now)
+            elif now - pending[1] >= self.debounce_seconds:
+                paths_ready.append(path)
+        return sorted(paths_ready)
+
+    def submit(self, path: str) -> None:
+        """Process a workbook, with the sheet hashes of the previous run so only the changed sheets are calculated."""
+        self.dict_pending.pop(path, None)
+        previous_result = self.state.dict_results.get(path, {})
+        arguments = (path, self.output_directory, self.layout, previous_result.get("sheet_hashes"))
+        if self.executor is None:
+            self._add_result(path, process_workbook_in_worker(*arguments))
+        else:
+            try:
+                future = self.executor.submit(process_workbook_in_worker, *arguments)
+            except BrokenProcessPool:
+                self._replace_broken_executor(self.executor)
+                future = self.executor.submit(process_workbook_in_worker, *arguments)
+            self.dict_in_flight[path] = future
+            self._dict_in_flight_executors[path] = self.executor
+
+    def collect_results(self, wait: bool = False) -> List[dict]:
+        """Save the results of the finished workbooks in the state."""
+        results = []
+        for path, future in list(self.dict_in_flight.items()):
+            if wait or future.done():
+                del self.dict_in_flight[path]
+                executor = self._dict_in_flight_executors.pop(path, None)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    self._replace_broken_executor(executor)
+                    result = {"path": path, "status": "failed", "error": "the worker process died",
+                              "signature": get_file_signature(path) if os.path.exists(path) else None}
+                except Exception as error:
+                    result = {"path": path, "status": "failed", "error": repr(error),
+                              "signature": get_file_signature(path) if os.path.exists(path) else None}
+                results.append(self._add_result(path, result))
+        return results
+
+    def _add_result(self, path: str, result: dict) -> dict:
+        self.state.add_result(path, result)
+        emit_progress(kind="write", step="watch_folder", duration=result.get("seconds"),
+                      message=f"{result['status']}: {path}, calculated sheets: {result.get('calculated_sheets')}",
+                      show_process=self.show_process, file_path=path, status=result["status"])
+        return result
+
+    def poll_once(self, now: float = None) -> List[str]:
+        """
+        Collect the finished workbooks and submit the ready workbooks.
+
+        :return: the submitted workbooks.
+        """
+        self.collect_results()
+        paths_ready = self.find_ready_workbooks(now=now)
+        for path in paths_ready:
+            self.submit(path)
+        return paths_ready
+
+    def run_forever(self) -> None:
+        """Poll the folder until stop() is called or the process is interrupted (Ctrl+C)."""
+        self.start()
+        self._stopped = False
+        try:
+            while not self._stopped:
+                self.poll_once()
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+def main(arguments: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Process the new and changed workbooks in a folder automatically.")
+    parser.add_argument("directory", help="the folder with the workbooks")
+    parser.add_argument("--output-directory", required=True, help="the folder of the calculated workbooks")
+    parser.add_argument("--state", default=None, help="the state file, by default in the output directory")
+    parser.add_argument("--debounce", type=float, default=2.0,
+                        help="the seconds a workbook must be unchanged before it is processed")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=2, help="the number of warm worker processes")
+    parsed_arguments = parser.parse_args(arguments)
+
+    FolderWatcher(directory=parsed_arguments.directory, output_directory=parsed_arguments.output_directory,
+                  state_path=parsed_arguments.state, debounce_seconds=parsed_arguments.debounce,
+                  poll_interval=parsed_arguments.poll_interval, number_of_workers=parsed_arguments.workers,
+                  show_process=True).run_forever()
+
+
+if __name__ == '__main__':
+    main()
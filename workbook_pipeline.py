@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+from calculation_cache import CalculationCache, get_calculation_key
+from excel_manager import ExcelManager
+from lazy_imports import lazy_import
+from progress_events import emit_progress
+from run_data_frame_calculations import RunDataFrameCalculationsForOneDataFrame, RunDataFrameCalculationsInChunks
+from validation_input_data.validate_input_data import validate_if_all_cells_are_correctly_filled
+from validation_input_data.validation_state import ValidationState
+
+pd = lazy_import("pandas")
+openpyxl = lazy_import("openpyxl")
+
+
+@dataclass
+class WorkbookLayout:
+    """
+    The layout of the workbooks of Gas_production_template.xlsx: the constants in column C (names) and D (values) in
+    the rows 1 until 7, the header in row 11, the units in row 12 and the measurements from row 13 in the columns A
+    until O. The first sheet is the Notes sheet, the other sheets are the samples.
+    """
+    column_names: List[str] = field(default_factory=lambda: [
+        'Sample ID', 'Parallel', 'Date', 'Time', 'P atm [hPa]', 'P sample before gc [hPa]', 'P sample after gc [hPa]',
+        'CH4 [%]', 'CO2 [%]', 'O2 [%]', 'N2 [%]', 'Flush (1=yes; 0=no)', 'Comments', 'GC method', 'Weight [g]'])
+    numeric_column_names: List[str] = field(default_factory=lambda: [
+        'P atm [hPa]', 'P sample before gc [hPa]', 'CH4 [%]', 'CO2 [%]', 'O2 [%]', 'N2 [%]'])
+    header_row: int = 11
+    start_row_values_table_in_excel: int = 13
+    end_column: int = 15
+    start_row_constants: int = 1
+    end_row_constants: int = 7
+    start_column_constants: int = 3
+    column_letter_constants_values: str = "D"
+    number_of_sheets_before_samples: int = 1
+    format_date: str = "%Y-%m-%d"
+    # the gas composition of the first measurement, the air at the start of the experiment
+    first_row_gas_composition: Dict[str, float] = field(default_factory=lambda: {"ch4": 0, "co2": 0.03, "o2": 21.90,
+                                                                                  "n2": 78.07})
+
+    def get_sample_sheet_names(self, sheet_names: List[str]) -> List[str]:
+        return list(sheet_names)[self.number_of_sheets_before_samples:]
+
+
+def load_workbook_tables(manager: ExcelManager, sheet_names: List[str],
+                         layout: WorkbookLayout) -> (Dict[str, pd.DataFrame], Dict[str, dict]):
+    """
+    Load the measurements and the constants of the sample sheets of a loaded workbook.
+
+    :return: ({sheet_name: data frame with the measurements}, {sheet_name: {constant name: value}})
+    """
+    dict_data_frames = {}
+    dict_constants = {}
+    for sheet_name in sheet_names:
+        dict_data_frames[sheet_name] = manager.load_sheet_table_with_input_header(
+            sheet_name=sheet_name, column_names=layout.column_names,
+            start_row=layout.start_row_values_table_in_excel - 1, end_column=layout.end_column)
+        constants_data_frame = manager.load_constants_as_data_frame(
+            sheet_name=sheet_name, start_row=layout.start_row_constants, end_row=layout.end_row_constants,
+            start_col=layout.start_column_constants, data_only=True)
+        dict_constants[sheet_name] = constants_data_frame.iloc[0].to_dict()
+    return dict_data_frames, dict_constants
+
+
+def validate_workbook_tables(dict_data_frames: Dict[str, pd.DataFrame], workbook,
+                             layout: WorkbookLayout) -> validate_if_all_cells_are_correctly_filled:
+    """Run the validation rules on the measurements and the constants of the sample sheets."""
+    validation = validate_if_all_cells_are_correctly_filled(dict_data_frames=dict_data_frames)
+    validation.run_validation_cheap_rules_first(
+        list_column_names_to_be_checked=layout.numeric_column_names,
+        workbook=workbook, start_row_constants_value=layout.start_row_constants,
+        end_row_constants_value=layout.end_row_constants,
+        column_letter_values=layout.column_letter_constants_values)
+    validation.fill_dict_indexes_as_pandas_incorrect_date(column_name_date="Date", format_date=layout.format_date)
+    validation.fill_dict_indexes_as_pandas_incorrect_time(column_name_time="Time")
+    return validation
+
+
+def calculate_sheet(data_frame: pd.DataFrame, constants: dict, layout: WorkbookLayout,
+                    sheet_name: str = None) -> pd.DataFrame:
+    """
+    Run all the calculations for the data frame of one sheet, like the notebook running_sheet_with_given_layout.
+
+    :param constants: {constant name: value} of the sheet, with Rgas, expTemp, volume_headspace, MM_C, water_volume
+    and dry_mass_sample.
+    :return: the data frame with the calculated columns.
+    """
+    run = RunDataFrameCalculationsForOneDataFrame(data_frame=data_frame, sheet_name=sheet_name)
+    run.run_data_frame_processor_calculations()
+    run.run_gas_composition_calculations(set_values_gas_composition_first_row=True,
+                                         **layout.first_row_gas_composition)
+    run.run_mol_gases_before_and_after_sampling(Rgas=constants["Rgas"], exp_temperature=constants["expTemp"],
+                                                volume_headspace=constants["volume_headspace"])
+    # correcting the mg_as for the first measurement
+    data_frame.loc[0, "mg_as"] = data_frame.loc[0, "mg_bs"]
+    # the exported workbook has the columns of the moles
+    run.run_mol_gas_composition_calculation(write_columns=True)
+    run.run_moles_produced()
+    run.run_cumulative_production_in_the_gas_phase(molar_mass_carbon=constants["MM_C"],
+                                                   dry_mass_sample=constants["dry_mass_sample"])
+    run.run_carbon_in_aqueous_phase(water_volume_in_liters=constants["water_volume"],
+                                    dry_mass_sample=constants["dry_mass_sample"])
+    run.run_results_Interpretations()
+    return data_frame
+
+
+def calculate_sheet_in_chunks(path: str, sheet_name: str, write_chunk: Callable[[pd.DataFrame], None],
+                              layout: WorkbookLayout = None, chunk_size: int = 10000) -> dict:
+    """
+    Run all the calculations for a very long sheet in blocks of rows, with the same results as calculate_sheet. A
+    block is read, calculated and given to write_chunk before the next block is read, so the memory does not grow with
+    the length of the sheet.
+
+    :param path: the path of the workbook.
+    :param sheet_name: the name of the sheet.
+    :param write_chunk: called with every calculated block, for example ExcelChunkWriter.write_chunk. The index of a
+    block is the row number in the sheet, starting at 0.
+    :param layout: the layout of the workbook, the layout of the template when None.
+    :param chunk_size: the number of rows of a block.
+    :return: {"rows": number of rows, "chunks": number of blocks}
+    """
+    if layout is None:
+        layout = WorkbookLayout()
+    manager = ExcelManager(path)
+    manager.load_workbook_read_only()
+    try:
+        constants = manager.load_constants_as_data_frame(
+            sheet_name=sheet_name, start_row=layout.start_row_constants, end_row=layout.end_row_constants,
+            start_col=layout.start_column_constants, data_only=True).iloc[0].to_dict()
+        run = RunDataFrameCalculationsInChunks(
+            Rgas=constants["Rgas"], exp_temperature=constants["expTemp"],
+            volume_headspace=constants["volume_headspace"], molar_mass_carbon=constants["MM_C"],
+            dry_mass_sample=constants["dry_mass_sample"], water_volume_in_liters=constants["water_volume"],
+            first_row_gas_composition=layout.first_row_gas_composition, sheet_name=sheet_name)
+
+        number_of_chunks = 0
+        for data_frame in manager.iter_sheet_table_chunks(
+                sheet_name=sheet_name, column_names=layout.column_names, chunk_size=chunk_size,
+                start_row=layout.start_row_values_table_in_excel - 1, end_column=layout.end_column):
+            write_chunk(run.calculate_chunk(data_frame))
+            number_of_chunks += 1
+    finally:
+        manager.close()
+    return {"rows": run.number_of_rows_done, "chunks": number_of_chunks}
+
+
+def calculate_sheet_with_cache(data_frame: pd.DataFrame, constants: dict, layout: WorkbookLayout,
+                               cache: CalculationCache, sheet_name: str = None) -> (pd.DataFrame, bool):
+    """
+    calculate_sheet, but an unchanged sheet which is calculated before is taken from the cache.
+
+    :return: (the data frame with the calculated columns, True when it is taken from the cache)
+    """
+    key = get_calculation_key(data_frame=data_frame, constants=constants,
+                              first_row_gas_composition=layout.first_row_gas_composition,
+                              column_names=layout.column_names)
+    calculated_data_frame = cache.get(key)
+    if calculated_data_frame is not None:
+        return calculated_data_frame, True
+    calculated_data_frame = calculate_sheet(data_frame=data_frame, constants=constants, layout=layout,
+                                            sheet_name=sheet_name)
+    cache.put(key, calculated_data_frame)
+    return calculated_data_frame, False
+
+
+def get_sheet_hash(data_frame: pd.DataFrame, constants: dict) -> str:
+    """The hash of the measurements and the constants of a sheet, to find the changed sheets of a workbook."""
+    row_hashes = ValidationState.hash_rows(data_frame).to_numpy()
+    return hashlib.sha1(row_hashes.tobytes() + ValidationState.hash_values(sorted(constants.items())).encode()
+                        ).hexdigest()
+
+
+def load_exported_tables(output_path: str, sheet_names: List[str], layout: WorkbookLayout) -> Dict[str, list]:
+    """
+    Load the calculated tables of an exported workbook, to export them again without calculating them again.
+
+    :return: {sheet_name: [tuple with the values of every row]}
+    """
+    workbook = openpyxl.load_workbook(filename=output_path, read_only=True)
+    try:
+        return {sheet_name: list(workbook[sheet_name].iter_rows(min_row=layout.start_row_values_table_in_excel,
+                                                                values_only=True))
+                for sheet_name in sheet_names}
+    finally:
+        workbook.close()
+
+
+def export_workbook(source_path: str, output_path: str, dict_data_frames: Dict[str, pd.DataFrame],
+                    layout: WorkbookLayout, dict_exported_tables: Dict[str, list] = None) -> None:
+    """
+    Write the calculated tables in a copy of the workbook. The workbook is loaded and saved once for all the sheets,
+    unlike ExcelManager.replace_table_in_specific_sheet_with_data_frame which does that for every sheet.
+
+    :param dict_exported_tables: {sheet_name: rows} of load_exported_tables, for the sheets which are not calculated
+    again.
+    """
+    start = time.perf_counter()
+    dict_tables = {sheet_name: data_frame.itertuples(index=False, name=None)
+                   for sheet_name, data_frame in dict_data_frames.items()}
+    if dict_exported_tables is not None:
+        dict_tables.update(dict_exported_tables)
+
+    workbook = openpyxl.load_workbook(filename=source_path)
+    for sheet_name, rows in dict_tables.items():
+        sheet = workbook[sheet_name]
+        for row in sheet.iter_rows(min_row=layout.start_row_values_table_in_excel):
+            for cell in row:
+                cell.value = None
+        for row_index, row in enumerate(rows):
+            for column_index, value in enumerate(row):
+                if value is not None and pd.isna(value):
+                    value = None
+                sheet.cell(row=row_index + layout.start_row_values_table_in_excel, column=column_index + 1,
+                           value=value)
+    workbook.save(output_path)
+    emit_progress(kind="write", step="export_workbook",
+                  rows=sum(len(data_frame) for data_frame in dict_data_frames.values()),
+                  duration=time.perf_counter() - start, file_path=output_path)
+
+
+def get_output_path(path: str, output_directory: str) -> str:
+    file_name, extension = os.path.splitext(os.path.basename(path))
+    return os.path.join(output_directory, f"{file_name}_calculated{extension}")
+
+
+@dataclass
+class LoadedWorkbook:
+    """
+    A workbook between the steps of process_workbook: read_workbook -> calculate_workbook -> write_workbook. It has no
+    openpyxl objects, so it can be sent to a worker process.
+    """
+    path: str
+    output_path: str
+    # the measurements of the sheets to calculate
+    dict_data_frames: Dict[str, pd.DataFrame]
+    dict_constants: Dict[str, dict]
+    # {sheet_name: {"rows", "invalid_cells", "error", "cached"}} of the sheets to calculate
+    dict_sheets: Dict[str, dict]
+    dict_sheet_hashes: Dict[str, str]
+    # {sheet_name: rows} of the sheets which are copied from the previous export
+    dict_exported_tables: Dict[str, list] = None
+    dict_calculated_data_frames: Dict[str, pd.DataFrame] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def get_result(self) -> dict:
+        failed = any(sheet["error"] is not None for sheet in self.dict_sheets.values())
+        return {"path": self.path, "output_path": self.output_path, "status": "partial" if failed else "done",
+                "sheets": self.dict_sheets, "calculated_sheets": list(self.dict_sheets.keys()),
+                "sheet_hashes": self.dict_sheet_hashes, "timings": self.timings}
+
+
+def read_workbook(path: str, output_directory: str, layout: WorkbookLayout,
+                  dict_previous_sheet_hashes: Dict[str, str] = None) -> LoadedWorkbook:
+    """
+    Load and validate the sample sheets of a workbook, the first step of process_workbook.
+
+    :param dict_previous_sheet_hashes: see process_workbook.
+    """
+    output_path = get_output_path(path=path, output_directory=output_directory)
+    dict_timings = {}
+
+    start = time.perf_counter()
+    manager = ExcelManager(path)
+    manager.load_workbook()
+    sheet_names = layout.get_sample_sheet_names(manager.get_sheet_names())
+    dict_data_frames, dict_constants = load_workbook_tables(manager=manager, sheet_names=sheet_names, layout=layout)
+    dict_sheet_hashes = {sheet_name: get_sheet_hash(dict_data_frames[sheet_name], dict_constants[sheet_name])
+                         for sheet_name in sheet_names}
+
+    dict_exported_tables = None
+    sheet_names_to_calculate = sheet_names
+    if dict_previous_sheet_hashes is not None and os.path.exists(output_path) \
+            and set(dict_previous_sheet_hashes.keys()) == set(sheet_names):
+        sheet_names_to_calculate = [sheet_name for sheet_name in sheet_names
+                                    if dict_previous_sheet_hashes[sheet_name] != dict_sheet_hashes[sheet_name]]
+        dict_exported_tables = load_exported_tables(
+            output_path=output_path, layout=layout,
+            sheet_names=[sheet_name for sheet_name in sheet_names if sheet_name not in sheet_names_to_calculate])
+    dict_timings["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    validation = validate_workbook_tables(
+        dict_data_frames={sheet_name: dict_data_frames[sheet_name] for sheet_name in sheet_names_to_calculate},
+        workbook=manager.workbook_formula, layout=layout)
+    dict_timings["validate"] = time.perf_counter() - start
+    # the workbooks are not needed anymore, free the memory before the calculations
+    manager.workbook_values = None
+    manager.workbook_formula = None
+
+    dict_sheets = {sheet_name: {"rows": len(dict_data_frames[sheet_name]),
+                                "invalid_cells": validation.dict_number_of_errors.get(sheet_name, 0),
+                                "error": None, "cached": False}
+                   for sheet_name in sheet_names_to_calculate}
+    return LoadedWorkbook(path=path, output_path=output_path,
+                          dict_data_frames={sheet_name: dict_data_frames[sheet_name]
+                                            for sheet_name in sheet_names_to_calculate},
+                          dict_constants=dict_constants, dict_sheets=dict_sheets, dict_sheet_hashes=dict_sheet_hashes,
+                          dict_exported_tables=dict_exported_tables, timings=dict_timings)
+
+
+def calculate_workbook(loaded_workbook: LoadedWorkbook, layout: WorkbookLayout,
+                       cache: CalculationCache = None) -> LoadedWorkbook:
+    """
+    Calculate the sheets of a loaded workbook, the second step of process_workbook. A sheet of which the calculations
+    fail gets the error in dict_sheets and is not exported.
+
+    :return: the loaded workbook with the calculated data frames.
+    """
+    start = time.perf_counter()
+    for sheet_name, data_frame in loaded_workbook.dict_data_frames.items():
+        constants = loaded_workbook.dict_constants[sheet_name]
+        try:
+            if cache is None:
+                loaded_workbook.dict_calculated_data_frames[sheet_name] = calculate_sheet(
+                    data_frame=data_frame, constants=constants, layout=layout, sheet_name=sheet_name)
+            else:
+                loaded_workbook.dict_calculated_data_frames[sheet_name], \
+                    loaded_workbook.dict_sheets[sheet_name]["cached"] = calculate_sheet_with_cache(
+                        data_frame=data_frame, constants=constants, layout=layout, cache=cache, sheet_name=sheet_name)
+        except Exception:
+            loaded_workbook.dict_sheets[sheet_name]["error"] = traceback.format_exc(limit=3)
+            # a failed sheet is calculated again in the next run
+            loaded_workbook.dict_sheet_hashes[sheet_name] = None
+    # the data frames are calculated in place, do not keep (or send back from a worker) them twice
+    loaded_workbook.dict_data_frames = {}
+    loaded_workbook.timings["calculate"] = time.perf_counter() - start
+    return loaded_workbook
+
+
+def write_workbook(loaded_workbook: LoadedWorkbook, layout: WorkbookLayout) -> dict:
+    """
+    Export a calculated workbook, the last step of process_workbook.
+
+    :return: the result of process_workbook.
+    """
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(loaded_workbook.output_path) or ".", exist_ok=True)
+    export_workbook(source_path=loaded_workbook.path, output_path=loaded_workbook.output_path,
+                    dict_data_frames=loaded_workbook.dict_calculated_data_frames, layout=layout,
+                    dict_exported_tables=loaded_workbook.dict_exported_tables)
+    loaded_workbook.timings["export"] = time.perf_counter() - start
+    return loaded_workbook.get_result()
+
+
+def process_workbook(path: str, output_directory: str, layout: WorkbookLayout = None,
+                     dict_previous_sheet_hashes: Dict[str, str] = None, cache: CalculationCache = None) -> dict:
+    """
+    Load, validate, calculate and export one workbook. A sheet of which the calculations fail is reported and is not
+    exported, the other sheets are exported.
+
+    :param path: the path of the workbook.
+    :param output_directory: the directory of the calculated workbook.
+    :param layout: the layout of the workbook, the layout of the template when None.
+    :param dict_previous_sheet_hashes: the "sheet_hashes" of the result of the previous run. When given (and the
+    previous export still exists with the same sheets) only the changed sheets are validated and calculated, the
+    other sheets are copied from the previous export.
+    :param cache: the cache of the calculated sheets, the sheets which are calculated before (also in other workbooks)
+    are taken from it.
+    :return: {"path", "output_path", "status", "sheets": {sheet_name: {"rows", "invalid_cells", "error", "cached"}},
+    "calculated_sheets": [sheet_name], "sheet_hashes": {sheet_name: hash}, "timings": {step: seconds}}
+    """
+    if layout is None:
+        layout = WorkbookLayout()
+    loaded_workbook = read_workbook(path=path, output_directory=output_directory, layout=layout,
+                                    dict_previous_sheet_hashes=dict_previous_sheet_hashes)
+    loaded_workbook = calculate_workbook(loaded_workbook=loaded_workbook, layout=layout, cache=cache)
+    return write_workbook(loaded_workbook=loaded_workbook, layout=layout)